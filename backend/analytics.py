@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+import backend.local_db as bq
+from backend import cache
+
+# Los rangos se redondean a buckets (from hacia abajo, to hacia arriba): dos
+# pedidos dentro del mismo bucket comparten los datos cacheados.
+BUCKET_S = int(os.getenv("ANALYTICS_BUCKET_S", "3600"))
+# Rango por defecto si no viene from_time
+DEFAULT_DAYS = 30
+
+ACTIVE_TYPES = ["INICIO", "REANUDADO"]
+NO_REASON = "Sin motivo"
+
+TASK_COLS = [
+    "task_id",
+    "cuadrilla",
+    "contratista",
+    "ot",
+    "events",
+    "finished",
+    "arrival_to_start_s",
+    "active_s",
+    "paused_s",
+]
+PAUSE_COLS = ["task_id", "pause_reason", "paused_s"]
+
+# (from, to) -> eventos del rango ya parseados (columnar). Los eventos solo se
+# agregan: al avanzar el store se leen únicamente los nuevos (rowid > último).
+# Un cambio de uploads (baja/borrado) cambia la generación y se relee todo.
+frames = cache.TTLCache(
+    maxsize=int(os.getenv("ANALYTICS_FRAMES", "8")),
+    ttl=float(os.getenv("ANALYTICS_CACHE_TTL", "3600")),
+)
+# (from, to, cursor del store) -> tablas por tarea ya calculadas
+results = cache.TTLCache(
+    maxsize=int(os.getenv("ANALYTICS_CACHE_SIZE", "64")),
+    ttl=float(os.getenv("ANALYTICS_CACHE_TTL", "3600")),
+)
+_lock = threading.Lock()
+
+
+def bucket_range(from_time: datetime | None, to_time: datetime | None) -> Tuple[datetime, datetime]:
+    to = to_time or datetime.now(timezone.utc)
+    frm = from_time or (to - timedelta(days=DEFAULT_DAYS))
+    lo = frm.timestamp() // BUCKET_S * BUCKET_S
+    hi = -(-to.timestamp() // BUCKET_S) * BUCKET_S
+    return datetime.fromtimestamp(lo, timezone.utc), datetime.fromtimestamp(hi, timezone.utc)
+
+
+def _event_frame(cols, rows) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(rows, columns=list(cols))
+    # la hora se parsea una sola vez, al entrar al cache
+    t = pd.to_datetime(df["event_time"], utc=True, errors="coerce", format="ISO8601")
+    df = df.loc[t.notna(), ["rowid", "task_id", "event_type", "pause_reason"]]
+    df["t"] = t[t.notna()].to_numpy(dtype="datetime64[ns]").astype("int64")  # ns UTC
+    return df.reset_index(drop=True)
+
+
+def _events(frm: datetime, to: datetime) -> pd.DataFrame:
+    key = (frm, to)
+    gen = bq.uploads_generation()
+    with _lock:
+        cached = frames.get(key)
+        if cached is None or cached["gen"] != gen:
+            df = _event_frame(*bq.analytics_events(frm.isoformat(), to.isoformat()))
+        else:
+            df = cached["df"]
+            cols, rows = bq.analytics_events(frm.isoformat(), to.isoformat(), after_rowid=cached["rowid"])
+            if rows:
+                df = pd.concat([df, _event_frame(cols, rows)], ignore_index=True)
+        rowid = int(df["rowid"].max()) if len(df) else 0
+        frames.set(key, {"gen": gen, "rowid": max(rowid, cached["rowid"] if cached else 0), "df": df})
+    return df
+
+
+def task_tables(ev: pd.DataFrame, tasks_meta: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Una pasada sobre todos los eventos (ordenados por tarea y hora):
+    cada evento abre un tramo que dura hasta el siguiente evento de su tarea.
+      - tramo que empieza en INICIO/REANUDADO = tiempo activo
+      - tramo que empieza en PAUSA = tiempo en pausa (por pause_reason)
+    El último evento de cada tarea deja su tramo abierto: no suma.
+    `tasks_meta` (task_id, cuadrilla, contratista, ot) son las tareas visibles.
+    """
+    ev = ev[ev["task_id"].isin(tasks_meta["task_id"])]
+    if ev.empty:
+        return {"tasks": pd.DataFrame(columns=TASK_COLS), "pauses": pd.DataFrame(columns=PAUSE_COLS)}
+
+    codes, task_ids = pd.factorize(ev["task_id"])
+    t = ev["t"].to_numpy()
+    order = np.lexsort((t, codes))
+    codes, t = codes[order], t[order]
+    et = ev["event_type"].to_numpy()[order]
+    n, k = len(codes), len(task_ids)
+
+    # duración del tramo = hora del siguiente evento de la misma tarea - hora propia
+    seg = np.full(n, np.nan)
+    same = codes[1:] == codes[:-1]
+    seg[:-1] = np.where(same, (t[1:] - t[:-1]) / 1e9, np.nan)
+    closed = ~np.isnan(seg)
+
+    is_active = np.isin(et, ACTIVE_TYPES) & closed
+    is_pause = (et == "PAUSA") & closed
+    active_s = np.bincount(codes, weights=np.where(is_active, seg, 0.0), minlength=k)
+    paused_s = np.bincount(codes, weights=np.where(is_pause, seg, 0.0), minlength=k)
+    finished = np.bincount(codes, weights=(et == "FIN"), minlength=k) > 0
+    events = np.bincount(codes, minlength=k)
+
+    # primera LLEGADA y primer INICIO de cada tarea
+    never = np.iinfo(np.int64).max
+    llegada = np.full(k, never)
+    inicio = np.full(k, never)
+    np.minimum.at(llegada, codes[et == "LLEGADA"], t[et == "LLEGADA"])
+    np.minimum.at(inicio, codes[et == "INICIO"], t[et == "INICIO"])
+    ok = (llegada != never) & (inicio != never) & (inicio >= llegada)
+    wait = np.where(ok, (inicio - np.where(ok, llegada, 0)) / 1e9, np.nan)
+
+    tasks = pd.DataFrame(
+        {
+            "task_id": task_ids,
+            "events": events,
+            "finished": finished,
+            "arrival_to_start_s": wait,
+            "active_s": active_s,
+            "paused_s": paused_s,
+        }
+    ).merge(tasks_meta, on="task_id", how="left")
+
+    reasons = pd.Series(ev["pause_reason"].to_numpy()[order][is_pause]).fillna(NO_REASON).replace("", NO_REASON)
+    pauses = (
+        pd.DataFrame({"task_id": task_ids[codes[is_pause]], "pause_reason": reasons, "paused_s": seg[is_pause]})
+        .groupby(["task_id", "pause_reason"], sort=False)["paused_s"]
+        .sum()
+        .reset_index()
+    )
+    return {"tasks": tasks[TASK_COLS], "pauses": pauses[PAUSE_COLS]}
+
+
+def _tables(frm: datetime, to: datetime) -> Dict[str, pd.DataFrame]:
+    key = (frm, to, bq.dashboard_cursor())
+    out = results.get(key)
+    if out is None:
+        cols, rows = bq.analytics_tasks()
+        out = task_tables(_events(frm, to), pd.DataFrame.from_records(rows, columns=list(cols)))
+        results.set(key, out)
+    return out
+
+
+def _summary(tasks: pd.DataFrame, by: str) -> pd.DataFrame:
+    return (
+        tasks.groupby(by, dropna=False)
+        .agg(
+            tasks=("task_id", "size"),
+            finished=("finished", "sum"),
+            active_s=("active_s", "sum"),
+            paused_s=("paused_s", "sum"),
+            arrival_to_start_avg_s=("arrival_to_start_s", "mean"),
+        )
+        .reset_index()
+        .sort_values("active_s", ascending=False)
+    )
+
+
+def _records(df: pd.DataFrame) -> list:
+    # to_json ya convierte NaN -> null y los tipos de numpy
+    return json.loads(df.to_json(orient="records", double_precision=1))
+
+
+def report(
+    from_time: datetime | None = None,
+    to_time: datetime | None = None,
+    cuadrilla: str | None = None,
+    contratista: str | None = None,
+    per_task: bool = False,
+) -> Dict[str, Any]:
+    """Tiempos por tarea y agregados por cuadrilla / contratista / motivo de pausa."""
+    frm, to = bucket_range(from_time, to_time)
+    tables = _tables(frm, to)
+    tasks, pauses = tables["tasks"], tables["pauses"]
+
+    if cuadrilla:
+        tasks = tasks[tasks["cuadrilla"].fillna("").str.strip() == cuadrilla.strip()]
+    if contratista:
+        tasks = tasks[tasks["contratista"] == contratista.strip()]
+    if cuadrilla or contratista:
+        pauses = pauses[pauses["task_id"].isin(tasks["task_id"])]
+
+    by_reason = (
+        pauses.groupby("pause_reason")["paused_s"]
+        .agg(["sum", "size"])
+        .reset_index()
+        .rename(columns={"sum": "paused_s", "size": "tasks"})
+        .sort_values("paused_s", ascending=False)
+    )
+    wait = tasks["arrival_to_start_s"].astype(float)
+
+    out = {
+        "from": frm.isoformat(),
+        "to": to.isoformat(),
+        "totals": {
+            "tasks": int(len(tasks)),
+            "finished": int(tasks["finished"].sum()),
+            "active_s": float(tasks["active_s"].sum()),
+            "paused_s": float(tasks["paused_s"].sum()),
+            "arrival_to_start_avg_s": None if wait.isna().all() else float(wait.mean()),
+        },
+        "by_cuadrilla": _records(_summary(tasks, "cuadrilla")),
+        "by_contratista": _records(_summary(tasks, "contratista")),
+        "pause_by_reason": _records(by_reason),
+    }
+    if per_task:
+        out["tasks"] = _records(tasks)
+    return out
@@ -1,14 +1,61 @@
+import atexit
+import json
+import logging
 import os
-import uuid
-from datetime import datetime, timezone
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from google.cloud import bigquery
 
+from backend import metrics, paging
+
 PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT")
 DATASET = os.getenv("BQ_DATASET", "ops_tracking")
 TASKS_TABLE = os.getenv("BQ_TASKS_TABLE", "tasks")
 EVENTS_TABLE = os.getenv("BQ_EVENTS_TABLE", "events")
 
-client = bigquery.Client(project=PROJECT)
+# Buffer de eventos: se manda un insert_rows_json cada N filas o cada T segundos
+EVENT_BATCH_ROWS = int(os.getenv("BQ_EVENT_BATCH_ROWS", "500"))
+EVENT_BATCH_DELAY_S = float(os.getenv("BQ_EVENT_BATCH_DELAY", "1.0"))
+# Envíos fallidos: se reintenta con backoff exponencial (con jitter) entre el mínimo y el
+# máximo; una fila que sigue sin entrar pasados BQ_EVENT_RETRY_WINDOW segundos va al dead letter
+EVENT_RETRY_WINDOW_S = float(os.getenv("BQ_EVENT_RETRY_WINDOW", "1800"))
+EVENT_BACKOFF_MIN_S = float(os.getenv("BQ_EVENT_BACKOFF_MIN", "1.0"))
+EVENT_BACKOFF_MAX_S = float(os.getenv("BQ_EVENT_BACKOFF_MAX", "60.0"))
+# Tope de filas pendientes: con BigQuery caído se rechazan eventos nuevos en vez de crecer sin límite
+EVENT_BUFFER_MAX_ROWS = int(os.getenv("BQ_EVENT_BUFFER_MAX_ROWS", "50000"))
+# Eventos descartados (JSON por línea); vacío = solo se loguean
+EVENT_DEAD_LETTER = os.getenv("BQ_EVENT_DEAD_LETTER", "local_data/bq_dead_letter.jsonl")
+
+# El tablero solo mira eventos de los últimos N días (poda particiones; 0 = sin límite)
+DASHBOARD_WINDOW_DAYS = int(os.getenv("BQ_DASHBOARD_WINDOW_DAYS", "30"))
+
+log = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+# el schema se verifica una vez por proceso (no en cada evento)
+_tables_verified = False
+_tables_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = bigquery.Client(project=PROJECT)
+    return _client
+
+
+def set_client(c) -> None:
+    """Reemplaza el cliente (p.ej. por un fake local en pruebas/benchmarks)."""
+    global _client, _tables_verified
+    _client = c
+    _tables_verified = False
 
 def now_utc_iso():
     return datetime.now(timezone.utc).isoformat()
@@ -16,7 +63,70 @@ def now_utc_iso():
 def _table(name: str) -> str:
     return f"{PROJECT}.{DATASET}.{name}"
 
-def ensure_tables_exist():
+def ensure_tables_exist(force: bool = False):
+    global _tables_verified
+    if _tables_verified and not force:
+        return
+    with _tables_lock:
+        if _tables_verified and not force:
+            return
+        _create_tables()
+        _tables_verified = True
+
+
+# -----------------------------
+# Schema: particionado / clustering
+# -----------------------------
+TASKS_SCHEMA = [
+    bigquery.SchemaField("task_id", "STRING"),
+    bigquery.SchemaField("unique_key", "STRING"),
+    bigquery.SchemaField("source_file", "STRING"),
+    bigquery.SchemaField("contratista", "STRING"),
+    bigquery.SchemaField("ot", "STRING"),
+    bigquery.SchemaField("ut", "STRING"),
+    bigquery.SchemaField("desc_ot", "STRING"),
+    bigquery.SchemaField("desc_op", "STRING"),
+    bigquery.SchemaField("cuadrilla", "STRING"),
+    bigquery.SchemaField("id_cuadrilla", "STRING"),
+    bigquery.SchemaField("status", "STRING"),
+    bigquery.SchemaField("created_at", "TIMESTAMP"),
+    bigquery.SchemaField("updated_at", "TIMESTAMP"),
+]
+
+EVENTS_SCHEMA = [
+    bigquery.SchemaField("event_id", "STRING"),
+    bigquery.SchemaField("task_id", "STRING"),
+    bigquery.SchemaField("unique_key", "STRING"),
+    bigquery.SchemaField("ot", "STRING"),
+    bigquery.SchemaField("cuadrilla", "STRING"),
+    bigquery.SchemaField("id_cuadrilla", "STRING"),
+    bigquery.SchemaField("event_type", "STRING"),
+    bigquery.SchemaField("event_time", "TIMESTAMP"),
+    bigquery.SchemaField("lat", "FLOAT"),
+    bigquery.SchemaField("lon", "FLOAT"),
+    bigquery.SchemaField("accuracy_m", "FLOAT"),
+    bigquery.SchemaField("pause_reason", "STRING"),
+    bigquery.SchemaField("comment", "STRING"),
+    bigquery.SchemaField("photo_url", "STRING"),
+    bigquery.SchemaField("created_at", "TIMESTAMP"),
+]
+
+TASKS_CLUSTERING = ["cuadrilla"]
+EVENTS_PARTITION_FIELD = "event_time"  # por día: DATE(event_time)
+EVENTS_CLUSTERING = ["unique_key", "cuadrilla"]
+
+
+def _new_table(table_id: str, schema, clustering, partition_field: str | None = None):
+    t = bigquery.Table(table_id, schema=schema)
+    if partition_field:
+        t.time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field=partition_field)
+    t.clustering_fields = clustering
+    return t
+
+
+def _create_tables():
+    client = get_client()
+
     # Crea dataset si no existe (sin romper si ya está)
     ds_id = f"{PROJECT}.{DATASET}"
     try:
@@ -24,157 +134,601 @@ def ensure_tables_exist():
     except Exception:
         client.create_dataset(bigquery.Dataset(ds_id), exists_ok=True)
 
-    # tasks
+    # tasks (clustering por cuadrilla: es el filtro de la app del operario)
     tasks_id = _table(TASKS_TABLE)
-    tasks_schema = [
-        bigquery.SchemaField("task_id", "STRING"),
-        bigquery.SchemaField("unique_key", "STRING"),
-        bigquery.SchemaField("source_file", "STRING"),
-        bigquery.SchemaField("contratista", "STRING"),
-        bigquery.SchemaField("ot", "STRING"),
-        bigquery.SchemaField("ut", "STRING"),
-        bigquery.SchemaField("desc_ot", "STRING"),
-        bigquery.SchemaField("desc_op", "STRING"),
-        bigquery.SchemaField("cuadrilla", "STRING"),
-        bigquery.SchemaField("id_cuadrilla", "STRING"),
-        bigquery.SchemaField("status", "STRING"),
-        bigquery.SchemaField("created_at", "TIMESTAMP"),
-        bigquery.SchemaField("updated_at", "TIMESTAMP"),
-    ]
     try:
         client.get_table(tasks_id)
     except Exception:
-        t = bigquery.Table(tasks_id, schema=tasks_schema)
-        client.create_table(t)
+        client.create_table(_new_table(tasks_id, TASKS_SCHEMA, TASKS_CLUSTERING))
 
-    # events
+    # events (partición diaria por event_time + clustering por unique_key/cuadrilla)
     events_id = _table(EVENTS_TABLE)
-    events_schema = [
-        bigquery.SchemaField("event_id", "STRING"),
-        bigquery.SchemaField("task_id", "STRING"),
-        bigquery.SchemaField("unique_key", "STRING"),
-        bigquery.SchemaField("ot", "STRING"),
-        bigquery.SchemaField("cuadrilla", "STRING"),
-        bigquery.SchemaField("id_cuadrilla", "STRING"),
-        bigquery.SchemaField("event_type", "STRING"),
-        bigquery.SchemaField("event_time", "TIMESTAMP"),
-        bigquery.SchemaField("lat", "FLOAT"),
-        bigquery.SchemaField("lon", "FLOAT"),
-        bigquery.SchemaField("accuracy_m", "FLOAT"),
-        bigquery.SchemaField("pause_reason", "STRING"),
-        bigquery.SchemaField("comment", "STRING"),
-        bigquery.SchemaField("photo_url", "STRING"),
-        bigquery.SchemaField("created_at", "TIMESTAMP"),
-    ]
     try:
         client.get_table(events_id)
     except Exception:
-        t = bigquery.Table(events_id, schema=events_schema)
-        client.create_table(t)
+        client.create_table(_new_table(events_id, EVENTS_SCHEMA, EVENTS_CLUSTERING, EVENTS_PARTITION_FIELD))
 
-def upsert_tasks(rows: list[dict]) -> int:
+
+def migrate_tables() -> list[str]:
     """
-    Dedup real en BigQuery:
-    - Cargamos a staging
-    - MERGE a tabla final por unique_key
+    Lleva tablas ya existentes al schema particionado/clusterizado.
+    - clustering: se cambia en el lugar (update_table; aplica a datos nuevos).
+    - partición: BigQuery no la cambia en el lugar, así que se copia a una tabla
+      nueva con CTAS y se intercambian los nombres. La tabla vieja queda como
+      respaldo ({tabla}_sin_particion_AAAAMMDDHHMMSS) para borrarla a mano.
+    Conviene correrlo sin escrituras en curso (los inserts en streaming
+    impiden renombrar la tabla hasta que se vacía el buffer).
+    Devuelve lo que hizo, para loguear.
     """
-    if not rows:
-        return 0
+    client = get_client()
+    ensure_tables_exist(force=True)
+    flush_events()
+    done: list[str] = []
 
-    ensure_tables_exist()
+    tasks = client.get_table(_table(TASKS_TABLE))
+    if list(tasks.clustering_fields or []) != TASKS_CLUSTERING:
+        tasks.clustering_fields = TASKS_CLUSTERING
+        client.update_table(tasks, ["clustering_fields"])
+        done.append(f"{TASKS_TABLE}: clustering {TASKS_CLUSTERING}")
 
-    staging_name = f"_stg_tasks_{uuid.uuid4().hex}"
-    staging_id = _table(staging_name)
-
-    # crear staging con el mismo schema que tasks
-    tasks_tbl = client.get_table(_table(TASKS_TABLE))
-    stg_tbl = bigquery.Table(staging_id, schema=tasks_tbl.schema)
-    stg_tbl.expires = datetime.now(timezone.utc).replace(microsecond=0)
-    client.create_table(stg_tbl)
-
-    # cargar JSON a staging
-    load_job = client.load_table_from_json(
-        rows,
-        staging_id,
-        job_config=bigquery.LoadJobConfig(
-            write_disposition="WRITE_TRUNCATE"
-        ),
+    events = client.get_table(_table(EVENTS_TABLE))
+    tp = events.time_partitioning
+    if tp is None or tp.field != EVENTS_PARTITION_FIELD:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        new_name = f"{EVENTS_TABLE}_particionada_{stamp}"
+        backup_name = f"{EVENTS_TABLE}_sin_particion_{stamp}"
+        script = f"""
+        CREATE TABLE `{_table(new_name)}`
+        PARTITION BY DATE({EVENTS_PARTITION_FIELD})
+        CLUSTER BY {", ".join(EVENTS_CLUSTERING)}
+        AS SELECT * FROM `{_table(EVENTS_TABLE)}`;
+        ALTER TABLE `{_table(EVENTS_TABLE)}` RENAME TO `{backup_name}`;
+        ALTER TABLE `{_table(new_name)}` RENAME TO `{EVENTS_TABLE}`;
+        """
+        client.query(script).result()
+        done.append(f"{EVENTS_TABLE}: particionada por DATE({EVENTS_PARTITION_FIELD}), respaldo en {backup_name}")
+    elif list(events.clustering_fields or []) != EVENTS_CLUSTERING:
+        events.clustering_fields = EVENTS_CLUSTERING
+        client.update_table(events, ["clustering_fields"])
+        done.append(f"{EVENTS_TABLE}: clustering {EVENTS_CLUSTERING}")
+
+    return done
+
+
+# Columnas de tasks que viajan en el MERGE (como STRUCT<... STRING> en un parámetro)
+TASK_MERGE_COLS = [
+    "task_id",
+    "unique_key",
+    "source_file",
+    "contratista",
+    "ot",
+    "ut",
+    "desc_ot",
+    "desc_op",
+    "cuadrilla",
+    "id_cuadrilla",
+    "status",
+    "created_at",
+    "updated_at",
+]
+
+# Filas por job de MERGE (el parámetro viaja en el request: ~10 MB máx.)
+UPSERT_CHUNK_ROWS = int(os.getenv("BQ_UPSERT_CHUNK_ROWS", "5000"))
+
+
+def _str_or_none(v):
+    return None if v is None else str(v)
+
+
+def _rows_param(rows: list[dict]):
+    return bigquery.ArrayQueryParameter(
+        "rows",
+        "STRUCT",
+        [
+            bigquery.StructQueryParameter(
+                None,
+                *[bigquery.ScalarQueryParameter(c, "STRING", _str_or_none(r.get(c))) for c in TASK_MERGE_COLS],
+            )
+            for r in rows
+        ],
     )
-    load_job.result()
 
-    # merge
-    q = f"""
+
+def _merge_tasks_sql() -> str:
+    return f"""
     MERGE `{_table(TASKS_TABLE)}` T
-    USING `{staging_id}` S
+    USING (SELECT * FROM UNNEST(@rows)) S
     ON T.unique_key = S.unique_key
     WHEN NOT MATCHED THEN
       INSERT (task_id, unique_key, source_file, contratista, ot, ut, desc_ot, desc_op, cuadrilla, id_cuadrilla, status, created_at, updated_at)
-      VALUES (S.task_id, S.unique_key, S.source_file, S.contratista, S.ot, S.ut, S.desc_ot, S.desc_op, S.cuadrilla, S.id_cuadrilla, S.status, S.created_at, S.updated_at)
+      VALUES (S.task_id, S.unique_key, S.source_file, S.contratista, S.ot, S.ut, S.desc_ot, S.desc_op, S.cuadrilla, S.id_cuadrilla, S.status,
+              TIMESTAMP(S.created_at), TIMESTAMP(S.updated_at))
     WHEN MATCHED THEN
       UPDATE SET
         source_file = S.source_file,
         status = S.status,
-        updated_at = S.updated_at
+        updated_at = TIMESTAMP(S.updated_at)
     """
-    client.query(q).result()
 
-    # borrar staging
-    client.delete_table(staging_id, not_found_ok=True)
+
+@metrics.timed("store_upsert")
+def upsert_tasks(rows: list[dict]) -> int:
+    """
+    Dedup real en BigQuery: MERGE por unique_key directamente desde un
+    parámetro ARRAY<STRUCT> (sin tabla staging: un solo job por lote).
+    Los lotes grandes se parten en jobs de UPSERT_CHUNK_ROWS que corren uno
+    detrás del otro (dos MERGE concurrentes sobre la misma tabla chocan).
+    Vuelve cuando el último MERGE quedó confirmado.
+    """
+    if not rows:
+        return 0
+
+    ensure_tables_exist()
+    client = get_client()
+
+    # un MERGE no acepta dos filas fuente para la misma fila destino: gana la última
+    by_key = {}
+    for r in rows:
+        by_key[r.get("unique_key")] = r
+    uniq = list(by_key.values())
+    metrics.TASK_ROWS.inc("merged", n=len(uniq))
+    metrics.TASK_ROWS.inc("duplicate_in_batch", n=len(rows) - len(uniq))
+
+    sql = _merge_tasks_sql()
+    for i in range(0, len(uniq), UPSERT_CHUNK_ROWS):
+        chunk = uniq[i : i + UPSERT_CHUNK_ROWS]
+        job = client.query(sql, job_config=bigquery.QueryJobConfig(query_parameters=[_rows_param(chunk)]))
+        with metrics.span("bq_job_wait"):
+            job.result()
+
     return len(rows)
 
-def insert_event(row: dict):
+
+class EventBufferFull(RuntimeError):
+    """El buffer llegó a EVENT_BUFFER_MAX_ROWS (BigQuery no está aceptando envíos)."""
+
+
+class EventBuffer:
+    """
+    Junta eventos y los manda en lotes (insert_rows_json) cuando se llega a
+    `max_rows` o pasan `max_delay` segundos. Un thread de fondo hace los envíos;
+    flush() fuerza el envío (se llama al cerrar el proceso).
+    Si un envío falla, el thread espera un backoff exponencial con jitter
+    antes de reintentar. Las filas que BigQuery rechaza, y las que siguen sin
+    entrar pasado `retry_window` segundos desde su primer fallo, van al dead
+    letter (ver replay_dead_letter) en vez de trabar a las que vienen atrás.
+    """
+
+    def __init__(
+        self,
+        max_rows: int = EVENT_BATCH_ROWS,
+        max_delay: float = EVENT_BATCH_DELAY_S,
+        retry_window: float = EVENT_RETRY_WINDOW_S,
+        max_pending: int = EVENT_BUFFER_MAX_ROWS,
+        backoff_min: float = EVENT_BACKOFF_MIN_S,
+        backoff_max: float = EVENT_BACKOFF_MAX_S,
+    ):
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.retry_window = retry_window
+        self.max_pending = max_pending
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self._rows: list[tuple[dict, float | None]] = []  # (fila, monotonic del primer fallo)
+        self._failures = 0  # envíos fallidos seguidos
+        self._retry_at: float | None = None  # antes de esto el thread no reintenta
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="bq-event-buffer", daemon=True)
+        self._thread.start()
+
+    def add(self, rows: list[dict]) -> None:
+        with self._cond:
+            if len(self._rows) + len(rows) > self.max_pending:
+                metrics.EVENT_FAILURES.inc("buffer_full", n=len(rows))
+                raise EventBufferFull(f"hay {len(self._rows)} eventos sin enviar a BigQuery")
+            self._rows.extend((r, None) for r in rows)
+            metrics.EVENT_BUFFER_ROWS.set(len(self._rows))
+            if len(self._rows) >= self.max_rows:
+                self._cond.notify()
+
+    def _take(self) -> list[tuple[dict, float | None]]:
+        with self._cond:
+            rows, self._rows = self._rows, []
+        return rows
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            rows = self._take()
+            for i in range(0, len(rows), self.max_rows):
+                chunk = rows[i : i + self.max_rows]
+                try:
+                    errors = _insert_rows([r for r, _ in chunk])
+                except Exception as e:
+                    log.exception("BigQuery: falló el envío de %d eventos", len(chunk))
+                    # vuelven al principio del buffer (row_ids = event_id evita duplicados)
+                    retry = self._failed(chunk, str(e)) + rows[i + self.max_rows :]
+                    with self._cond:
+                        self._rows[:0] = retry
+                    break
+                self._failures, self._retry_at = 0, None
+                self._rejected(chunk, errors)
+            with self._cond:
+                metrics.EVENT_BUFFER_ROWS.set(len(self._rows))
+
+    def _failed(self, chunk: list[tuple[dict, float | None]], error: str) -> list[tuple[dict, float | None]]:
+        """Programa el próximo intento; devuelve las filas que todavía están dentro de la ventana."""
+        now = time.monotonic()
+        self._failures += 1
+        delay = min(self.backoff_max, self.backoff_min * 2 ** (self._failures - 1))
+        # jitter: los workers que vieron caer a BigQuery no reintentan todos juntos
+        self._retry_at = now + random.uniform(delay / 2, delay)
+
+        retry, exhausted = [], []
+        for r, first in chunk:
+            first = now if first is None else first
+            if now - first >= self.retry_window:
+                exhausted.append(r)
+            else:
+                retry.append((r, first))
+        metrics.EVENT_FAILURES.inc("retry", n=len(retry))
+        if exhausted:
+            metrics.EVENT_FAILURES.inc("exhausted", n=len(exhausted))
+            _dead_letter(exhausted, error)
+        return retry
+
+    def _rejected(self, chunk: list[tuple[dict, float | None]], errors: list[dict]) -> None:
+        # con skip_invalid_rows BigQuery guarda las filas válidas e informa solo las rechazadas
+        bad = [(chunk[e["index"]][0], e.get("errors")) for e in errors if 0 <= e.get("index", -1) < len(chunk)]
+        if not bad:
+            return
+        log.error("BigQuery rechazó %d eventos: %s", len(bad), bad[0][1])
+        metrics.EVENT_FAILURES.inc("rejected", n=len(bad))
+        for r, errs in bad:
+            _dead_letter([r], errs)
+
+    def close(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                backoff = self._retry_at - time.monotonic() if self._retry_at is not None else 0
+                if backoff > 0:
+                    # en backoff: add() puede despertarlo, pero no se reintenta antes de tiempo
+                    self._cond.wait(timeout=backoff)
+                    continue
+                if len(self._rows) < self.max_rows:
+                    self._cond.wait(timeout=self.max_delay)
+                if self._stop:
+                    return
+            self.flush()
+
+
+_dead_letter_lock = threading.Lock()
+
+
+def _dead_letter(rows: list[dict], error) -> None:
+    """Guarda los eventos descartados para revisarlos / reenviarlos a mano."""
+    log.error("BigQuery: %d eventos al dead letter (%s)", len(rows), ", ".join(str(r.get("event_id")) for r in rows))
+    if not EVENT_DEAD_LETTER:
+        return
+    try:
+        with _dead_letter_lock:
+            os.makedirs(os.path.dirname(EVENT_DEAD_LETTER) or ".", exist_ok=True)
+            with open(EVENT_DEAD_LETTER, "a", encoding="utf-8") as f:
+                for r in rows:
+                    f.write(json.dumps({"error": error, "row": r, "at": now_utc_iso()}, default=str) + "\n")
+    except OSError:
+        log.exception("BigQuery: no pude escribir el dead letter")
+
+
+def replay_dead_letter(path: str | None = None) -> int:
+    """
+    Reencola los eventos del dead letter (p.ej. cuando BigQuery vuelve).
+    El archivo se toma con un rename: lo que caiga al dead letter mientras
+    tanto va a un archivo nuevo. Los reenvíos no duplican (row_ids = event_id);
+    lo que BigQuery vuelva a rechazar vuelve al dead letter.
+    Devuelve cuántos eventos se reencolaron.
+    """
+    path = path or EVENT_DEAD_LETTER
+    if not path:
+        return 0
+    claimed = f"{path}.{os.getpid()}.replay"
+    with _dead_letter_lock:
+        try:
+            os.replace(path, claimed)
+        except FileNotFoundError:
+            return 0
+    with open(claimed, "r", encoding="utf-8") as f:
+        rows = [json.loads(line)["row"] for line in f if line.strip()]
+
+    buf = _event_buffer()
+    done = 0
+    try:
+        for i in range(0, len(rows), buf.max_rows):
+            buf.add(rows[i : i + buf.max_rows])
+            done = i + buf.max_rows
+    except EventBufferFull:
+        # lo que no entró vuelve al dead letter para el próximo intento
+        with _dead_letter_lock, open(path, "a", encoding="utf-8") as f:
+            for r in rows[done:]:
+                f.write(json.dumps({"error": "replay: buffer lleno", "row": r, "at": now_utc_iso()}, default=str) + "\n")
+    os.remove(claimed)
+    buf.flush()
+    return min(done, len(rows))
+
+
+@metrics.timed("event_insert")
+def _insert_rows(rows: list[dict]) -> list[dict]:
+    """
+    Manda el lote; devuelve los errores por fila ([{index, errors}]) de las
+    que BigQuery rechazó. Un error del envío en sí se propaga (se reintenta).
+    """
     ensure_tables_exist()
-    table_id = _table(EVENTS_TABLE)
-    errors = client.insert_rows_json(table_id, [row])
-    if errors:
-        raise RuntimeError(f"BigQuery insert_event errors: {errors}")
+    return get_client().insert_rows_json(
+        _table(EVENTS_TABLE), rows, row_ids=[r.get("event_id") for r in rows], skip_invalid_rows=True
+    )
+
+
+_buffer: EventBuffer | None = None
+_buffer_lock = threading.Lock()
+
+
+def _event_buffer() -> EventBuffer:
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = EventBuffer()
+    return _buffer
+
+
+def insert_event(row: dict, wait: bool = False):
+    """
+    Encola el evento en el buffer. Con wait=True se manda en el momento
+    (junto con lo que estuviera pendiente).
+    """
+    insert_events([row], wait=wait)
     return True
 
-def list_tasks_by_cuadrilla(cuadrilla: str, limit: int = 300):
+
+def insert_events(rows: list[dict], wait: bool = False) -> int:
+    buf = _event_buffer()
+    buf.add(rows)
+    if wait:
+        buf.flush()
+    return len(rows)
+
+
+def flush_events() -> None:
+    if _buffer is not None:
+        _buffer.flush()
+
+
+@atexit.register
+def shutdown() -> None:
+    global _buffer
+    if _buffer is not None:
+        _buffer.close()
+        _buffer = None
+
+
+def _query(q: str, params: list | None = None) -> list[dict]:
+    job = get_client().query(q, job_config=bigquery.QueryJobConfig(query_parameters=params or []))
+    with metrics.span("bq_job_wait"):
+        result = job.result()
+    return [dict(r) for r in result]
+
+
+def _ts(v):
+    # del cursor viene como texto ISO
+    return datetime.fromisoformat(v) if isinstance(v, str) else v
+
+
+def _no_upload_filter(upload_id: str | None) -> None:
+    # misma firma que local_db, pero acá no hay uploads (las tareas no guardan
+    # de qué Excel vinieron): el filtro se rechaza (main.py lo responde con 422)
+    if upload_id:
+        raise ValueError("El filtro upload_id no está disponible con el backend BigQuery")
+
+
+def _eq_filters(alias: str, **eq) -> tuple[list[str], list]:
+    where, params = [], []
+    for col, v in eq.items():
+        if v is None or v == "":
+            continue
+        where.append(f"{alias}.{col} = @{col}")
+        params.append(bigquery.ScalarQueryParameter(col, "STRING", str(v).strip()))
+    return where, params
+
+
+TASK_SELECT = "task_id, unique_key, contratista, ot, ut, desc_ot, desc_op, cuadrilla, id_cuadrilla, source_file, status, created_at"
+
+
+def list_tasks_by_cuadrilla(cuadrilla: str):
+    return tasks_page(cuadrilla)["rows"]
+
+
+def tasks_page(
+    cuadrilla: str,
+    limit: int | None = None,
+    after: str | None = None,
+    contratista: str | None = None,
+    status: str | None = None,
+    upload_id: str | None = None,
+):
+    """
+    Tareas de la cuadrilla, más nuevas primero, de a `limit` (keyset sobre
+    created_at, task_id; el clustering por cuadrilla acota el scan).
+    """
+    _no_upload_filter(upload_id)
+    where, params = _eq_filters("t", cuadrilla=cuadrilla, contratista=contratista, status=status)
+
+    key = paging.decode_cursor(after, 2)
+    if key:
+        where.append("(t.created_at < @after_time OR (t.created_at = @after_time AND t.task_id < @after_id))")
+        params += [
+            bigquery.ScalarQueryParameter("after_time", "TIMESTAMP", _ts(key[0])),
+            bigquery.ScalarQueryParameter("after_id", "STRING", key[1]),
+        ]
+
     q = f"""
-    SELECT task_id, unique_key, contratista, ot, ut, desc_ot, desc_op, cuadrilla, id_cuadrilla, source_file, status, created_at
-    FROM `{_table(TASKS_TABLE)}`
-    WHERE cuadrilla = @cuadrilla
-    ORDER BY created_at DESC
-    LIMIT {limit}
+    SELECT {TASK_SELECT}
+    FROM `{_table(TASKS_TABLE)}` t
+    WHERE {" AND ".join(where)}
+    ORDER BY t.created_at DESC, t.task_id DESC
     """
-    job = client.query(
-        q,
-        job_config=bigquery.QueryJobConfig(
-            query_parameters=[bigquery.ScalarQueryParameter("cuadrilla", "STRING", cuadrilla)]
-        ),
-    )
-    return [dict(r) for r in job.result()]
+    if limit is not None:
+        q += f"LIMIT {int(limit) + 1}"
+
+    return paging.page(_query(q, params), limit, lambda r: [r["created_at"], r["task_id"]])
+
 
 def get_task(task_id: str):
     q = f"""
-    SELECT task_id, unique_key, contratista, ot, ut, desc_ot, desc_op, cuadrilla, id_cuadrilla, source_file, status, created_at
+    SELECT {TASK_SELECT}
     FROM `{_table(TASKS_TABLE)}`
     WHERE task_id = @task_id
     LIMIT 1
     """
-    job = client.query(
+    job = get_client().query(
         q,
         job_config=bigquery.QueryJobConfig(
             query_parameters=[bigquery.ScalarQueryParameter("task_id", "STRING", task_id)]
         ),
     )
-    rows = list(job.result())
+    with metrics.span("bq_job_wait"):
+        rows = list(job.result())
     return dict(rows[0]) if rows else None
 
-def dashboard_latest(limit: int = 800):
+def list_events_by_task(task_id: str):
+    return events_page(task_id)["rows"]
+
+
+def events_page(
+    task_id: str,
+    limit: int | None = None,
+    after: str | None = None,
+    event_type: str | None = None,
+    from_time: str | None = None,
+    to_time: str | None = None,
+):
+    """Historial de la tarea por event_time; el rango de horas poda particiones."""
+    where, params = _eq_filters("e", task_id=task_id, event_type=event_type)
+    if from_time:
+        where.append("e.event_time >= @from_time")
+        params.append(bigquery.ScalarQueryParameter("from_time", "TIMESTAMP", _ts(from_time)))
+    if to_time:
+        where.append("e.event_time < @to_time")
+        params.append(bigquery.ScalarQueryParameter("to_time", "TIMESTAMP", _ts(to_time)))
+
+    key = paging.decode_cursor(after, 2)
+    if key:
+        where.append("(e.event_time > @after_time OR (e.event_time = @after_time AND e.event_id > @after_id))")
+        params += [
+            bigquery.ScalarQueryParameter("after_time", "TIMESTAMP", _ts(key[0])),
+            bigquery.ScalarQueryParameter("after_id", "STRING", key[1]),
+        ]
+
+    q = f"""
+    SELECT * FROM `{_table(EVENTS_TABLE)}` e
+    WHERE {" AND ".join(where)}
+    ORDER BY e.event_time, e.event_id
+    """
+    if limit is not None:
+        q += f"LIMIT {int(limit) + 1}"
+
+    return paging.page(_query(q, params), limit, lambda r: [r["event_time"], r["event_id"]])
+
+
+def dashboard_latest(window_days: int | None = None):
+    return dashboard_page(window_days=window_days)["rows"]
+
+
+@metrics.timed("dashboard_compute")
+def dashboard_page(
+    limit: int | None = None,
+    after: str | None = None,
+    window_days: int | None = None,
+    cuadrilla: str | None = None,
+    contratista: str | None = None,
+    event_type: str | None = None,
+    upload_id: str | None = None,
+    from_time: str | None = None,
+    to_time: str | None = None,
+):
+    """
+    Último evento por unique_key, lo más reciente primero, de a `limit`
+    (keyset sobre event_time, unique_key).
+    Solo mira eventos de los últimos `window_days` días (BQ_DASHBOARD_WINDOW_DAYS):
+    el filtro sobre event_time poda particiones y el clustering por unique_key
+    abarata el ROW_NUMBER. 0 = todo el historial.
+    """
+    _no_upload_filter(upload_id)
+    days = DASHBOARD_WINDOW_DAYS if window_days is None else window_days
+    inner, params = [], []
+    since = datetime.now(timezone.utc) - timedelta(days=days) if days > 0 else None
+    if from_time and (since is None or _ts(from_time) > since):
+        since = _ts(from_time)
+    if since is not None:
+        # el último evento de la clave es >= since si y solo si alguno lo es
+        inner.append("e.event_time >= @since")
+        params.append(bigquery.ScalarQueryParameter("since", "TIMESTAMP", since))
+
+    outer, p = _eq_filters("r", cuadrilla=cuadrilla, event_type=event_type)
+    outer.insert(0, "r.rn = 1")
+    params += p
+    if to_time:
+        outer.append("r.event_time < @to_time")
+        params.append(bigquery.ScalarQueryParameter("to_time", "TIMESTAMP", _ts(to_time)))
+    if contratista:
+        outer.append(f"r.unique_key IN (SELECT unique_key FROM `{_table(TASKS_TABLE)}` WHERE contratista = @contratista)")
+        params.append(bigquery.ScalarQueryParameter("contratista", "STRING", contratista.strip()))
+
+    key = paging.decode_cursor(after, 2)
+    if key:
+        outer.append("(r.event_time < @after_time OR (r.event_time = @after_time AND r.unique_key < @after_key))")
+        params += [
+            bigquery.ScalarQueryParameter("after_time", "TIMESTAMP", _ts(key[0])),
+            bigquery.ScalarQueryParameter("after_key", "STRING", key[1]),
+        ]
+
     q = f"""
     WITH ranked AS (
       SELECT
         e.*,
         ROW_NUMBER() OVER (PARTITION BY unique_key ORDER BY event_time DESC, created_at DESC) AS rn
       FROM `{_table(EVENTS_TABLE)}` e
+      {"WHERE " + " AND ".join(inner) if inner else ""}
     )
     SELECT
-      unique_key, ot, cuadrilla, id_cuadrilla, event_type, event_time, pause_reason, comment, photo_url, lat, lon, accuracy_m
-    FROM ranked
-    WHERE rn = 1
-    ORDER BY event_time DESC
-    LIMIT {limit}
+      r.unique_key, r.task_id, r.ot, r.cuadrilla, r.id_cuadrilla, r.event_type, r.event_time,
+      r.pause_reason, r.comment, r.photo_url, r.lat, r.lon, r.accuracy_m
+    FROM ranked r
+    WHERE {" AND ".join(outer)}
+    ORDER BY r.event_time DESC, r.unique_key DESC
     """
-    return [dict(r) for r in client.query(q).result()]
+    if limit is not None:
+        q += f"LIMIT {int(limit) + 1}"
+
+    return paging.page(_query(q, params), limit, lambda r: [r["event_time"], r["unique_key"]])
+
+
+if __name__ == "__main__":
+    # python -m backend.bq               -> migra tablas existentes a particionado/clustering
+    # python -m backend.bq replay [path] -> reenvía los eventos del dead letter
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:2] == ["replay"]:
+        log.info("reencolados %d eventos del dead letter", replay_dead_letter(*sys.argv[2:3]))
+        shutdown()
+    else:
+        for line in migrate_tables() or ["sin cambios"]:
+            log.info(line)
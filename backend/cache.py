@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache LRU acotado con vencimiento por tiempo. Thread-safe (los handlers
+    sync corren en el threadpool). Es por proceso: el TTL acota cuánto puede
+    quedar desactualizado un worker que no vio la invalidación, salvo que se
+    lo ate a una generación del store (ver sync).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._gen: Any = None
+        self.hits = 0
+        self.misses = 0
+
+    def sync(self, gen: Any) -> None:
+        """Vacía el cache si cambió la generación (como GenerationCache, pero por clave)."""
+        if gen == self._gen:
+            return
+        with self._lock:
+            if gen != self._gen:
+                self._data.clear()
+                self._gen = gen
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or item[0] < now:
+                if item is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class GenerationCache:
+    """
+    Un valor derivado del store que vale mientras no cambie su "generación"
+    (un contador que el store incrementa en la misma transacción que la
+    escritura). Como el contador vive en la base, todos los workers ven la
+    invalidación: no hace falta TTL.
+    """
+
+    def __init__(self, load: Callable[[], Any]):
+        self._load = load
+        self._gen: Any = None
+        self._value: Any = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, gen: Any) -> Any:
+        if gen == self._gen:
+            self.hits += 1
+            return self._value
+        with self._lock:
+            if gen != self._gen:
+                # se lee después que la generación: nunca queda más viejo que `gen`
+                self._value = self._load()
+                self._gen = gen
+                self.misses += 1
+            else:
+                self.hits += 1
+            return self._value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._gen = None
+            self._value = None
+
+
+# task_id -> metadatos mínimos para armar un evento (unique_key).
+# Atado a la generación de uploads (main._task_meta): un borrado o una baja en
+# otro worker lo invalida en todos. Se vacía además al importar.
+task_meta = TTLCache(
+    maxsize=int(os.getenv("TASK_CACHE_SIZE", "20000")),
+    ttl=float(os.getenv("TASK_CACHE_TTL", "300")),
+)
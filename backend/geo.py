@@ -0,0 +1,33 @@
+import math
+import os
+from typing import Tuple
+
+EARTH_RADIUS_M = 6371008.8
+# metros por grado de latitud (aprox. constante)
+M_PER_DEG_LAT = 111320.0
+
+# Un check-in a más de esto de la ubicación habitual de la tarea se marca
+GEO_FAR_M = float(os.getenv("GEO_FAR_M", "1000"))
+# Check-ins previos que hacen falta para que la ubicación habitual cuente
+GEO_MIN_SAMPLES = int(os.getenv("GEO_MIN_SAMPLES", "2"))
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(lat: float, lon: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon) que contiene el círculo (para el R*Tree)."""
+    dlat = radius_m / M_PER_DEG_LAT
+    coslat = max(math.cos(math.radians(lat)), 1e-6)
+    dlon = min(180.0, radius_m / (M_PER_DEG_LAT * coslat))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def is_far(distance_m: float, accuracy_m: float | None) -> bool:
+    # con un GPS impreciso no se acusa: la distancia tiene que superar el error
+    return distance_m - (accuracy_m or 0.0) > GEO_FAR_M
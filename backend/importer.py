@@ -0,0 +1,248 @@
+import hashlib
+from io import BytesIO
+from typing import Any, Dict, Iterator, List, Tuple
+
+import openpyxl
+import pandas as pd
+
+from backend import metrics
+
+# Columnas requeridas del Excel -> alias aceptados en el encabezado
+REQUIRED_ALIASES: Dict[str, List[str]] = {
+    "Contratista": ["Contratista"],
+    "OT": ["OT"],
+    "UT": ["UT"],
+    "Descripción OT": ["Descripción OT", "Descripcion OT"],
+    "Descripción OP": ["Descripción OP", "Descripcion OP"],
+    "Cuadrilla": ["Cuadrilla"],
+    "ID Cuadrilla": ["ID Cuadrilla", "Id Cuadrilla"],
+}
+
+# Filas que se miran (por hoja) buscando el encabezado
+HEADER_SCAN_ROWS = 80
+
+# Filas por lote en la lectura streaming (acota la memoria por archivo)
+BATCH_ROWS = 2000
+
+# Extensiones que se leen en streaming con openpyxl (read-only)
+STREAMING_EXTS = (".xlsx", ".xlsm")
+
+_ACCENTS = str.maketrans("áéíóúü", "aeiouu")
+
+
+def norm(s: Any) -> str:
+    if s is None:
+        return ""
+    s = str(s).strip().lower().translate(_ACCENTS)
+    return " ".join(s.split())
+
+
+# alias normalizado -> columna canónica (lookup O(1) por celda)
+ALIAS_TO_CANON: Dict[str, str] = {
+    norm(alias): canon for canon, aliases in REQUIRED_ALIASES.items() for alias in aliases
+}
+
+
+def _norm_series(s: pd.Series) -> pd.Series:
+    # misma normalización que norm(), pero sobre toda la columna de una vez
+    return (
+        s.str.lower()
+        .str.translate(_ACCENTS)
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def find_header(head: pd.DataFrame) -> Tuple[int, Dict[str, int]] | None:
+    """
+    Busca la primera fila que tenga TODAS las columnas requeridas.
+    Devuelve (índice de fila, {canónica: índice de columna}) o None.
+    """
+    if head.empty:
+        return None
+
+    cells = head.fillna("").astype(str).stack()
+    canon = _norm_series(cells).map(ALIAS_TO_CANON).dropna()
+    if canon.empty:
+        return None
+
+    hits = canon.rename("canon").reset_index()
+    hits.columns = ["row", "col", "canon"]
+    # si un alias aparece dos veces en la fila, vale la primera columna
+    hits = hits.drop_duplicates(subset=["row", "canon"], keep="first")
+
+    counts = hits.groupby("row")["canon"].size()
+    complete = counts[counts == len(REQUIRED_ALIASES)]
+    if complete.empty:
+        return None
+
+    row = int(complete.index.min())
+    found = hits[hits["row"] == row]
+    return row, {c: int(j) for c, j in zip(found["canon"], found["col"])}
+
+
+def pick_sheet_and_df(content: bytes | str) -> Tuple[str | None, pd.DataFrame | None]:
+    """
+    Recorre las hojas leyendo solo las primeras HEADER_SCAN_ROWS filas hasta
+    encontrar el encabezado; recién ahí lee los datos (solo las columnas requeridas).
+    """
+    xl = pd.ExcelFile(BytesIO(content) if isinstance(content, bytes) else content)
+
+    for sh in xl.sheet_names:
+        head = pd.read_excel(xl, sheet_name=sh, header=None, dtype=str, nrows=HEADER_SCAN_ROWS)
+        with metrics.span("header_scan"):
+            found = find_header(head)
+        if found is None:
+            continue
+        header_row_idx, header_colmap = found
+
+        cols = [header_colmap[k] for k in REQUIRED_ALIASES.keys()]
+        data = pd.read_excel(
+            xl,
+            sheet_name=sh,
+            header=None,
+            dtype=str,
+            skiprows=header_row_idx + 1,
+            usecols=sorted(set(cols)),
+        )
+        data = data.reindex(columns=cols)
+
+        out = data.copy()
+        out.columns = list(REQUIRED_ALIASES.keys())
+        return sh, _clean(out)
+
+    return None, None
+
+
+def _clean(out: pd.DataFrame) -> pd.DataFrame:
+    out = out.fillna("").astype(str)
+
+    mask_any = (
+        (out["OT"].str.strip().str.len() > 0)
+        | (out["Cuadrilla"].str.strip().str.len() > 0)
+        | (out["ID Cuadrilla"].str.strip().str.len() > 0)
+    )
+    out = out[mask_any].copy()
+
+    if not out.empty:
+        out = out.reset_index(drop=True)
+    return out
+
+
+# -----------------------------
+# Lectura streaming (openpyxl read-only)
+# -----------------------------
+def _cell_str(v: Any) -> str:
+    # igual que pandas(read_excel, dtype=str): enteros sin ".0", vacío -> ""
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def _batches(rows: Iterator[tuple], cols: List[int], batch_rows: int) -> Iterator[pd.DataFrame]:
+    canon = list(REQUIRED_ALIASES.keys())
+    buf: List[List[str]] = []
+    for r in rows:
+        buf.append([_cell_str(r[j]) if j < len(r) else "" for j in cols])
+        if len(buf) >= batch_rows:
+            yield _clean(pd.DataFrame(buf, columns=canon))
+            buf = []
+    if buf:
+        yield _clean(pd.DataFrame(buf, columns=canon))
+
+
+def iter_sheet_batches(path: str, batch_rows: int = BATCH_ROWS) -> Tuple[str | None, Iterator[pd.DataFrame] | None]:
+    """
+    Abre el workbook en modo read-only y busca la hoja con encabezado mirando
+    solo sus primeras HEADER_SCAN_ROWS filas. Devuelve (hoja, lotes): las filas
+    de datos se leen recién al iterar los lotes, de a `batch_rows`.
+    """
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    for ws in wb.worksheets:
+        rows = ws.iter_rows(values_only=True)
+        head = []
+        for r in rows:
+            head.append([_cell_str(v) for v in r])
+            if len(head) >= HEADER_SCAN_ROWS:
+                break
+
+        with metrics.span("header_scan"):
+            found = find_header(pd.DataFrame(head))
+        if found is None:
+            continue
+
+        header_row_idx, header_colmap = found
+        cols = [header_colmap[k] for k in REQUIRED_ALIASES.keys()]
+
+        def gen(ws_rows=rows, head_rows=head[header_row_idx + 1 :]):
+            try:
+                # las filas que ya se leyeron al buscar el encabezado, y después el resto
+                yield from _batches(iter(head_rows), cols, batch_rows)
+                yield from _batches(ws_rows, cols, batch_rows)
+            finally:
+                wb.close()
+
+        return ws.title, gen()
+
+    wb.close()
+    return None, None
+
+
+# -----------------------------
+# Construcción de tasks (columnar)
+# -----------------------------
+def make_task_ids(contratista, ot, ut, desc_op, id_cuadrilla):
+    key = (
+        f"{(contratista or '').strip()}||"
+        f"{(ot or '').strip()}||"
+        f"{(ut or '').strip()}||"
+        f"{(desc_op or '').strip()}||"
+        f"{(id_cuadrilla or '').strip()}"
+    )
+    task_id = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return task_id, key
+
+
+def build_task_batch(df: pd.DataFrame, upload_id: str, source_file: str, now_iso: str) -> Dict[str, list]:
+    """
+    Arma las tasks de un lote como columnas ({campo: lista}) en vez de un dict
+    por fila. unique_key/task_id salen idénticos a make_task_ids().
+    Todas las filas del import llevan el mismo timestamp.
+    """
+    n = len(df)
+    parts = [df[c].fillna("").astype(str).str.strip() for c in ("Contratista", "OT", "UT", "Descripción OP", "ID Cuadrilla")]
+    keys = parts[0].str.cat(parts[1:], sep="||").tolist() if n else []
+    sha1 = hashlib.sha1
+    task_ids = [sha1(k.encode("utf-8")).hexdigest() for k in keys]
+
+    return {
+        "task_id": task_ids,
+        "unique_key": keys,
+        "upload_id": [upload_id] * n,
+        "source_file": [source_file] * n,
+        "contratista": df["Contratista"].tolist(),
+        "ot": df["OT"].tolist(),
+        "ut": df["UT"].tolist(),
+        "desc_ot": df["Descripción OT"].tolist(),
+        "desc_op": df["Descripción OP"].tolist(),
+        "cuadrilla": df["Cuadrilla"].tolist(),
+        "id_cuadrilla": df["ID Cuadrilla"].tolist(),
+        "status": ["ABIERTO"] * n,
+        "created_at": [now_iso] * n,
+        "updated_at": [now_iso] * n,
+    }
+
+
+def read_task_batches(path: str, batch_rows: int = BATCH_ROWS) -> Tuple[str | None, Iterator[pd.DataFrame] | None]:
+    """
+    Punto de entrada del import: .xlsx en streaming, el resto (p.ej. .xls) con pandas.
+    """
+    if path.lower().endswith(STREAMING_EXTS):
+        return iter_sheet_batches(path, batch_rows)
+
+    sheet, df = pick_sheet_and_df(path)
+    if df is None:
+        return None, None
+    return sheet, iter([df])
@@ -0,0 +1,194 @@
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import backend.local_db as bq
+from backend import cache, importer, metrics
+
+# Procesos para parsear Excels (pandas/openpyxl son CPU-bound: threads no alcanzan)
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Un archivo PROCESANDO sin progreso en este tiempo se da por colgado (ver recover)
+JOB_STALE_S = float(os.getenv("IMPORT_JOB_STALE", "3600"))
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def now_utc_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: el proceso padre tiene threads (event loop, compactador)
+        _pool = ProcessPoolExecutor(max_workers=IMPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _alive(pid: int) -> bool:
+    if pid == os.getpid():
+        # al arrancar este proceso no tiene jobs: es un pid de una vida anterior
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recover() -> int:
+    """
+    Al arrancar: los archivos que quedaron PENDIENTE / PROCESANDO de un
+    proceso que murió (crash, reinicio, shutdown sin esperar al pool) pasan a
+    ERROR, se deshace lo que alcanzaron a importar y se borra el archivo
+    guardado. No se reencolan: un Excel que tiró abajo el proceso lo volvería
+    a hacer en cada arranque; se vuelve a subir a mano.
+    """
+    stale = (datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_S)).isoformat()
+    orphans = bq.fail_orphaned_job_files(
+        _alive, stale, "Importación interrumpida (reinicio del servidor); volvé a subir el archivo"
+    )
+    for f in orphans:
+        if f["upload_id"]:
+            bq.discard_import(f["upload_id"])
+        if f["path"]:
+            _remove(f["path"])
+    if orphans:
+        cache.task_meta.clear()
+    return len(orphans)
+
+
+def submit(job_id: str, files: list[dict]) -> None:
+    """
+    Encola cada archivo del job en el pool. `files`: [{filename, path, upload_id, content_sha256}]
+    (ya guardados en disco y registrados con bq.create_upload_job).
+    Los archivos repetidos (status DUPLICADO) no se encolan.
+    """
+    pool = _get_pool()
+    for idx, f in enumerate(files):
+        if f.get("status") == "DUPLICADO":
+            continue
+        fut = pool.submit(run_file, job_id, idx, f["path"], f["filename"], f["upload_id"], f.get("content_sha256"))
+        fut.add_done_callback(lambda fut, idx=idx: _on_done(job_id, idx, fut))
+
+
+def _on_done(job_id: str, idx: int, fut: Future) -> None:
+    # el upsert corrió en otro proceso: invalidamos el cache de este
+    cache.task_meta.clear()
+
+    # si el proceso murió (o se canceló) el archivo no puede quedar "PROCESANDO"
+    exc = None if fut.cancelled() else fut.exception()
+    if fut.cancelled() or exc is not None:
+        bq.update_upload_job_file(
+            job_id, idx, status="ERROR", error=str(exc or "cancelado"), updated_at=now_utc_iso()
+        )
+
+
+def run_file(
+    job_id: str, idx: int, saved_path: str, safe_name: str, upload_id: str, content_sha256: str | None = None
+) -> int:
+    """Corre en un proceso del pool: importa un archivo y va informando el progreso."""
+    try:
+        return _run_file(job_id, idx, saved_path, safe_name, upload_id, content_sha256)
+    finally:
+        # lo medido en este proceso queda visible en /metrics sin esperar al flusher
+        metrics.flush()
+
+
+def _run_file(
+    job_id: str, idx: int, saved_path: str, safe_name: str, upload_id: str, content_sha256: str | None
+) -> int:
+    bq.update_upload_job_file(job_id, idx, status="PROCESANDO", updated_at=now_utc_iso())
+
+    def progress(rows: int) -> None:
+        bq.update_upload_job_file(job_id, idx, rows_imported=rows, updated_at=now_utc_iso())
+
+    try:
+        rows = import_file(saved_path, safe_name, upload_id, progress, content_sha256)
+    except Exception as e:
+        # sin upload registrado ni tareas a medias: el mismo archivo se puede volver a subir.
+        # Las tareas que el import le tomó a otro upload vuelven a ese (no se borran)
+        bq.discard_import(upload_id)
+        _remove(saved_path)
+        bq.update_upload_job_file(job_id, idx, status="ERROR", error=str(e), updated_at=now_utc_iso())
+        return 0
+
+    if rows is None:
+        # si falla, borramos el archivo físico guardado
+        _remove(saved_path)
+        bq.update_upload_job_file(
+            job_id, idx, status="ERROR", error="No encontré columnas requeridas", updated_at=now_utc_iso()
+        )
+        return 0
+
+    bq.update_upload_job_file(job_id, idx, status="OK", rows_imported=rows, updated_at=now_utc_iso())
+    return rows
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except Exception:
+        pass
+
+
+def import_file(
+    saved_path: str, safe_name: str, upload_id: str, progress=None, content_sha256: str | None = None
+) -> int | None:
+    """
+    Lee el Excel en lotes y hace upsert de cada lote: la memoria queda acotada
+    por importer.BATCH_ROWS, no por el tamaño del workbook.
+    Devuelve las filas importadas, o None si no se encontró el encabezado.
+    """
+    # 2) Parsear excel (abrir + buscar encabezado; los lotes se miden al leerlos)
+    with metrics.span("excel_parse"):
+        sheet, batches = importer.read_task_batches(saved_path)
+    if batches is None:
+        return None
+
+    # 3) Registrar el upload (ACTIVO por defecto). El hash se guarda recién al
+    # terminar: un import a medias no debe hacer que el archivo cuente como repetido
+    bq.create_upload(
+        {
+            "upload_id": upload_id,
+            "filename": safe_name,
+            "path": saved_path,
+            "sheet": sheet,
+            "rows_imported": 0,
+            "uploaded_at": now_utc_iso(),
+            "active": True,
+            "content_sha256": None,
+        }
+    )
+
+    # un único timestamp para todo el import
+    now = now_utc_iso()
+    rows_total = 0
+    for df in metrics.timed_iter(batches, "excel_parse"):
+        with metrics.span("task_build"):
+            df = df.fillna("").astype(str)
+            df = df[df["OT"].str.strip().str.len() > 0]
+            df = df[df["Cuadrilla"].str.strip().str.len() > 0]
+            df = df[df["ID Cuadrilla"].str.strip().str.len() > 0]
+
+            # 4) Generar tasks con upload_id (columnar)
+            batch = importer.build_task_batch(df, upload_id, safe_name, now)
+        bq.upsert_task_batch(batch)
+        rows_total += int(len(df))
+        metrics.IMPORT_ROWS.inc(n=len(df))
+        if progress:
+            progress(rows_total)
+
+    bq.update_upload(upload_id, rows_imported=rows_total, content_sha256=content_sha256)
+    return rows_total
@@ -0,0 +1,107 @@
+import asyncio
+import json
+from typing import Any, Callable, Dict
+
+# Cada cuánto se revisa el cursor aunque nadie avise (cambios hechos por otro worker)
+POLL_INTERVAL_S = 1.0
+# Comentario SSE para que proxies/navegador no corten conexiones ociosas
+HEARTBEAT_S = 20.0
+# Mensajes pendientes por cliente antes de considerarlo "lento" y desconectarlo
+QUEUE_SIZE = 256
+
+
+def sse(msg: Dict[str, Any]) -> str:
+    """Formatea un mensaje como evento SSE (el id es el cursor del tablero)."""
+    return f"id: {msg.get('cursor', '')}\ndata: {json.dumps(msg, ensure_ascii=False, default=str)}\n\n"
+
+
+class Broker:
+    """
+    Fan-out en proceso de los cambios del tablero hacia las conexiones SSE.
+
+    Un único watcher (tarea asyncio) sigue la secuencia de cambios del store;
+    cuando avanza, calcula el delta UNA vez y lo encola para cada suscriptor.
+    Cada conexión es solo una asyncio.Queue: no hay un thread por cliente.
+    """
+
+    def __init__(self, fetch_cursor: Callable[[], int], fetch_changes: Callable[[int], Dict[str, Any]]):
+        self._fetch_cursor = fetch_cursor
+        self._fetch_changes = fetch_changes
+        self._subs: set[asyncio.Queue] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._last: int | None = None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for q in list(self._subs):
+            self._close(q)
+
+    def notify(self) -> None:
+        """Avisa que hubo una escritura. Se puede llamar desde cualquier thread."""
+        if self._loop is None or self._wake is None:
+            return
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    def subscribe(self) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._subs.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        self._subs.discard(q)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def _close(self, q: asyncio.Queue) -> None:
+        # None = fin del stream; el navegador reconecta solo (Last-Event-ID)
+        self._subs.discard(q)
+        try:
+            q.put_nowait(None)
+        except asyncio.QueueFull:
+            q.get_nowait()
+            q.put_nowait(None)
+
+    def _fanout(self, msg: Dict[str, Any]) -> None:
+        for q in list(self._subs):
+            try:
+                q.put_nowait(msg)
+            except asyncio.QueueFull:
+                self._close(q)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=POLL_INTERVAL_S)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            try:
+                cursor = await asyncio.to_thread(self._fetch_cursor)
+                if self._last is None or cursor <= self._last:
+                    self._last = cursor
+                    continue
+                if self._subs:
+                    changes = await asyncio.to_thread(self._fetch_changes, self._last)
+                    self._fanout({**changes, "full": False})
+                    cursor = changes.get("cursor", cursor)
+                self._last = cursor
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # un error puntual del store no debe matar el watcher
+                await asyncio.sleep(POLL_INTERVAL_S)
@@ -1,88 +1,749 @@
+import fcntl
 import json
 import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
 from typing import List, Dict, Any
 
+from backend import cache, geo, metrics, paging
+
 BASE = "local_data"
+DB_PATH = os.path.join(BASE, "cuadrillas.db")
+UPLOADS_DIR = os.path.join(BASE, "uploads")
+
+# Archivos JSON del formato anterior (solo se leen para migrar)
 TASKS = os.path.join(BASE, "tasks.json")
 EVENTS = os.path.join(BASE, "events.json")
-UPLOADS_DIR = os.path.join(BASE, "uploads")
 UPLOADS_REG = os.path.join(BASE, "uploads.json")
 
 os.makedirs(BASE, exist_ok=True)
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
+UPLOAD_COLS = ("upload_id", "filename", "path", "sheet", "rows_imported", "uploaded_at", "active", "content_sha256")
+
+TASK_COLS = (
+    "task_id",
+    "unique_key",
+    "upload_id",
+    "source_file",
+    "contratista",
+    "ot",
+    "ut",
+    "desc_ot",
+    "desc_op",
+    "cuadrilla",
+    "id_cuadrilla",
+    "status",
+    "created_at",
+    "updated_at",
+)
+
+EVENT_COLS = (
+    "event_id",
+    "task_id",
+    "unique_key",
+    "ot",
+    "cuadrilla",
+    "id_cuadrilla",
+    "event_type",
+    "event_time",
+    "lat",
+    "lon",
+    "accuracy_m",
+    "pause_reason",
+    "comment",
+    "photo_url",
+    "thumb_url",
+    "created_at",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    upload_id     TEXT PRIMARY KEY,
+    filename      TEXT,
+    path          TEXT,
+    sheet         TEXT,
+    rows_imported INTEGER,
+    uploaded_at   TEXT,
+    active        INTEGER NOT NULL DEFAULT 1,
+    content_sha256 TEXT
+);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id      TEXT PRIMARY KEY,
+    unique_key   TEXT,
+    upload_id    TEXT,
+    source_file  TEXT,
+    contratista  TEXT,
+    ot           TEXT,
+    ut           TEXT,
+    desc_ot      TEXT,
+    desc_op      TEXT,
+    cuadrilla    TEXT,
+    id_cuadrilla TEXT,
+    status       TEXT,
+    created_at   TEXT,
+    updated_at   TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_tasks_unique_key ON tasks(unique_key);
+CREATE INDEX IF NOT EXISTS ix_tasks_cuadrilla ON tasks(trim(cuadrilla));
+CREATE INDEX IF NOT EXISTS ix_tasks_upload_id ON tasks(upload_id);
+
+-- Uploads que traen cada tarea (la misma OT puede venir en varios planes).
+-- tasks.upload_id es el dueño: el más nuevo de los activos (ver _reassign_tasks)
+CREATE TABLE IF NOT EXISTS task_uploads (
+    upload_id TEXT NOT NULL,
+    task_id   TEXT NOT NULL,
+    PRIMARY KEY (upload_id, task_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_task_uploads_task_id ON task_uploads(task_id);
+
+CREATE TABLE IF NOT EXISTS events (
+    event_id     TEXT PRIMARY KEY,
+    task_id      TEXT,
+    unique_key   TEXT,
+    ot           TEXT,
+    cuadrilla    TEXT,
+    id_cuadrilla TEXT,
+    event_type   TEXT,
+    event_time   TEXT,
+    lat          REAL,
+    lon          REAL,
+    accuracy_m   REAL,
+    pause_reason TEXT,
+    comment      TEXT,
+    photo_url    TEXT,
+    thumb_url    TEXT,
+    created_at   TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_events_task_id ON events(task_id, event_time);
+CREATE INDEX IF NOT EXISTS ix_events_unique_key ON events(unique_key, event_time);
+CREATE INDEX IF NOT EXISTS ix_events_time ON events(event_time);
+CREATE INDEX IF NOT EXISTS ix_events_cuadrilla ON events(trim(cuadrilla), event_time);
+
+-- Índice espacial (R*Tree) de los eventos con coordenadas; id = events.rowid
+CREATE VIRTUAL TABLE IF NOT EXISTS events_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+
+-- Última posición conocida por cuadrilla (la mantiene insert_event)
+CREATE TABLE IF NOT EXISTS cuadrilla_positions (
+    cuadrilla    TEXT PRIMARY KEY,
+    event_id     TEXT,
+    task_id      TEXT,
+    event_type   TEXT,
+    event_time   TEXT,
+    lat          REAL,
+    lon          REAL,
+    accuracy_m   REAL
+);
+
+-- Ubicación habitual de cada tarea: promedio de sus check-ins no marcados
+CREATE TABLE IF NOT EXISTS task_locations (
+    task_id TEXT PRIMARY KEY,
+    n       INTEGER NOT NULL,
+    lat     REAL NOT NULL,
+    lon     REAL NOT NULL
+);
+
+-- Check-ins lejos de la ubicación habitual de su tarea (ver backend/geo.py)
+CREATE TABLE IF NOT EXISTS geo_flags (
+    event_id   TEXT PRIMARY KEY,
+    task_id    TEXT,
+    cuadrilla  TEXT,
+    event_type TEXT,
+    event_time TEXT,
+    lat        REAL,
+    lon        REAL,
+    distance_m REAL
+);
+CREATE INDEX IF NOT EXISTS ix_geo_flags_time ON geo_flags(event_time);
+CREATE INDEX IF NOT EXISTS ix_geo_flags_task_id ON geo_flags(task_id);
+
+-- Vista materializada: último evento por unique_key (la mantiene insert_event)
+CREATE TABLE IF NOT EXISTS latest_events (
+    unique_key   TEXT PRIMARY KEY,
+    event_id     TEXT,
+    task_id      TEXT,
+    ot           TEXT,
+    cuadrilla    TEXT,
+    id_cuadrilla TEXT,
+    event_type   TEXT,
+    event_time   TEXT,
+    lat          REAL,
+    lon          REAL,
+    accuracy_m   REAL,
+    pause_reason TEXT,
+    comment      TEXT,
+    photo_url    TEXT,
+    thumb_url    TEXT,
+    created_at   TEXT,
+    upload_id    TEXT,
+    active       INTEGER NOT NULL DEFAULT 1,
+    seq          INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_latest_events_upload_id ON latest_events(upload_id);
+CREATE INDEX IF NOT EXISTS ix_latest_events_task_id ON latest_events(task_id);
+CREATE INDEX IF NOT EXISTS ix_latest_events_event_id ON latest_events(event_id);
+CREATE INDEX IF NOT EXISTS ix_latest_events_time ON latest_events(active, event_time, unique_key);
+
+-- unique_keys que salieron de latest_events (para el modo delta del tablero)
+CREATE TABLE IF NOT EXISTS latest_tombstones (
+    unique_key TEXT PRIMARY KEY,
+    seq        INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_latest_tombstones_seq ON latest_tombstones(seq);
+
+-- contadores internos (secuencia de cambios del tablero, etc.)
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('change_seq', 0);
+-- generación del registro de uploads (invalida el cache de cada worker)
+INSERT OR IGNORE INTO meta (key, value) VALUES ('uploads_gen', 0);
+-- 1 cuando el índice espacial ya se armó desde events (ver rebuild_geo)
+INSERT OR IGNORE INTO meta (key, value) VALUES ('geo_indexed', 0);
+-- 1 cuando task_uploads ya se completó con el upload_id de las tareas existentes
+INSERT OR IGNORE INTO meta (key, value) VALUES ('task_uploads_filled', 0);
+
+-- Importaciones en background: un job por POST, una fila por archivo
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    job_id     TEXT PRIMARY KEY,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS upload_job_files (
+    job_id        TEXT NOT NULL,
+    idx           INTEGER NOT NULL,
+    filename      TEXT,
+    upload_id     TEXT,
+    status        TEXT NOT NULL DEFAULT 'PENDIENTE',
+    rows_imported INTEGER NOT NULL DEFAULT 0,
+    error         TEXT,
+    updated_at    TEXT,
+    owner_pid     INTEGER,
+    path          TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+# Columnas agregadas después de crear la tabla (bases ya existentes)
+_ADDED_COLUMNS = {
+    "uploads": [("content_sha256", "TEXT")],
+    "events": [("thumb_url", "TEXT")],
+    "latest_events": [("seq", "INTEGER NOT NULL DEFAULT 0"), ("thumb_url", "TEXT")],
+    "upload_job_files": [("owner_pid", "INTEGER"), ("path", "TEXT")],
+}
+
+# Índices sobre columnas agregadas (se crean después del ALTER TABLE)
+_POST_SCHEMA = """
+CREATE INDEX IF NOT EXISTS ix_uploads_sha256 ON uploads(content_sha256);
+CREATE INDEX IF NOT EXISTS ix_latest_events_seq ON latest_events(seq);
+"""
+
+# El WAL de SQLite es el log append-only de eventos: cada insert es un append
+# + fsync al final del WAL. El checkpoint grande lo hace el compactador en
+# background; el autocheckpoint queda solo como red de seguridad.
+WAL_AUTOCHECKPOINT_PAGES = 10000
+COMPACT_INTERVAL_S = float(os.getenv("LOCAL_DB_COMPACT_INTERVAL", "30"))
+# El WAL se trunca (checkpoint TRUNCATE, bloquea escrituras) solo si pasa
+# este tamaño y la base está quieta; si no, alcanza con el PASSIVE
+WAL_TRUNCATE_BYTES = int(os.getenv("LOCAL_DB_WAL_TRUNCATE_BYTES", str(64 * 1024 * 1024)))
+# Un compactador para todos los workers: el que tiene el flock de este archivo
+COMPACT_LOCK_PATH = DB_PATH + ".compact.lock"
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+_compactor: threading.Thread | None = None
+_compactor_stop = threading.Event()
+_compact_lock_fd: int | None = None
+
+
+def _connect() -> sqlite3.Connection:
+    # isolation_level=None: las transacciones se abren a mano (ver _tx)
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute(f"PRAGMA wal_autocheckpoint={WAL_AUTOCHECKPOINT_PAGES}")
+    return conn
+
+
+def _init_schema(conn: sqlite3.Connection) -> None:
+    # auto_vacuum=INCREMENTAL permite devolver páginas libres después de borrar
+    # (se activa antes de crear tablas; en una base existente requiere VACUUM)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    conn.executescript(_SCHEMA)
+    # varios workers arrancan a la vez: se revisan las columnas con el lock de
+    # escritura tomado, así uno solo hace el ALTER TABLE
+    with _tx(conn):
+        for table, cols in _ADDED_COLUMNS.items():
+            have = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+            for col, decl in cols:
+                if col not in have:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl}")
+        if not conn.execute("SELECT value FROM meta WHERE key = 'task_uploads_filled'").fetchone()[0]:
+            conn.execute(_FILL_TASK_UPLOADS)
+            conn.execute("UPDATE meta SET value = 1 WHERE key = 'task_uploads_filled'")
+        # contadores de filas de store_stats: se cuentan una sola vez (base sin la clave)
+        for table in STATS_TABLES:
+            conn.execute(
+                f"INSERT INTO meta (key, value) SELECT :key, (SELECT COUNT(*) FROM {table}) "
+                "WHERE NOT EXISTS (SELECT 1 FROM meta WHERE key = :key)",
+                {"key": f"rows_{table}"},
+            )
+    conn.executescript(_POST_SCHEMA)
+    has_latest = conn.execute("SELECT 1 FROM latest_events LIMIT 1").fetchone()
+    has_events = conn.execute("SELECT 1 FROM events WHERE unique_key > '' LIMIT 1").fetchone()
+    if has_events and not has_latest:
+        rebuild_latest(conn)
+    # no alcanza con "events_geo vacía": un evento nuevo la llena aunque falte el resto
+    if not conn.execute("SELECT value FROM meta WHERE key = 'geo_indexed'").fetchone()[0]:
+        rebuild_geo(conn)
+
+
+def _conn() -> sqlite3.Connection:
+    """
+    Una conexión por thread (FastAPI corre los handlers sync en un threadpool)
+    y por proceso (no se comparte una conexión heredada por fork).
+    """
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                _init_schema(conn)
+                migrate_json(conn)
+                _initialized = True
+    return conn
+
+
+@contextmanager
+def _tx(conn: sqlite3.Connection, mode: str = "IMMEDIATE"):
+    """
+    Transacción explícita. IMMEDIATE toma el lock de escritura al empezar:
+    entre threads y entre procesos (uvicorn --workers N) los escritores se
+    encolan en el lock de SQLite (busy timeout) en vez de pisarse.
+    DEFERRED sirve para lecturas con snapshot consistente.
+    """
+    conn.execute(f"BEGIN {mode}")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+def _write():
+    return _tx(_conn())
+
+
+def _insert_sql(table: str, cols) -> str:
+    return f"INSERT OR IGNORE INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})"
+
+
+def _values(row: Dict[str, Any], cols) -> tuple:
+    return tuple(row.get(c) for c in cols)
+
+
+def _bump_seq(conn: sqlite3.Connection) -> int:
+    """
+    Avanza la secuencia monótona de cambios del tablero.
+    Debe llamarse dentro de una transacción de escritura (el UPDATE toma el lock).
+    """
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'change_seq'")
+    return conn.execute("SELECT value FROM meta WHERE key = 'change_seq'").fetchone()[0]
+
+
+def _bump_uploads_gen(conn: sqlite3.Connection) -> None:
+    # dentro de la misma transacción que modifica uploads
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'uploads_gen'")
+
+
+def _add_rows(conn: sqlite3.Connection, **delta: int) -> None:
+    """Ajusta los contadores de filas por tabla (store_stats), en la transacción de la escritura."""
+    conn.executemany(
+        "UPDATE meta SET value = value + ? WHERE key = ?", [(n, f"rows_{t}") for t, n in delta.items() if n]
+    )
+
+
+def _recount(conn: sqlite3.Connection, *tables: str) -> None:
+    # después de reconstruir una tabla entera (ya es O(n): un COUNT más no cambia nada)
+    for t in tables:
+        conn.execute(f"UPDATE meta SET value = (SELECT COUNT(*) FROM {t}) WHERE key = ?", (f"rows_{t}",))
+
+
+def _filters(alias: str, **eq) -> tuple[List[str], List[Any]]:
+    """Condiciones `col = ?` para los filtros que vinieron (None / "" = sin filtro)."""
+    where, params = [], []
+    for col, v in eq.items():
+        if v is None or v == "":
+            continue
+        where.append(f"{alias}.{col} = ?")
+        params.append(str(v).strip())
+    return where, params
+
+
+def _time_range(col: str, from_time: str | None, to_time: str | None) -> tuple[List[str], List[Any]]:
+    # las horas se guardan en ISO UTC: el orden de texto es el orden temporal
+    where, params = [], []
+    if from_time:
+        where.append(f"{col} >= ?")
+        params.append(from_time)
+    if to_time:
+        where.append(f"{col} < ?")
+        params.append(to_time)
+    return where, params
+
+
+def _upload_dict(r: sqlite3.Row) -> Dict[str, Any]:
+    d = dict(r)
+    d["active"] = bool(d.get("active"))
+    return d
+
+
+# -----------------------------
+# Compactación
+# -----------------------------
+def compact(idle_s: float = COMPACT_INTERVAL_S) -> None:
+    """
+    Pliega el WAL en la base con un checkpoint PASSIVE (no espera ni frena a
+    nadie) y, si quedaron páginas libres por borrados (de cualquier worker),
+    las devuelve al sistema. El WAL se trunca solo si pasó WAL_TRUNCATE_BYTES
+    y nadie escribió en los últimos `idle_s` segundos.
+    """
+    conn = _conn()
+    if conn.execute("PRAGMA freelist_count").fetchone()[0]:
+        # executescript: con execute el pragma libera una sola página por llamada
+        conn.executescript("PRAGMA incremental_vacuum")
+    conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+    try:
+        st = os.stat(DB_PATH + "-wal")
+    except FileNotFoundError:
+        return
+    if st.st_size > WAL_TRUNCATE_BYTES and time.time() - st.st_mtime >= idle_s:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def _own_compactor_lock() -> bool:
+    # flock no bloqueante: si el worker que lo tenía muere, lo toma otro
+    global _compact_lock_fd
+    if _compact_lock_fd is not None:
+        return True
+    fd = os.open(COMPACT_LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    _compact_lock_fd = fd
+    return True
+
+
+def _release_compactor_lock() -> None:
+    global _compact_lock_fd
+    if _compact_lock_fd is not None:
+        os.close(_compact_lock_fd)
+        _compact_lock_fd = None
+
+
+def _compactor_loop(interval: float) -> None:
+    while not _compactor_stop.wait(interval):
+        try:
+            if _own_compactor_lock():
+                compact(interval)
+        except sqlite3.OperationalError:
+            # base ocupada: se reintenta en la próxima vuelta
+            pass
+
+
+def start_compactor(interval: float = COMPACT_INTERVAL_S) -> None:
+    global _compactor
+    if _compactor is not None and _compactor.is_alive():
+        return
+    _compactor_stop.clear()
+    _compactor = threading.Thread(target=_compactor_loop, args=(interval,), name="local-db-compactor", daemon=True)
+    _compactor.start()
+
 
+def stop_compactor() -> None:
+    _compactor_stop.set()
+    if _compactor is not None:
+        _compactor.join(timeout=5)
+    _release_compactor_lock()
+
+
+# -----------------------------
+# Migración desde JSON
+# -----------------------------
 def _load(path):
-    if not os.path.exists(path):
-        return []
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    # None si no está (o si otro worker lo acaba de migrar y renombrar)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
 
 
-def _save(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def migrate_json(conn: sqlite3.Connection | None = None) -> Dict[str, int]:
+    """
+    Importa (una sola vez) uploads.json / tasks.json / events.json a SQLite.
+    Cada archivo migrado se renombra a *.migrated para no volver a leerlo.
+    Se lee dentro de la transacción: si dos workers migran a la vez, el
+    segundo espera el lock y ya no encuentra el archivo.
+    """
+    conn = conn or _conn()
+    sources = [
+        (UPLOADS_REG, "uploads", UPLOAD_COLS),
+        (TASKS, "tasks", TASK_COLS),
+        (EVENTS, "events", EVENT_COLS),
+    ]
+    out = {}
+    for path, table, cols in sources:
+        if not os.path.exists(path):
+            continue
+        with _tx(conn):
+            rows = _load(path)
+            if rows is None:
+                continue
+            if table == "uploads":
+                for u in rows:
+                    u["active"] = 1 if u.get("active", True) else 0
+            cur = conn.executemany(_insert_sql(table, cols), [_values(r, cols) for r in rows])
+            _add_rows(conn, **{table: cur.rowcount})
+            if table == "tasks":
+                conn.execute(_FILL_TASK_UPLOADS)
+            if table == "uploads":
+                _bump_uploads_gen(conn)
+        try:
+            os.replace(path, path + ".migrated")
+        except FileNotFoundError:
+            # otro worker lo renombró después de su commit (INSERT OR IGNORE: sin duplicados)
+            pass
+        out[table] = len(rows)
+    if out:
+        rebuild_latest(conn)
+        rebuild_geo(conn)
+    return out
 
 
 # -----------------------------
 # Uploads registry
 # -----------------------------
-def list_uploads() -> List[Dict[str, Any]]:
-    uploads = _load(UPLOADS_REG)
+def _load_uploads() -> Dict[str, Any]:
     # orden más nuevo primero
-    uploads.sort(key=lambda x: x.get("uploaded_at", ""), reverse=True)
-    return uploads
+    rows = [_upload_dict(r) for r in _conn().execute("SELECT * FROM uploads ORDER BY uploaded_at DESC")]
+    return {
+        "rows": rows,
+        "by_id": {r["upload_id"]: r for r in rows},
+        "active": frozenset(r["upload_id"] for r in rows if r["active"]),
+        # mismo contenido subido dos veces: vale el más nuevo
+        "by_sha256": {r["content_sha256"]: r for r in reversed(rows) if r.get("content_sha256")},
+    }
+
+
+# El registro cambia pocas veces por día: se lee entero y se reusa mientras
+# no cambie meta.uploads_gen (una lectura por clave primaria por pedido).
+_uploads = cache.GenerationCache(_load_uploads)
+
+
+def _uploads_snapshot() -> Dict[str, Any]:
+    return _uploads.get(uploads_generation())
+
+
+def list_uploads() -> List[Dict[str, Any]]:
+    return [dict(r) for r in _uploads_snapshot()["rows"]]
 
 
 def get_upload(upload_id: str) -> Dict[str, Any] | None:
-    uploads = _load(UPLOADS_REG)
-    for u in uploads:
-        if u.get("upload_id") == upload_id:
-            return u
-    return None
+    r = _uploads_snapshot()["by_id"].get(upload_id)
+    return dict(r) if r else None
+
+
+def find_upload_by_sha256(content_sha256: str) -> Dict[str, Any] | None:
+    """Upload ya importado con exactamente el mismo contenido (o None)."""
+    r = _uploads_snapshot()["by_sha256"].get(content_sha256)
+    return dict(r) if r else None
+
+
+def active_upload_ids() -> frozenset:
+    return _uploads_snapshot()["active"]
 
 
 def create_upload(upload_row: Dict[str, Any]) -> None:
-    uploads = _load(UPLOADS_REG)
-    uploads.append(upload_row)
-    _save(UPLOADS_REG, uploads)
+    row = dict(upload_row)
+    row["active"] = 1 if row.get("active", True) else 0
+    with _write() as conn:
+        cur = conn.execute(_insert_sql("uploads", UPLOAD_COLS), _values(row, UPLOAD_COLS))
+        _add_rows(conn, uploads=cur.rowcount)
+        _bump_uploads_gen(conn)
+
+
+def update_upload(upload_id: str, **fields) -> bool:
+    """Actualiza campos del registro de un upload (p.ej. rows_imported al terminar)."""
+    cols = [c for c in fields if c in UPLOAD_COLS and c != "upload_id"]
+    if not cols:
+        return False
+    with _write() as conn:
+        cur = conn.execute(
+            f"UPDATE uploads SET {', '.join(c + ' = ?' for c in cols)} WHERE upload_id = ?",
+            (*[fields[c] for c in cols], upload_id),
+        )
+        if cur.rowcount > 0:
+            _bump_uploads_gen(conn)
+    return cur.rowcount > 0
 
 
 def set_upload_active(upload_id: str, active: bool) -> bool:
-    uploads = _load(UPLOADS_REG)
-    changed = False
-    for u in uploads:
-        if u.get("upload_id") == upload_id:
-            u["active"] = bool(active)
-            changed = True
-            break
-    if changed:
-        _save(UPLOADS_REG, uploads)
-    return changed
+    with _write() as conn:
+        cur = conn.execute(
+            "UPDATE uploads SET active = ? WHERE upload_id = ?",
+            (1 if active else 0, upload_id),
+        )
+        if cur.rowcount > 0:
+            _bump_uploads_gen(conn)
+            # las tareas que también vienen en otro upload activo siguen visibles (cambian de dueño)
+            _touch_tasks(conn, "SELECT task_id FROM task_uploads WHERE upload_id = ?", (upload_id,))
+            _reassign_tasks(conn, _bump_seq(conn))
+    return cur.rowcount > 0
 
 
-def delete_upload(upload_id: str) -> Dict[str, Any] | None:
+def _touch_tasks(conn: sqlite3.Connection, select_sql: str, params=()) -> None:
+    """Deja en la tabla temporal _touched (de esta conexión) las tareas que devuelve select_sql."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _touched (task_id TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM _touched")
+    conn.execute(f"INSERT OR IGNORE INTO _touched {select_sql}", params)
+
+
+def _reassign_tasks(conn: sqlite3.Connection, seq: int) -> None:
     """
-    Borra:
-      - el upload del registro
-      - el archivo físico si existe
-      - tareas asociadas
-      - eventos asociados a esas tareas
+    Recalcula el dueño de las tareas de _touched entre los uploads que las
+    traen (el más nuevo de los activos; si no hay activos, el más nuevo) y
+    lleva el cambio a su fila del tablero. Misma transacción que el cambio
+    de uploads que lo provocó.
     """
-    uploads = _load(UPLOADS_REG)
-    target = None
-    keep = []
+    conn.execute(_REASSIGN_TASKS_SQL)
+    conn.execute(_RETARGET_TOUCHED_SQL, {"seq": seq})
 
-    for u in uploads:
-        if u.get("upload_id") == upload_id:
-            target = u
-        else:
-            keep.append(u)
 
-    if target is None:
+# backfill de task_uploads (bases anteriores / migración): solo se conoce el dueño
+_FILL_TASK_UPLOADS = """
+INSERT OR IGNORE INTO task_uploads (upload_id, task_id)
+SELECT upload_id, task_id FROM tasks WHERE upload_id IS NOT NULL AND upload_id <> ''
+"""
+
+_REASSIGN_TASKS_SQL = """
+UPDATE tasks SET (upload_id, source_file) = (
+    SELECT m.upload_id, u.filename FROM task_uploads m
+    JOIN uploads u ON u.upload_id = m.upload_id
+    WHERE m.task_id = tasks.task_id
+    ORDER BY u.active DESC, u.uploaded_at DESC
+    LIMIT 1
+)
+WHERE task_id IN (SELECT task_id FROM _touched)
+  AND EXISTS (
+    SELECT 1 FROM task_uploads m JOIN uploads u ON u.upload_id = m.upload_id WHERE m.task_id = tasks.task_id
+  )
+"""
+
+# el tablero toma dueño y visibilidad de la tarea (solo las filas que cambian)
+_RETARGET_TOUCHED_SQL = """
+UPDATE latest_events SET upload_id = x.upload_id, active = x.active, seq = :seq
+FROM (
+    SELECT t.unique_key, t.upload_id,
+           CASE WHEN t.upload_id IS NULL OR t.upload_id = '' OR u.active = 1 THEN 1 ELSE 0 END AS active
+    FROM tasks t LEFT JOIN uploads u ON u.upload_id = t.upload_id
+    WHERE t.task_id IN (SELECT task_id FROM _touched)
+) x
+WHERE latest_events.unique_key = x.unique_key
+  AND (latest_events.upload_id IS NOT x.upload_id OR latest_events.active IS NOT x.active)
+"""
+
+
+# tareas de _touched que no quedaron en ningún otro upload (se borran con su historial)
+_ORPHAN_TASKS = """
+SELECT task_id FROM _touched d
+WHERE NOT EXISTS (SELECT 1 FROM task_uploads m WHERE m.task_id = d.task_id)
+"""
+
+
+def _detach_upload(conn: sqlite3.Connection, upload_id: str) -> Dict[str, Any] | None:
+    """
+    Saca el upload (dentro de la transacción de conn):
+      - el upload del registro y su pertenencia en task_uploads
+      - las tareas que SOLO venían en él, con sus eventos (y su fila del
+        tablero -> tombstone) y su rastro geográfico
+      - las tareas que también vienen en otro upload se quedan: pasan a
+        ese upload (dueño, source_file, visibilidad en el tablero)
+    Cada DELETE va por índice (upload_id -> task_id -> eventos): el costo
+    depende del tamaño del upload, no de la base.
+    """
+    p = {"upload_id": upload_id}
+    r = conn.execute("SELECT * FROM uploads WHERE upload_id = :upload_id", p).fetchone()
+    if r is None:
         return None
+    target = _upload_dict(r)
+
+    _touch_tasks(conn, "SELECT task_id FROM task_uploads WHERE upload_id = :upload_id", p)
+    conn.execute("DELETE FROM task_uploads WHERE upload_id = :upload_id", p)
+    conn.execute("DELETE FROM uploads WHERE upload_id = :upload_id", p)
+    _bump_uploads_gen(conn)
+    removed = {"uploads": 1}
+
+    seq = _bump_seq(conn)
+    conn.execute(
+        "INSERT OR REPLACE INTO latest_tombstones (unique_key, seq) "
+        f"SELECT unique_key, :seq FROM latest_events WHERE task_id IN ({_ORPHAN_TASKS})",
+        {"seq": seq},
+    )
+    cur = conn.execute(f"DELETE FROM latest_events WHERE task_id IN ({_ORPHAN_TASKS})")
+    removed["latest_events"] = cur.rowcount
 
-    _save(UPLOADS_REG, keep)
+    # índice espacial y derivados (antes de borrar los eventos: id = rowid)
+    conn.execute(f"DELETE FROM events_geo WHERE id IN (SELECT rowid FROM events WHERE task_id IN ({_ORPHAN_TASKS}))")
+    conn.execute(f"DELETE FROM task_locations WHERE task_id IN ({_ORPHAN_TASKS})")
+    cur = conn.execute(f"DELETE FROM geo_flags WHERE task_id IN ({_ORPHAN_TASKS})")
+    removed["geo_flags"] = cur.rowcount
+    moved = [
+        r["cuadrilla"]
+        for r in conn.execute(f"SELECT cuadrilla FROM cuadrilla_positions WHERE task_id IN ({_ORPHAN_TASKS})")
+    ]
+
+    cur = conn.execute(f"DELETE FROM events WHERE task_id IN ({_ORPHAN_TASKS})")
+    removed["events"] = cur.rowcount
+    cur = conn.execute(f"DELETE FROM tasks WHERE task_id IN ({_ORPHAN_TASKS})")
+    removed["tasks"] = cur.rowcount
+    _add_rows(conn, **{t: -n for t, n in removed.items()})
+    # la última posición de esas cuadrillas pasa a ser la anterior que quede
+    _refresh_positions(conn, moved)
+
+    _reassign_tasks(conn, seq)
+    return target
+
+
+def delete_upload(upload_id: str) -> Dict[str, Any] | None:
+    """
+    Borra el upload en UNA transacción (todo o nada; ver _detach_upload).
+    El archivo físico se borra recién después del commit; el espacio lo
+    recupera el compactador.
+    """
+    with _write() as conn:
+        target = _detach_upload(conn, upload_id)
+    if target is None:
+        return None
 
     # borrar archivo físico
     file_path = target.get("path")
@@ -92,129 +753,897 @@ def delete_upload(upload_id: str) -> Dict[str, Any] | None:
         except Exception:
             pass
 
-    # borrar tareas y eventos asociados
-    removed_task_ids = _delete_tasks_by_upload(upload_id)
-    _delete_events_by_task_ids(removed_task_ids)
-
     return target
 
 
-def _active_upload_ids_set() -> set:
-    uploads = _load(UPLOADS_REG)
-    return {u.get("upload_id") for u in uploads if u.get("active", True) and u.get("upload_id")}
+def discard_import(upload_id: str) -> bool:
+    """
+    Deshace un import que falló a mitad de camino: se van las tareas que
+    insertó (solo venían en este upload) y las que actualizó vuelven a su
+    upload anterior, con su historial intacto. El archivo lo borra jobs.
+    """
+    with _write() as conn:
+        target = _detach_upload(conn, upload_id)
+    return target is not None
 
 
 # -----------------------------
 # Tasks
 # -----------------------------
 def upsert_tasks(rows: List[Dict[str, Any]]) -> int:
-    tasks = _load(TASKS)
-    added = 0
+    return _upsert_tasks([_values(r, TASK_COLS) for r in rows])
+
+
+def upsert_task_batch(batch: Dict[str, list]) -> int:
+    """Igual que upsert_tasks, pero recibe un lote columnar ({campo: lista})."""
+    return _upsert_tasks(list(zip(*(batch[c] for c in TASK_COLS))))
+
+
+_UPSERT_TASK_SQL = f"""
+INSERT INTO tasks ({', '.join(TASK_COLS)}) VALUES ({', '.join('?' for _ in TASK_COLS)})
+ON CONFLICT(unique_key) DO UPDATE SET
+    source_file = excluded.source_file,
+    upload_id = excluded.upload_id,
+    updated_at = excluded.updated_at
+"""
+
+# si la tarea cambió de upload, la fila del tablero pasa a depender del nuevo
+_RETARGET_LATEST_SQL = """
+UPDATE latest_events
+SET upload_id = :upload_id,
+    active = CASE
+        WHEN :upload_id IS NULL OR :upload_id = '' THEN 1
+        ELSE COALESCE((SELECT active FROM uploads WHERE upload_id = :upload_id), 0)
+    END,
+    seq = -1
+WHERE unique_key = :unique_key AND upload_id IS NOT :upload_id
+"""
+
+
+@metrics.timed("store_upsert")
+def _upsert_tasks(values: List[tuple]) -> int:
+    """
+    Upsert por unique_key (índice único => O(1) por fila): si ya existe,
+    actualiza source_file / upload_id / updated_at como el MERGE de BigQuery.
+    El upload anterior no la pierde: queda anotado en task_uploads, así que
+    borrar o dar de baja el upload nuevo la devuelve al anterior.
+    Devuelve filas insertadas + actualizadas.
+    """
+    if not values:
+        return 0
+    iu = TASK_COLS.index("unique_key")
+    iup = TASK_COLS.index("upload_id")
 
-    for r in rows:
-        # no duplicar por unique_key
-        if not any(t.get("unique_key") == r.get("unique_key") for t in tasks):
-            tasks.append(r)
-            added += 1
+    with _write() as conn:
+        # las filas nuevas toman rowid = máximo + 1: la diferencia son las insertadas
+        max_rowid = "SELECT COALESCE(MAX(rowid), 0) FROM tasks"
+        first = conn.execute(max_rowid).fetchone()[0]
+        before = conn.total_changes
+        conn.executemany(_UPSERT_TASK_SQL, values)
+        affected = conn.total_changes - before
+        inserted = conn.execute(max_rowid).fetchone()[0] - first
+        _add_rows(conn, tasks=inserted)
+        # por task_id de la fila guardada (si ya existía, el task_id que llega puede ser otro)
+        conn.executemany(
+            "INSERT OR IGNORE INTO task_uploads (upload_id, task_id) SELECT ?, task_id FROM tasks WHERE unique_key = ?",
+            [(v[iup], v[iu]) for v in values if v[iup]],
+        )
 
-    _save(TASKS, tasks)
-    return added
+        before = conn.total_changes
+        conn.executemany(
+            _RETARGET_LATEST_SQL,
+            [{"unique_key": v[iu], "upload_id": v[iup]} for v in values],
+        )
+        if conn.total_changes > before:
+            conn.execute("UPDATE latest_events SET seq = ? WHERE seq = -1", (_bump_seq(conn),))
+    metrics.TASK_ROWS.inc("inserted", n=inserted)
+    metrics.TASK_ROWS.inc("updated", n=len(values) - inserted)
+    return affected
 
 
 def list_tasks_by_cuadrilla(cuadrilla: str) -> List[Dict[str, Any]]:
-    tasks = _load(TASKS)
-    cuadrilla_norm = str(cuadrilla).strip()
-    active_ids = _active_upload_ids_set()
+    return tasks_page(cuadrilla)["rows"]
 
-    out = []
-    for t in tasks:
-        if str(t.get("cuadrilla", "")).strip() != cuadrilla_norm:
-            continue
-        # si la tarea viene de un upload inactivo, NO se muestra
-        upload_id = t.get("upload_id")
-        if upload_id and upload_id not in active_ids:
-            continue
-        out.append(t)
 
-    return out
+def tasks_page(
+    cuadrilla: str,
+    limit: int | None = None,
+    after: str | None = None,
+    contratista: str | None = None,
+    status: str | None = None,
+    upload_id: str | None = None,
+) -> Dict[str, Any]:
+    """
+    Tareas de la cuadrilla de a `limit`, en orden de importación.
+    Keyset sobre rowid (el índice de cuadrilla ya lo incluye): cada página
+    arranca donde terminó la anterior, sin OFFSET.
+    """
+    # si la tarea viene de un upload inactivo, NO se muestra
+    where = ["trim(t.cuadrilla) = ?", "(t.upload_id IS NULL OR t.upload_id = '' OR u.active = 1)"]
+    params: List[Any] = [str(cuadrilla).strip()]
 
+    w, p = _filters("t", contratista=contratista, status=status)
+    where += w
+    params += p
+    if upload_id:
+        # cualquier upload que traiga la tarea, no solo el dueño
+        where.append("t.task_id IN (SELECT task_id FROM task_uploads WHERE upload_id = ?)")
+        params.append(upload_id.strip())
 
-def get_task(task_id: str) -> Dict[str, Any] | None:
-    tasks = _load(TASKS)
-    for t in tasks:
-        if t.get("task_id") == task_id:
-            return t
-    return None
+    key = paging.decode_cursor(after, 1)
+    if key:
+        where.append("t.rowid > ?")
+        params.append(key[0])
 
+    sql = f"""
+        SELECT t.rowid AS _rowid, t.* FROM tasks t
+        LEFT JOIN uploads u ON u.upload_id = t.upload_id
+        WHERE {" AND ".join(where)}
+        ORDER BY t.rowid
+    """
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
 
-def _delete_tasks_by_upload(upload_id: str) -> List[str]:
-    tasks = _load(TASKS)
-    keep = []
-    removed_ids = []
+    rows = [dict(r) for r in _conn().execute(sql, params)]
+    out = paging.page(rows, limit, lambda r: [r["_rowid"]])
+    for r in out["rows"]:
+        r.pop("_rowid")
+    return out
 
-    for t in tasks:
-        if t.get("upload_id") == upload_id:
-            removed_ids.append(t.get("task_id"))
-        else:
-            keep.append(t)
 
-    _save(TASKS, keep)
-    return [x for x in removed_ids if x]
+def get_task(task_id: str) -> Dict[str, Any] | None:
+    r = _conn().execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+    return dict(r) if r else None
 
 
 # -----------------------------
 # Events
 # -----------------------------
+_LATEST_COLS = tuple(c for c in EVENT_COLS if c != "unique_key")
+
+
+# Group commit: los inserts concurrentes de eventos se juntan en una sola
+# transacción (un solo fsync) escrita por un thread dedicado por proceso.
+EVENT_GROUP_MAX = 256
+
+_event_q: "queue.Queue[tuple[Dict[str, Any], Future]]" = queue.Queue()
+_event_writer: threading.Thread | None = None
+_event_writer_pid: int | None = None
+_event_writer_lock = threading.Lock()
+
+
 def insert_event(row: Dict[str, Any]) -> bool:
-    events = _load(EVENTS)
-    events.append(row)
-    _save(EVENTS, events)
+    """Encola el evento y espera a que su grupo quede confirmado en disco."""
+    _ensure_event_writer()
+    fut: Future = Future()
+    _event_q.put((row, fut))
+    fut.result()
+    return True
+
+
+def _ensure_event_writer() -> None:
+    global _event_writer
+    if _event_writer is not None and _event_writer.is_alive() and _event_writer_pid == os.getpid():
+        return
+    with _event_writer_lock:
+        if _event_writer is None or not _event_writer.is_alive() or _event_writer_pid != os.getpid():
+            _start_event_writer()
+
+
+def _start_event_writer() -> None:
+    global _event_writer, _event_writer_pid
+    _event_writer = threading.Thread(target=_event_writer_loop, name="local-db-event-writer", daemon=True)
+    _event_writer_pid = os.getpid()
+    _event_writer.start()
+
+
+def _event_writer_loop() -> None:
+    while True:
+        group = [_event_q.get()]
+        # todo lo que llegó mientras se escribía el grupo anterior va junto
+        while len(group) < EVENT_GROUP_MAX:
+            try:
+                group.append(_event_q.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _write_events([row for row, _ in group])
+        except Exception:
+            # si el grupo falla, se reintenta de a uno para aislar la fila con problema
+            for row, fut in group:
+                try:
+                    _write_events([row])
+                except Exception as e:
+                    fut.set_exception(e)
+                else:
+                    fut.set_result(True)
+        else:
+            for _, fut in group:
+                fut.set_result(True)
+
+
+def insert_events(rows: List[Dict[str, Any]]) -> int:
+    """
+    Inserta un lote de eventos en UNA transacción (todo o nada).
+    Los event_id repetidos se ignoran (reenvíos). Devuelve cuántos eran nuevos.
+    """
+    return _write_events(rows)
+
+
+@metrics.timed("event_insert")
+def _write_events(rows: List[Dict[str, Any]]) -> int:
+    inserted = latest = flagged = 0
+    with _write() as conn:
+        for row in rows:
+            cur = conn.execute(_insert_sql("events", EVENT_COLS), _values(row, EVENT_COLS))
+            if cur.rowcount == 0:
+                # ya estaba (mismo event_id): no toca el tablero
+                continue
+            inserted += 1
+            if row.get("unique_key"):
+                latest += _update_latest(conn, row)
+            if row.get("lat") is not None and row.get("lon") is not None:
+                flagged += _update_geo(conn, cur.lastrowid, row)
+        _add_rows(conn, events=inserted, latest_events=latest, geo_flags=flagged)
+    metrics.EVENTS.inc("inserted", n=inserted)
+    metrics.EVENTS.inc("duplicate", n=len(rows) - inserted)
+    return inserted
+
+
+def _update_latest(conn: sqlite3.Connection, row: Dict[str, Any]) -> bool:
+    """
+    Actualiza la fila de latest_events si el evento es más nuevo que el que hay.
+    El upload (y si está activo) se toma de la tarea dueña del unique_key.
+    Devuelve True si el unique_key no tenía fila (una fila más en la tabla).
+    """
+    new = conn.execute("SELECT 1 FROM latest_events WHERE unique_key = ?", (row["unique_key"],)).fetchone() is None
+    t = conn.execute(
+        """
+        SELECT t.upload_id, u.active FROM tasks t
+        LEFT JOIN uploads u ON u.upload_id = t.upload_id
+        WHERE t.unique_key = ?
+        """,
+        (row["unique_key"],),
+    ).fetchone()
+    upload_id = t["upload_id"] if t else None
+    active = 1 if not upload_id or (t["active"] == 1) else 0
+
+    seq = _bump_seq(conn)
+    sets = ", ".join(f"{c} = excluded.{c}" for c in _LATEST_COLS)
+    conn.execute(
+        f"""
+        INSERT INTO latest_events (unique_key, {', '.join(_LATEST_COLS)}, upload_id, active, seq)
+        VALUES (?, {', '.join('?' for _ in _LATEST_COLS)}, ?, ?, ?)
+        ON CONFLICT(unique_key) DO UPDATE SET {sets},
+            upload_id = excluded.upload_id, active = excluded.active, seq = excluded.seq
+        WHERE COALESCE(excluded.event_time, '') > COALESCE(latest_events.event_time, '')
+        """,
+        (row["unique_key"], *_values(row, _LATEST_COLS), upload_id, active, seq),
+    )
+    conn.execute("DELETE FROM latest_tombstones WHERE unique_key = ?", (row["unique_key"],))
+    return new
+
+
+def rebuild_latest(conn: sqlite3.Connection | None = None) -> None:
+    """Recalcula latest_events desde cero (migración / reparación)."""
+    conn = conn or _conn()
+    cols = ", ".join(_LATEST_COLS)
+    with _tx(conn):
+        seq = _bump_seq(conn)
+        conn.execute("DELETE FROM latest_events")
+        conn.execute("DELETE FROM latest_tombstones")
+        # SQLite toma las columnas "sueltas" de la fila que tiene el MAX()
+        conn.execute(
+            f"""
+            INSERT INTO latest_events (unique_key, {cols}, upload_id, active, seq)
+            SELECT e.unique_key, {', '.join('e.' + c for c in _LATEST_COLS)}, t.upload_id,
+                   CASE WHEN t.upload_id IS NULL OR t.upload_id = '' OR u.active = 1 THEN 1 ELSE 0 END,
+                   :seq
+            FROM (
+                SELECT *, MAX(event_time) AS _max_time FROM events
+                WHERE unique_key IS NOT NULL AND unique_key <> ''
+                GROUP BY unique_key
+            ) e
+            LEFT JOIN tasks t ON t.unique_key = e.unique_key
+            LEFT JOIN uploads u ON u.upload_id = t.upload_id
+            """,
+            {"seq": seq},
+        )
+        _recount(conn, "latest_events")
+
+
+_POSITION_COLS = ("cuadrilla", "event_id", "task_id", "event_type", "event_time", "lat", "lon", "accuracy_m")
+_FLAG_COLS = ("event_id", "task_id", "cuadrilla", "event_type", "event_time", "lat", "lon", "distance_m")
+
+
+def _update_geo(conn: sqlite3.Connection, rowid: int, row: Dict[str, Any]) -> bool:
+    """
+    Mantiene lo geográfico del evento recién insertado (misma transacción):
+      - el punto en el R*Tree
+      - la última posición de la cuadrilla (si el evento es más nuevo)
+      - la ubicación habitual de la tarea, o la marca si cae lejos de ella
+    Devuelve True si el check-in quedó marcado.
+    """
+    lat, lon = row["lat"], row["lon"]
+    conn.execute(
+        "INSERT INTO events_geo (id, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)",
+        (rowid, lat, lat, lon, lon),
+    )
+
+    cuadrilla = (row.get("cuadrilla") or "").strip()
+    if cuadrilla:
+        sets = ", ".join(f"{c} = excluded.{c}" for c in _POSITION_COLS[1:])
+        conn.execute(
+            f"""
+            INSERT INTO cuadrilla_positions ({', '.join(_POSITION_COLS)})
+            VALUES ({', '.join('?' for _ in _POSITION_COLS)})
+            ON CONFLICT(cuadrilla) DO UPDATE SET {sets}
+            WHERE COALESCE(excluded.event_time, '') >= COALESCE(cuadrilla_positions.event_time, '')
+            """,
+            (cuadrilla, *_values(row, _POSITION_COLS[1:])),
+        )
+
+    task_id = row.get("task_id")
+    if not task_id:
+        return False
+    loc = conn.execute("SELECT n, lat, lon FROM task_locations WHERE task_id = ?", (task_id,)).fetchone()
+    if loc is not None and loc["n"] >= geo.GEO_MIN_SAMPLES:
+        d = geo.haversine_m(loc["lat"], loc["lon"], lat, lon)
+        if geo.is_far(d, row.get("accuracy_m")):
+            # el check-in lejano se marca y no corre la ubicación habitual
+            conn.execute(
+                f"INSERT OR REPLACE INTO geo_flags ({', '.join(_FLAG_COLS)}) VALUES ({', '.join('?' for _ in _FLAG_COLS)})",
+                (*_values(row, _FLAG_COLS[:-1]), d),
+            )
+            return True
+    if loc is None:
+        conn.execute("INSERT INTO task_locations (task_id, n, lat, lon) VALUES (?, 1, ?, ?)", (task_id, lat, lon))
+    else:
+        # promedio incremental: no hace falta releer los check-ins anteriores
+        n = loc["n"] + 1
+        conn.execute(
+            "UPDATE task_locations SET n = ?, lat = ?, lon = ? WHERE task_id = ?",
+            (n, loc["lat"] + (lat - loc["lat"]) / n, loc["lon"] + (lon - loc["lon"]) / n, task_id),
+        )
+    return False
+
+
+def _refresh_positions(conn: sqlite3.Connection, cuadrillas: List[str]) -> None:
+    """Recalcula la última posición de esas cuadrillas (índice ix_events_cuadrilla)."""
+    for c in cuadrillas:
+        conn.execute("DELETE FROM cuadrilla_positions WHERE cuadrilla = ?", (c,))
+        conn.execute(
+            f"""
+            INSERT INTO cuadrilla_positions ({', '.join(_POSITION_COLS)})
+            SELECT trim(cuadrilla), {', '.join(_POSITION_COLS[1:])} FROM events
+            WHERE trim(cuadrilla) = ? AND lat IS NOT NULL AND lon IS NOT NULL
+            ORDER BY event_time DESC LIMIT 1
+            """,
+            (c,),
+        )
+
+
+def rebuild_geo(conn: sqlite3.Connection | None = None) -> None:
+    """
+    Recalcula el índice espacial y sus derivados desde events (migración /
+    reparación). Las marcas se rehacen recorriendo los check-ins en orden,
+    igual que si llegaran de nuevo.
+    """
+    conn = conn or _conn()
+    coords = "lat IS NOT NULL AND lon IS NOT NULL"
+    with _tx(conn):
+        for table in ("events_geo", "cuadrilla_positions", "task_locations", "geo_flags"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"INSERT INTO events_geo SELECT rowid, lat, lat, lon, lon FROM events WHERE {coords}")
+        conn.execute(
+            f"""
+            INSERT INTO cuadrilla_positions ({', '.join(_POSITION_COLS)})
+            SELECT trim(cuadrilla), event_id, task_id, event_type, MAX(event_time), lat, lon, accuracy_m
+            FROM events WHERE {coords} AND trim(cuadrilla) <> ''
+            GROUP BY trim(cuadrilla)
+            """
+        )
+
+        locs: Dict[str, list] = {}
+        flags = []
+        cur = conn.cursor()
+        cur.row_factory = None
+        rows = cur.execute(
+            f"SELECT {', '.join(_FLAG_COLS[:-1])}, accuracy_m FROM events "
+            f"WHERE {coords} AND task_id IS NOT NULL ORDER BY task_id, event_time"
+        )
+        for r in rows:
+            task_id, lat, lon = r[1], r[5], r[6]
+            loc = locs.get(task_id)
+            if loc is not None and loc[0] >= geo.GEO_MIN_SAMPLES:
+                d = geo.haversine_m(loc[1], loc[2], lat, lon)
+                if geo.is_far(d, r[7]):
+                    flags.append((*r[:7], d))
+                    continue
+            if loc is None:
+                locs[task_id] = [1, lat, lon]
+            else:
+                loc[0] += 1
+                loc[1] += (lat - loc[1]) / loc[0]
+                loc[2] += (lon - loc[2]) / loc[0]
+        conn.executemany(
+            "INSERT INTO task_locations (task_id, n, lat, lon) VALUES (?, ?, ?, ?)",
+            ((k, *v) for k, v in locs.items()),
+        )
+        conn.executemany(
+            f"INSERT INTO geo_flags ({', '.join(_FLAG_COLS)}) VALUES ({', '.join('?' for _ in _FLAG_COLS)})", flags
+        )
+        _recount(conn, "geo_flags")
+        conn.execute("UPDATE meta SET value = 1 WHERE key = 'geo_indexed'")
+
+
+def set_event_photo(event_id: str, photo_url: str, thumb_url: str | None = None) -> bool:
+    """
+    Completa la foto de un evento ya guardado (la sube el pipeline de fotos
+    después de responder). Si es el último evento de su tarea, el tablero
+    recibe el cambio por la secuencia.
+    """
+    with _write() as conn:
+        cur = conn.execute(
+            "UPDATE events SET photo_url = ?, thumb_url = ? WHERE event_id = ?",
+            (photo_url, thumb_url, event_id),
+        )
+        if cur.rowcount == 0:
+            return False
+        if conn.execute("SELECT 1 FROM latest_events WHERE event_id = ?", (event_id,)).fetchone():
+            seq = _bump_seq(conn)
+            conn.execute(
+                "UPDATE latest_events SET photo_url = ?, thumb_url = ?, seq = ? WHERE event_id = ?",
+                (photo_url, thumb_url, seq, event_id),
+            )
     return True
 
 
 def list_events_by_task(task_id: str) -> List[Dict[str, Any]]:
-    events = _load(EVENTS)
-    ev = [e for e in events if e.get("task_id") == task_id]
-    ev.sort(key=lambda x: x.get("event_time", ""))
-    return ev
+    return events_page(task_id)["rows"]
 
 
-def _delete_events_by_task_ids(task_ids: List[str]) -> None:
-    if not task_ids:
-        return
-    s = set(task_ids)
-    events = _load(EVENTS)
-    keep = [e for e in events if e.get("task_id") not in s]
-    _save(EVENTS, keep)
+def events_page(
+    task_id: str,
+    limit: int | None = None,
+    after: str | None = None,
+    event_type: str | None = None,
+    from_time: str | None = None,
+    to_time: str | None = None,
+) -> Dict[str, Any]:
+    """Historial de la tarea por event_time (keyset sobre el índice task_id, event_time)."""
+    where = ["e.task_id = ?"]
+    params: List[Any] = [task_id]
+
+    w, p = _filters("e", event_type=event_type)
+    where += w
+    params += p
+    w, p = _time_range("e.event_time", from_time, to_time)
+    where += w
+    params += p
+
+    key = paging.decode_cursor(after, 2)
+    if key:
+        where.append("(e.event_time, e.event_id) > (?, ?)")
+        params += key
+
+    sql = f"SELECT e.* FROM events e WHERE {' AND '.join(where)} ORDER BY e.event_time, e.event_id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    rows = [dict(r) for r in _conn().execute(sql, params)]
+    return paging.page(rows, limit, lambda r: [r["event_time"], r["event_id"]])
+
+
+def _dashboard_filters(
+    cuadrilla: str | None = None,
+    contratista: str | None = None,
+    event_type: str | None = None,
+    upload_id: str | None = None,
+    from_time: str | None = None,
+    to_time: str | None = None,
+) -> tuple[List[str], List[Any]]:
+    where, params = _filters("l", cuadrilla=cuadrilla, event_type=event_type)
+    w, p = _time_range("l.event_time", from_time, to_time)
+    where += w
+    params += p
+    if upload_id:
+        where.append("l.task_id IN (SELECT task_id FROM task_uploads WHERE upload_id = ?)")
+        params.append(upload_id.strip())
+    if contratista:
+        # latest_events no tiene contratista: se resuelve por task_id
+        where.append("l.task_id IN (SELECT task_id FROM tasks WHERE contratista = ?)")
+        params.append(contratista.strip())
+    return where, params
 
 
 def dashboard_latest() -> List[Dict[str, Any]]:
     """
     Devuelve el último evento por unique_key,
     pero SOLO si la tarea pertenece a un upload ACTIVO.
+    Lee la vista materializada latest_events (no recorre el historial).
     """
-    events = _load(EVENTS)
-    tasks = _load(TASKS)
-    active_ids = _active_upload_ids_set()
-
-    # mapa unique_key -> upload_id (desde tasks)
-    key_to_upload = {}
-    for t in tasks:
-        uk = t.get("unique_key")
-        if uk:
-            key_to_upload[uk] = t.get("upload_id")
-
-    latest = {}
-    for e in events:
-        uk = e.get("unique_key")
-        if not uk:
-            continue
+    return dashboard_page()["rows"]
 
-        upload_id = key_to_upload.get(uk)
-        if upload_id and upload_id not in active_ids:
-            continue
 
-        if uk not in latest or e.get("event_time", "") > latest[uk].get("event_time", ""):
-            latest[uk] = e
+@metrics.timed("dashboard_compute")
+def dashboard_page(limit: int | None = None, after: str | None = None, **filters) -> Dict[str, Any]:
+    """
+    Una página del tablero, lo más reciente primero.
+    Keyset sobre (event_time, unique_key) con el índice ix_latest_events_time.
+    Filtros: cuadrilla, contratista, event_type, upload_id, from_time, to_time.
+    """
+    where, params = _dashboard_filters(**filters)
+    where.insert(0, "l.active = 1")
+
+    key = paging.decode_cursor(after, 2)
+    if key:
+        where.append("(l.event_time, l.unique_key) < (?, ?)")
+        params += key
+
+    sql = f"""
+        SELECT {', '.join('l.' + c for c in EVENT_COLS)} FROM latest_events l
+        WHERE {" AND ".join(where)}
+        ORDER BY l.event_time DESC, l.unique_key DESC
+    """
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    rows = [dict(r) for r in _conn().execute(sql, params)]
+    return paging.page(rows, limit, lambda r: [r["event_time"], r["unique_key"]])
+
+
+def dashboard_cursor() -> int:
+    """Posición actual de la secuencia de cambios del tablero."""
+    return _conn().execute("SELECT value FROM meta WHERE key = 'change_seq'").fetchone()[0]
+
+
+@metrics.timed("dashboard_compute")
+def dashboard_changes(since: int, **filters) -> Dict[str, Any]:
+    """
+    Cambios del tablero posteriores a `since`:
+      - rows: filas nuevas/actualizadas (visibles)
+      - removed: unique_keys que ya no se muestran (borradas, de uploads
+        inactivos o que dejaron de cumplir los filtros)
+      - cursor: posición para el próximo pedido
+    """
+    where, params = _dashboard_filters(**filters)
+    visible = " AND ".join(["l.active = 1"] + where)
+
+    # la lectura entera dentro de una transacción = snapshot consistente
+    with _tx(_conn(), "DEFERRED") as conn:
+        cursor = conn.execute("SELECT value FROM meta WHERE key = 'change_seq'").fetchone()[0]
+        changed = conn.execute(
+            f"""
+            SELECT {', '.join('l.' + c for c in EVENT_COLS)}, ({visible}) AS _visible
+            FROM latest_events l WHERE l.seq > ? ORDER BY l.seq
+            """,
+            (*params, since),
+        ).fetchall()
+        tombstones = conn.execute("SELECT unique_key FROM latest_tombstones WHERE seq > ?", (since,)).fetchall()
+
+    rows, removed = [], {r["unique_key"] for r in tombstones}
+    for r in changed:
+        d = dict(r)
+        if d.pop("_visible"):
+            rows.append(d)
+        else:
+            removed.add(d["unique_key"])
+    return {"rows": rows, "removed": sorted(removed), "cursor": cursor}
+
+
+# -----------------------------
+# Consultas geográficas (ver backend/geo.py)
+# -----------------------------
+def _bbox_where(min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> tuple[List[str], List[Any]]:
+    # el R*Tree guarda float32 redondeado hacia afuera: filtra por solapamiento
+    # y la coordenada exacta del evento decide el borde
+    where = [
+        "g.max_lat >= ?",
+        "g.min_lat <= ?",
+        "g.max_lon >= ?",
+        "g.min_lon <= ?",
+        "e.lat BETWEEN ? AND ?",
+        "e.lon BETWEEN ? AND ?",
+    ]
+    return where, [min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon]
+
+
+def _geo_events_sql(
+    bbox: tuple,
+    cuadrilla: str | None = None,
+    event_type: str | None = None,
+    from_time: str | None = None,
+    to_time: str | None = None,
+) -> tuple[List[str], List[Any]]:
+    where, params = _bbox_where(*bbox)
+    w, p = _filters("e", cuadrilla=cuadrilla, event_type=event_type)
+    where += w
+    params += p
+    w, p = _time_range("e.event_time", from_time, to_time)
+    where += w
+    params += p
+    return where, params
+
+
+def events_in_bbox(
+    min_lat: float,
+    max_lat: float,
+    min_lon: float,
+    max_lon: float,
+    limit: int | None = None,
+    after: str | None = None,
+    **filters,
+) -> Dict[str, Any]:
+    """
+    Eventos dentro del rectángulo, lo más reciente primero. El R*Tree
+    (events_geo) resuelve el área: el costo depende de lo que cae adentro,
+    no del total de eventos. Filtros: cuadrilla, event_type, from_time, to_time.
+    """
+    where, params = _geo_events_sql((min_lat, max_lat, min_lon, max_lon), **filters)
+    key = paging.decode_cursor(after, 2)
+    if key:
+        where.append("(e.event_time, e.event_id) < (?, ?)")
+        params += key
+
+    sql = f"""
+        SELECT e.* FROM events_geo g JOIN events e ON e.rowid = g.id
+        WHERE {' AND '.join(where)}
+        ORDER BY e.event_time DESC, e.event_id DESC
+    """
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    rows = [dict(r) for r in _conn().execute(sql, params)]
+    return paging.page(rows, limit, lambda r: [r["event_time"], r["event_id"]])
+
+
+def events_near(lat: float, lon: float, radius_m: float, limit: int | None = None, **filters) -> List[Dict[str, Any]]:
+    """Eventos a menos de `radius_m` del punto, los más cercanos primero (con distance_m)."""
+    where, params = _geo_events_sql(geo.bbox_around(lat, lon, radius_m), **filters)
+    sql = f"SELECT e.* FROM events_geo g JOIN events e ON e.rowid = g.id WHERE {' AND '.join(where)}"
+
+    out = []
+    for r in _conn().execute(sql, params):
+        d = geo.haversine_m(lat, lon, r["lat"], r["lon"])
+        if d <= radius_m:
+            out.append({**dict(r), "distance_m": d})
+    out.sort(key=lambda r: r["distance_m"])
+    return out[:limit] if limit is not None else out
+
+
+def cuadrilla_positions(
+    min_lat: float | None = None,
+    max_lat: float | None = None,
+    min_lon: float | None = None,
+    max_lon: float | None = None,
+) -> List[Dict[str, Any]]:
+    """Última posición conocida de cada cuadrilla (opcionalmente dentro del rectángulo)."""
+    sql = f"SELECT {', '.join(_POSITION_COLS)} FROM cuadrilla_positions"
+    params: List[Any] = []
+    if min_lat is not None:
+        sql += " WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?"
+        params = [min_lat, max_lat, min_lon, max_lon]
+    return [dict(r) for r in _conn().execute(sql + " ORDER BY cuadrilla", params)]
+
+
+def cuadrillas_near(lat: float, lon: float, radius_m: float) -> List[Dict[str, Any]]:
+    out = []
+    for r in cuadrilla_positions(*geo.bbox_around(lat, lon, radius_m)):
+        d = geo.haversine_m(lat, lon, r["lat"], r["lon"])
+        if d <= radius_m:
+            out.append({**r, "distance_m": d})
+    out.sort(key=lambda r: r["distance_m"])
+    return out
+
+
+def geo_flags_page(
+    limit: int | None = None,
+    after: str | None = None,
+    cuadrilla: str | None = None,
+    task_id: str | None = None,
+    from_time: str | None = None,
+    to_time: str | None = None,
+) -> Dict[str, Any]:
+    """Check-ins marcados por estar lejos de su tarea, lo más reciente primero."""
+    where, params = _filters("f", cuadrilla=cuadrilla, task_id=task_id)
+    w, p = _time_range("f.event_time", from_time, to_time)
+    where += w
+    params += p
+
+    key = paging.decode_cursor(after, 2)
+    if key:
+        where.append("(f.event_time, f.event_id) < (?, ?)")
+        params += key
+
+    sql = f"""
+        SELECT f.*, l.lat AS task_lat, l.lon AS task_lon FROM geo_flags f
+        LEFT JOIN task_locations l ON l.task_id = f.task_id
+        {('WHERE ' + ' AND '.join(where)) if where else ''}
+        ORDER BY f.event_time DESC, f.event_id DESC
+    """
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    rows = [dict(r) for r in _conn().execute(sql, params)]
+    return paging.page(rows, limit, lambda r: [r["event_time"], r["event_id"]])
+
+
+# -----------------------------
+# Analytics (ver backend/analytics.py)
+# -----------------------------
+ANALYTICS_EVENT_COLS = ("rowid", "task_id", "event_type", "event_time", "pause_reason")
+ANALYTICS_TASK_COLS = ("task_id", "cuadrilla", "contratista", "ot")
+
+
+def _tuples(sql: str, params) -> list:
+    # sin sqlite3.Row: para cientos de miles de filas la tupla es bastante más barata
+    cur = _conn().cursor()
+    cur.row_factory = None
+    return cur.execute(sql, params).fetchall()
+
+
+def analytics_events(from_time: str | None = None, to_time: str | None = None, after_rowid: int = 0) -> tuple[tuple, list]:
+    """
+    Eventos del rango como (columnas, tuplas). Con `after_rowid` trae solo los
+    insertados después (los eventos no se modifican: se agregan al final); el
+    "+" saca el índice de hora para que SQLite recorra por rowid.
+    """
+    col = "+event_time" if after_rowid else "event_time"
+    where, params = _time_range(col, from_time, to_time)
+    where.append("rowid > ?")
+    params.append(after_rowid)
+    sql = f"SELECT {', '.join(ANALYTICS_EVENT_COLS)} FROM events WHERE {' AND '.join(where)}"
+    return ANALYTICS_EVENT_COLS, _tuples(sql, params)
+
+
+def analytics_tasks() -> tuple[tuple, list]:
+    """Tareas visibles (sin upload o de uploads activos) con sus datos para agrupar."""
+    sql = f"""
+        SELECT {', '.join('t.' + c for c in ANALYTICS_TASK_COLS)} FROM tasks t
+        LEFT JOIN uploads u ON u.upload_id = t.upload_id
+        WHERE t.upload_id IS NULL OR t.upload_id = '' OR u.active = 1
+    """
+    return ANALYTICS_TASK_COLS, _tuples(sql, ())
+
+
+def uploads_generation() -> int:
+    """Cambia con cada alta/baja/borrado de uploads (y sus tareas/eventos)."""
+    return _conn().execute("SELECT value FROM meta WHERE key = 'uploads_gen'").fetchone()[0]
+
+
+# -----------------------------
+# Tamaño del store (para /metrics)
+# -----------------------------
+STATS_TABLES = ("uploads", "tasks", "events", "latest_events", "geo_flags")
+
+
+def store_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Filas por tabla y bytes en disco (base + WAL). Las filas salen de los
+    contadores de meta que mantiene cada escritura: O(1), no un COUNT(*).
+    """
+    conn = _conn()
+    keys = [f"rows_{t}" for t in STATS_TABLES]
+    have = dict(conn.execute(f"SELECT key, value FROM meta WHERE key IN ({', '.join('?' for _ in keys)})", keys))
+    rows = {t: have.get(k, 0) for t, k in zip(STATS_TABLES, keys)}
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    wal = f"{DB_PATH}-wal"
+    return {
+        "rows": rows,
+        "bytes": {"db": page_size * page_count, "wal": os.path.getsize(wal) if os.path.exists(wal) else 0},
+    }
+
+
+# -----------------------------
+# Upload jobs (importación en background)
+# -----------------------------
+JOB_FILE_COLS = ("filename", "upload_id", "status", "rows_imported", "error", "updated_at")
+
+
+def create_upload_job(job_id: str, created_at: str, files: List[Dict[str, Any]]) -> None:
+    """
+    `files`: [{filename, upload_id, path}] y opcionalmente status/rows_imported
+    (p.ej. archivos repetidos que se resuelven sin importar: DUPLICADO).
+    El job queda a nombre de este proceso (ver fail_orphaned_job_files).
+    """
+    with _write() as conn:
+        conn.execute("INSERT INTO upload_jobs (job_id, created_at) VALUES (?, ?)", (job_id, created_at))
+        conn.executemany(
+            "INSERT INTO upload_job_files "
+            "(job_id, idx, filename, upload_id, status, rows_imported, updated_at, owner_pid, path) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    job_id,
+                    i,
+                    f.get("filename"),
+                    f.get("upload_id"),
+                    f.get("status") or "PENDIENTE",
+                    f.get("rows_imported") or 0,
+                    created_at,
+                    os.getpid(),
+                    f.get("path"),
+                )
+                for i, f in enumerate(files)
+            ],
+        )
+
+
+def fail_orphaned_job_files(alive, stale_before: str, error: str) -> List[Dict[str, Any]]:
+    """
+    Marca ERROR los archivos de jobs que no van a terminar nunca: PENDIENTE /
+    PROCESANDO de un proceso que ya no existe (`alive(pid)` = False), o
+    PROCESANDO sin progreso desde `stale_before`. En una transacción: si
+    varios workers arrancan a la vez, cada archivo lo toma uno solo.
+    Devuelve los archivos marcados ({job_id, idx, upload_id, path}).
+    """
+    with _write() as conn:
+        rows = conn.execute(
+            "SELECT job_id, idx, upload_id, path, status, owner_pid, updated_at FROM upload_job_files "
+            "WHERE status IN ('PENDIENTE', 'PROCESANDO')"
+        ).fetchall()
+        orphans = [
+            r
+            for r in rows
+            if r["owner_pid"] is None
+            or not alive(r["owner_pid"])
+            or (r["status"] == "PROCESANDO" and (r["updated_at"] or "") < stale_before)
+        ]
+        conn.executemany(
+            "UPDATE upload_job_files SET status = 'ERROR', error = ? WHERE job_id = ? AND idx = ?",
+            [(error, r["job_id"], r["idx"]) for r in orphans],
+        )
+    return [{k: r[k] for k in ("job_id", "idx", "upload_id", "path")} for r in orphans]
+
+
+def update_upload_job_file(job_id: str, idx: int, **fields) -> None:
+    cols = [c for c in fields if c in JOB_FILE_COLS]
+    if not cols:
+        return
+    with _write() as conn:
+        conn.execute(
+            f"UPDATE upload_job_files SET {', '.join(c + ' = ?' for c in cols)} WHERE job_id = ? AND idx = ?",
+            (*[fields[c] for c in cols], job_id, idx),
+        )
+
+
+def get_upload_job(job_id: str) -> Dict[str, Any] | None:
+    conn = _conn()
+    job = conn.execute("SELECT * FROM upload_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if job is None:
+        return None
+    files = [
+        dict(r)
+        for r in conn.execute(
+            f"SELECT idx, {', '.join(JOB_FILE_COLS)} FROM upload_job_files WHERE job_id = ? ORDER BY idx",
+            (job_id,),
+        )
+    ]
+
+    # un archivo repetido (DUPLICADO) cuenta como importado
+    statuses = {"OK" if f["status"] == "DUPLICADO" else f["status"] for f in files}
+    if statuses & {"PENDIENTE", "PROCESANDO"}:
+        status = "PROCESANDO" if statuses - {"PENDIENTE"} else "PENDIENTE"
+    elif statuses == {"OK"} or not statuses:
+        status = "OK"
+    elif statuses == {"ERROR"}:
+        status = "ERROR"
+    else:
+        status = "CON_ERRORES"
 
-    return list(latest.values())
+    return {
+        **dict(job),
+        "status": status,
+        "files_total": len(files),
+        "files_done": sum(1 for f in files if f["status"] in ("OK", "ERROR", "DUPLICADO")),
+        "rows_imported": sum(f["rows_imported"] or 0 for f in files),
+        "errors": [f"{f['filename']}: {f['error']}" for f in files if f["error"]],
+        "files": files,
+    }
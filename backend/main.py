@@ -1,33 +1,99 @@
 import os
-import uuid
+import asyncio
 import hashlib
-from datetime import datetime, timezone
+import uuid
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import Annotated
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import pandas as pd
+from starlette.concurrency import run_in_threadpool
+
+from pydantic import ValidationError
 
-from backend.models import CreateEvent
+from backend.models import CreateEvent, CreateEventsBatch
+from backend import analytics, cache, jobs, metrics, paging, photos, storage
 import backend.local_db as bq
+from backend import live
+
+# fotos más grandes se rechazan (413)
+MAX_PHOTO_BYTES = int(os.getenv("MAX_PHOTO_BYTES", str(15 * 1024 * 1024)))
+# margen para el resto del multipart (campos del evento, boundaries)
+PHOTO_FORM_SLACK_BYTES = 64 * 1024
+
+
+class PhotoBodyLimit:
+    """
+    ASGI puro: corta el body de /api/event_with_photo apenas pasa el tope.
+    Starlette parsea el multipart entero antes de llamar al handler, así que
+    el límite tiene que ir acá: por Content-Length si viene, y si no contando
+    lo recibido (un HTTPException desde receive llega como 413).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != "/api/event_with_photo":
+            return await self.app(scope, receive, send)
+
+        limit = MAX_PHOTO_BYTES + PHOTO_FORM_SLACK_BYTES
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            response = JSONResponse({"detail": "Foto demasiado grande"}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def _receive():
+            nonlocal received
+            msg = await receive()
+            if msg["type"] == "http.request":
+                received += len(msg.get("body", b""))
+                if received > limit:
+                    raise HTTPException(413, "Foto demasiado grande")
+            return msg
+
+        await self.app(scope, _receive, send)
+
 
 app = FastAPI(title="Seguimiento de CUADRILLAS - Modo Local")
+app.add_middleware(PhotoBodyLimit)
+# latencia por ruta (ver /metrics); va por fuera, así mide también los 413
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.watch_cache("task_meta", cache.task_meta)
+metrics.watch_cache("uploads", bq._uploads)
+metrics.watch_cache("analytics_frames", analytics.frames)
+metrics.watch_cache("analytics_results", analytics.results)
+
+# fan-out en vivo de los cambios del tablero (SSE)
+broker = live.Broker(bq.dashboard_cursor, bq.dashboard_changes)
 
 
 def now_utc():
     return datetime.now(timezone.utc)
 
 
-def make_task_ids(contratista, ot, ut, desc_op, id_cuadrilla):
-    key = (
-        f"{(contratista or '').strip()}||"
-        f"{(ot or '').strip()}||"
-        f"{(ut or '').strip()}||"
-        f"{(desc_op or '').strip()}||"
-        f"{(id_cuadrilla or '').strip()}"
-    )
-    task_id = hashlib.sha1(key.encode("utf-8")).hexdigest()
-    return task_id, key
+@app.on_event("startup")
+async def _startup():
+    bq.start_compactor()
+    broker.start()
+    # foto publicada => el tablero en vivo ve la miniatura
+    photos.on_published = lambda _event_id: broker.notify()
+    photos.resume()
+    # imports que quedaron a medias por un reinicio: a ERROR (si no, el job no termina nunca)
+    await run_in_threadpool(jobs.recover)
+
+
+@app.on_event("shutdown")
+async def _shutdown():
+    await broker.stop()
+    jobs.shutdown()
+    photos.shutdown()
+    bq.stop_compactor()
 
 
 @app.get("/api/health")
@@ -35,6 +101,17 @@ def health():
     return {"ok": True}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Métricas en formato Prometheus, sumadas sobre todos los workers."""
+    stats = bq.store_stats()
+    for table, n in stats["rows"].items():
+        metrics.STORE_ROWS.set(n, table)
+    for name, n in stats["bytes"].items():
+        metrics.STORE_BYTES.set(n, name)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # ----------------------------
 # Uploads: list / disable / enable / delete
 # ----------------------------
@@ -48,6 +125,7 @@ def disable_upload(upload_id: str):
     ok = bq.set_upload_active(upload_id, False)
     if not ok:
         raise HTTPException(404, "No existe upload")
+    broker.notify()
     return {"ok": True}
 
 
@@ -56,6 +134,7 @@ def enable_upload(upload_id: str):
     ok = bq.set_upload_active(upload_id, True)
     if not ok:
         raise HTTPException(404, "No existe upload")
+    broker.notify()
     return {"ok": True}
 
 
@@ -64,185 +143,129 @@ def delete_upload(upload_id: str):
     deleted = bq.delete_upload(upload_id)
     if not deleted:
         raise HTTPException(404, "No existe upload")
+    cache.task_meta.clear()
+    broker.notify()
     return {"ok": True, "deleted": deleted}
 
 
 # ----------------------------
 # Import Excel -> tasks + upload registry
 # ----------------------------
-@app.post("/api/upload_tasks")
-async def upload_tasks(files: list[UploadFile] = File(...)):
-    imported_total = 0
-
-    required_aliases = {
-        "Contratista": ["Contratista"],
-        "OT": ["OT"],
-        "UT": ["UT"],
-        "Descripción OT": ["Descripción OT", "Descripcion OT"],
-        "Descripción OP": ["Descripción OP", "Descripcion OP"],
-        "Cuadrilla": ["Cuadrilla"],
-        "ID Cuadrilla": ["ID Cuadrilla", "Id Cuadrilla"],
-    }
+# tamaño de cada lectura del upload al guardarlo en disco
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+@app.post("/api/upload_tasks", status_code=202)
+async def upload_tasks(files: list[UploadFile] = File(...), reactivate: bool = False):
+    """
+    Guarda los archivos y devuelve enseguida un job_id; el parseo y la carga
+    de tareas corren en el pool de procesos (ver /api/upload_jobs/{job_id}).
+    Un archivo con el mismo contenido que uno ya importado no se vuelve a
+    parsear ni a guardar: se informa como DUPLICADO (y con `reactivate` se
+    reactiva el upload anterior si estaba dado de baja).
+    """
+    saved = []
+    duplicates = []
+    seen: dict[str, str] = {}  # sha256 -> upload_id (archivos repetidos en el mismo POST)
+    for f in files:
+        # 1) Guardar archivo físico (por partes, sin tenerlo entero en memoria)
+        upload_id = uuid.uuid4().hex
+        safe_name = (f.filename or "upload.xlsx").replace("/", "_").replace("\\", "_")
+        upload_dir = Path("local_data") / "uploads"
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        saved_path = str(upload_dir / f"{upload_id}__{safe_name}")
 
-    def pick_sheet_and_df(content: bytes):
-        from io import BytesIO
-
-        def norm(s: str) -> str:
-            if s is None:
-                return ""
-            s = str(s).strip().lower()
-            s = (
-                s.replace("á", "a")
-                .replace("é", "e")
-                .replace("í", "i")
-                .replace("ó", "o")
-                .replace("ú", "u")
-                .replace("ü", "u")
-            )
-            s = " ".join(s.split())
-            return s
-
-        required_norm = {
-            canon: [norm(a) for a in aliases]
-            for canon, aliases in required_aliases.items()
-        }
-
-        bio = BytesIO(content)
-        xl = pd.ExcelFile(bio)
-
-        for sh in xl.sheet_names:
-            raw = pd.read_excel(xl, sheet_name=sh, header=None, dtype=str).fillna("")
-
-            max_scan_rows = min(80, len(raw))
-            header_row_idx = None
-            header_colmap = None
-
-            for i in range(max_scan_rows):
-                row_vals = [norm(v) for v in raw.iloc[i].tolist()]
-
-                colmap = {}
-                ok = True
-                for canon, aliases in required_norm.items():
-                    found_j = None
-                    for j, cell in enumerate(row_vals):
-                        if cell in aliases:
-                            found_j = j
-                            break
-                    if found_j is None:
-                        ok = False
-                        break
-                    colmap[canon] = found_j
-
-                if ok:
-                    header_row_idx = i
-                    header_colmap = colmap
+        digest = hashlib.sha256()
+        with open(saved_path, "wb") as out:
+            while True:
+                chunk = await f.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
                     break
+                digest.update(chunk)
+                out.write(chunk)
+        sha = digest.hexdigest()
+
+        prev = await run_in_threadpool(bq.find_upload_by_sha256, sha)
+        prev_id = prev["upload_id"] if prev else seen.get(sha)
+        if prev_id:
+            os.remove(saved_path)
+            reactivated = False
+            if prev and reactivate and not prev["active"]:
+                reactivated = await run_in_threadpool(bq.set_upload_active, prev_id, True)
+            saved.append(
+                {
+                    "filename": safe_name,
+                    "upload_id": prev_id,
+                    "status": "DUPLICADO",
+                    "rows_imported": prev["rows_imported"] if prev else 0,
+                }
+            )
+            duplicates.append({"filename": safe_name, "upload_id": prev_id, "reactivated": reactivated})
+            metrics.UPLOADS.inc("duplicate")
+            continue
 
-            if header_row_idx is None:
-                continue
-
-            data = raw.iloc[header_row_idx + 1 :].copy()
-            data.columns = list(range(data.shape[1]))
+        seen[sha] = upload_id
+        metrics.UPLOADS.inc("accepted")
+        saved.append({"filename": safe_name, "path": saved_path, "upload_id": upload_id, "content_sha256": sha})
 
-            out = data[[header_colmap[k] for k in required_aliases.keys()]].copy()
-            out.columns = list(required_aliases.keys())
-            out = out.fillna("").astype(str)
+    if any(d["reactivated"] for d in duplicates):
+        broker.notify()
 
-            mask_any = (
-                (out["OT"].str.strip().str.len() > 0)
-                | (out["Cuadrilla"].str.strip().str.len() > 0)
-                | (out["ID Cuadrilla"].str.strip().str.len() > 0)
-            )
-            out = out[mask_any].copy()
+    # 2..4) Parsear + registrar + generar tasks: en background
+    job_id = uuid.uuid4().hex
+    await run_in_threadpool(bq.create_upload_job, job_id, now_utc().isoformat(), saved)
+    jobs.submit(job_id, saved)
 
-            if not out.empty:
-                out = out.reset_index(drop=True)
+    return {"job_id": job_id, "files": len(saved), "duplicates": duplicates}
 
-            return sh, out
 
-        return None, None
+@app.get("/api/upload_jobs/{job_id}")
+def upload_job(job_id: str):
+    job = bq.get_upload_job(job_id)
+    if not job:
+        raise HTTPException(404, "No existe job")
+    return job
 
-    for f in files:
-        content = await f.read()
 
-        # 1) Guardar archivo físico
-        upload_id = uuid.uuid4().hex
-        safe_name = (f.filename or "upload.xlsx").replace("/", "_").replace("\\", "_")
-        upload_dir = Path("local_data") / "uploads"
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        saved_path = str(upload_dir / f"{upload_id}__{safe_name}")
-
-        with open(saved_path, "wb") as out:
-            out.write(content)
-
-        # 2) Parsear excel
-        sheet, df = pick_sheet_and_df(content)
-
-        if df is None:
-            # si falla, borramos el archivo físico guardado
-            try:
-                os.remove(saved_path)
-            except Exception:
-                pass
-            raise HTTPException(400, f"No encontré columnas requeridas en {f.filename}")
-
-        df = df.fillna("").astype(str)
-        df = df[df["OT"].str.strip().str.len() > 0]
-        df = df[df["Cuadrilla"].str.strip().str.len() > 0]
-        df = df[df["ID Cuadrilla"].str.strip().str.len() > 0]
-
-        # 3) Registrar el upload (ACTIVO por defecto)
-        bq.create_upload(
-            {
-                "upload_id": upload_id,
-                "filename": safe_name,
-                "path": saved_path,
-                "sheet": sheet,
-                "rows_imported": int(len(df)),
-                "uploaded_at": now_utc().isoformat(),
-                "active": True,
-            }
-        )
+# ----------------------------
+# Listados paginados (keyset): `limit` + `after` (cursor opaco de la respuesta anterior)
+# ----------------------------
+Limit = Query(paging.DEFAULT_LIMIT, ge=1, le=paging.MAX_LIMIT)
 
-        # 4) Generar tasks con upload_id
-        rows = []
-        for _, r in df.iterrows():
-            task_id, unique_key = make_task_ids(
-                r["Contratista"],
-                r["OT"],
-                r["UT"],
-                r["Descripción OP"],
-                r["ID Cuadrilla"],
-            )
 
-            now = now_utc().isoformat()
-            rows.append(
-                {
-                    "task_id": task_id,
-                    "unique_key": unique_key,
-                    "upload_id": upload_id,  # ✅ clave
-                    "source_file": safe_name,
-                    "contratista": r["Contratista"],
-                    "ot": r["OT"],
-                    "ut": r["UT"],
-                    "desc_ot": r["Descripción OT"],
-                    "desc_op": r["Descripción OP"],
-                    "cuadrilla": r["Cuadrilla"],
-                    "id_cuadrilla": r["ID Cuadrilla"],
-                    "status": "ABIERTO",
-                    "created_at": now,
-                    "updated_at": now,
-                }
-            )
+def _page(fn, *args, **kwargs) -> dict:
+    try:
+        return fn(*args, **kwargs)
+    except ValueError as e:
+        raise HTTPException(422, str(e))
 
-        imported_total += bq.upsert_tasks(rows)
 
-    return {"imported": imported_total}
+def _time_param(raw: str | None, name: str) -> str | None:
+    """Filtro de hora (ISO) normalizado a UTC, igual que se guardan los eventos."""
+    if not raw:
+        return None
+    return _parse_time(raw, name).isoformat()
 
 
 @app.get("/api/tasks")
-def tasks(cuadrilla: str):
-    return {"tasks": bq.list_tasks_by_cuadrilla(cuadrilla)}
+def tasks(
+    cuadrilla: str,
+    limit: int = Limit,
+    after: str | None = None,
+    contratista: str | None = None,
+    status: str | None = None,
+    upload_id: str | None = None,
+):
+    out = _page(
+        bq.tasks_page,
+        cuadrilla,
+        limit=limit,
+        after=after,
+        contratista=contratista,
+        status=status,
+        upload_id=upload_id,
+    )
+    return {"tasks": out["rows"], "next": out["next"]}
 
 
 @app.get("/api/task/{task_id}")
@@ -254,26 +277,86 @@ def task(task_id: str):
 
 
 @app.get("/api/task/{task_id}/events")
-def task_events(task_id: str):
-    return {"events": bq.list_events_by_task(task_id)}
-
-
-@app.post("/api/event")
-async def create_event(payload: CreateEvent):
-    event_time = now_utc().isoformat()
-
-    t = bq.get_task(payload.task_id)
+def task_events(
+    task_id: str,
+    limit: int = Limit,
+    after: str | None = None,
+    event_type: str | None = None,
+    from_time: str | None = None,
+    to_time: str | None = None,
+):
+    out = _page(
+        bq.events_page,
+        task_id,
+        limit=limit,
+        after=after,
+        event_type=event_type,
+        from_time=_time_param(from_time, "from_time"),
+        to_time=_time_param(to_time, "to_time"),
+    )
+    return {"events": out["rows"], "next": out["next"]}
+
+
+# tolerancia para relojes de celulares adelantados
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def _parse_time(raw: str, name: str) -> datetime:
+    try:
+        dt = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(422, f"{name} inválido: {raw}")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def _event_time(raw: str | None) -> str:
+    """
+    Hora informada por el celular (p.ej. eventos cargados sin señal), en UTC.
+    Si no viene, o viene del futuro, se usa la hora del servidor.
+    """
+    now = now_utc()
+    if not raw:
+        return now.isoformat()
+    dt = _parse_time(raw, "event_time")
+    if dt > now + MAX_CLOCK_SKEW:
+        return now.isoformat()
+    return dt.isoformat()
+
+
+def _task_meta(task_id: str) -> dict | None:
+    """
+    Metadatos de la tarea para el evento, sin ir al store en cada POST.
+    Solo se cachean tareas existentes: una tarea recién importada se ve al instante.
+    Se revalida contra la generación de uploads: una tarea borrada (o un upload
+    dado de baja) en otro worker no se sigue sirviendo hasta el TTL.
+    """
+    cache.task_meta.sync(bq.uploads_generation())
+    meta = cache.task_meta.get(task_id)
+    if meta is None:
+        t = bq.get_task(task_id)
+        if not t:
+            return None
+        meta = {"unique_key": t["unique_key"]}
+        cache.task_meta.set(task_id, meta)
+    return meta
+
+
+def _event_row(payload: CreateEvent) -> dict:
+    t = _task_meta(payload.task_id)
     unique_key = t["unique_key"] if t else None
 
-    row = {
-        "event_id": uuid.uuid4().hex,
+    return {
+        # con client_event_id el reenvío del mismo evento no lo duplica
+        "event_id": payload.client_event_id or uuid.uuid4().hex,
         "task_id": payload.task_id,
         "unique_key": unique_key,
         "ot": payload.ot,
         "cuadrilla": payload.cuadrilla,
         "id_cuadrilla": payload.id_cuadrilla,
         "event_type": payload.event_type,
-        "event_time": event_time,
+        "event_time": _event_time(payload.event_time),
         "lat": payload.lat,
         "lon": payload.lon,
         "accuracy_m": payload.accuracy_m,
@@ -283,19 +366,325 @@ async def create_event(payload: CreateEvent):
         "created_at": now_utc().isoformat(),
     }
 
-    bq.insert_event(row)
+
+@app.post("/api/event")
+def create_event(payload: CreateEvent):
+    # sync a propósito: corre en el threadpool y los inserts concurrentes
+    # se agrupan en un solo commit (group commit del store)
+    bq.insert_event(_event_row(payload))
+    broker.notify()
     return {"ok": True}
 
 
+@app.post("/api/event_with_photo")
+async def create_event_with_photo(
+    task_id: str = Form(...),
+    ot: str = Form(...),
+    cuadrilla: str = Form(...),
+    event_type: str = Form(...),
+    lat: float = Form(...),
+    lon: float = Form(...),
+    id_cuadrilla: str | None = Form(None),
+    event_time: str | None = Form(None),
+    accuracy_m: float | None = Form(None),
+    pause_reason: str | None = Form(None),
+    comment: str | None = Form(None),
+    client_event_id: str | None = Form(None),
+    photo: UploadFile = File(...),
+):
+    """
+    Evento + foto (multipart). La foto se guarda tal cual en el spool y el
+    evento se registra enseguida, sin foto; el redimensionado, la miniatura
+    y la subida corren en el pool de photos.py, que completa photo_url /
+    thumb_url cuando termina. La respuesta no espera nada de eso.
+    """
+    try:
+        payload = CreateEvent(
+            task_id=task_id,
+            ot=ot,
+            cuadrilla=cuadrilla,
+            event_type=event_type,
+            lat=lat,
+            lon=lon,
+            id_cuadrilla=id_cuadrilla or None,
+            event_time=event_time,
+            accuracy_m=accuracy_m,
+            pause_reason=pause_reason,
+            comment=comment,
+            client_event_id=client_event_id,
+        )
+    except ValidationError as e:
+        raise HTTPException(422, e.errors(include_url=False))
+
+    row = await run_in_threadpool(_event_row, payload)
+    path = photos.spool_path(row["event_id"])
+    # se copia del temporal de Starlette a un .part: resume() solo ve archivos completos
+    part = path + ".part"
+
+    size = 0
+    with open(part, "wb") as out:
+        while True:
+            chunk = await photo.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_PHOTO_BYTES:
+                break
+            out.write(chunk)
+    if size > MAX_PHOTO_BYTES or size == 0:
+        os.remove(part)
+        raise HTTPException(413 if size else 422, "Foto demasiado grande" if size else "Foto vacía")
+    os.replace(part, path)
+
+    await run_in_threadpool(bq.insert_event, row)
+    photos.submit(row["event_id"])
+    broker.notify()
+    return {"ok": True, "event_id": row["event_id"], "photo": "PENDIENTE"}
+
+
+@app.post("/api/events/batch")
+def create_events_batch(payload: CreateEventsBatch):
+    """
+    Sincronización del outbox de las cuadrillas: valida todo el lote y lo
+    guarda en una sola transacción. Los client_event_id ya recibidos se ignoran.
+    """
+    rows = [_event_row(e) for e in payload.events]
+    inserted = bq.insert_events(rows)
+    if inserted:
+        broker.notify()
+    return {"ok": True, "received": len(rows), "inserted": inserted, "duplicates": len(rows) - inserted}
+
+
 @app.get("/api/dashboard")
-def dashboard():
-    return {"rows": bq.dashboard_latest()}
+def dashboard(
+    request: Request,
+    response: Response,
+    since: int | None = None,
+    limit: int = Limit,
+    after: str | None = None,
+    cuadrilla: str | None = None,
+    contratista: str | None = None,
+    event_type: str | None = None,
+    upload_id: str | None = None,
+    from_time: str | None = None,
+    to_time: str | None = None,
+):
+    """
+    - sin `since`: primera página del último estado + cursor (+ `next`)
+    - con `after`: página siguiente del estado (no cambia el cursor)
+    - con `since`: solo lo que cambió desde ese cursor (rows / removed)
+    El ETag es el cursor: si el cliente ya lo tiene, 304 sin cuerpo.
+    """
+    filters = {
+        "cuadrilla": cuadrilla,
+        "contratista": contratista,
+        "event_type": event_type,
+        "upload_id": upload_id,
+        "from_time": _time_param(from_time, "from_time"),
+        "to_time": _time_param(to_time, "to_time"),
+    }
+    cursor = bq.dashboard_cursor()
+    etag = f'"{cursor}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    if after:
+        return {**_page(bq.dashboard_page, limit, after, **filters), "cursor": cursor}
+    return _dashboard_payload(since, cursor, limit, filters)
+
+
+def _dashboard_payload(
+    since: int | None, cursor: int | None = None, limit: int = paging.DEFAULT_LIMIT, filters: dict | None = None
+) -> dict:
+    filters = filters or {}
+    if cursor is None:
+        cursor = bq.dashboard_cursor()
+    # cursor desconocido (base recreada) => snapshot completo
+    if since is None or since > cursor:
+        return {**_page(bq.dashboard_page, limit, **filters), "cursor": cursor, "full": True}
+    return {**bq.dashboard_changes(since, **filters), "full": False}
+
+
+@app.get("/api/analytics")
+def analytics_report(
+    from_time: str | None = None,
+    to_time: str | None = None,
+    cuadrilla: str | None = None,
+    contratista: str | None = None,
+    per_task: bool = False,
+):
+    """
+    Tiempos LLEGADA→INICIO, trabajo activo y pausas (por motivo), por tarea y
+    agregados por cuadrilla / contratista. Por defecto, los últimos 30 días.
+    """
+    return analytics.report(
+        from_time=_parse_time(from_time, "from_time") if from_time else None,
+        to_time=_parse_time(to_time, "to_time") if to_time else None,
+        cuadrilla=cuadrilla,
+        contratista=contratista,
+        per_task=per_task,
+    )
+
+
+# ----------------------------
+# Geo: área = rectángulo (min_lat..max_lon) o círculo (lat, lon, radius_m)
+# ----------------------------
+MAX_RADIUS_M = 200_000
+
+
+def _area(
+    min_lat: float | None,
+    max_lat: float | None,
+    min_lon: float | None,
+    max_lon: float | None,
+    lat: float | None,
+    lon: float | None,
+    radius_m: float | None,
+) -> tuple | None:
+    """("bbox", (min_lat, max_lat, min_lon, max_lon)) | ("near", (lat, lon, radius_m)) | None."""
+    bbox = (min_lat, max_lat, min_lon, max_lon)
+    near = (lat, lon, radius_m)
+    if all(v is not None for v in bbox):
+        if min_lat > max_lat or min_lon > max_lon:
+            raise HTTPException(422, "Rectángulo inválido (min > max)")
+        return "bbox", bbox
+    if all(v is not None for v in near):
+        return "near", near
+    if any(v is not None for v in bbox + near):
+        raise HTTPException(422, "Indicá min_lat/max_lat/min_lon/max_lon o lat/lon/radius_m")
+    return None
+
+
+# Annotated: el mismo Query() no se puede compartir entre varios parámetros
+Lat = Annotated[float | None, Query(ge=-90, le=90)]
+Lon = Annotated[float | None, Query(ge=-180, le=180)]
+Radius = Annotated[float | None, Query(gt=0, le=MAX_RADIUS_M)]
+
+
+@app.get("/api/geo/events")
+def geo_events(
+    min_lat: Lat = None,
+    max_lat: Lat = None,
+    min_lon: Lon = None,
+    max_lon: Lon = None,
+    lat: Lat = None,
+    lon: Lon = None,
+    radius_m: Radius = None,
+    limit: int = Limit,
+    after: str | None = None,
+    cuadrilla: str | None = None,
+    event_type: str | None = None,
+    from_time: str | None = None,
+    to_time: str | None = None,
+):
+    """
+    Eventos en el área. Rectángulo: lo más reciente primero, paginado.
+    Círculo: los más cercanos primero (con distance_m), hasta `limit`.
+    """
+    area = _area(min_lat, max_lat, min_lon, max_lon, lat, lon, radius_m)
+    if area is None:
+        raise HTTPException(422, "Falta el área (rectángulo o lat/lon/radius_m)")
+    filters = {
+        "cuadrilla": cuadrilla,
+        "event_type": event_type,
+        "from_time": _time_param(from_time, "from_time"),
+        "to_time": _time_param(to_time, "to_time"),
+    }
+    kind, args = area
+    if kind == "near":
+        return {"events": bq.events_near(*args, limit=limit, **filters), "next": None}
+    out = _page(bq.events_in_bbox, *args, limit=limit, after=after, **filters)
+    return {"events": out["rows"], "next": out["next"]}
+
+
+@app.get("/api/geo/cuadrillas")
+def geo_cuadrillas(
+    min_lat: Lat = None,
+    max_lat: Lat = None,
+    min_lon: Lon = None,
+    max_lon: Lon = None,
+    lat: Lat = None,
+    lon: Lon = None,
+    radius_m: Radius = None,
+):
+    """Última posición conocida de cada cuadrilla (todas, o las que están en el área)."""
+    area = _area(min_lat, max_lat, min_lon, max_lon, lat, lon, radius_m)
+    if area is None:
+        return {"cuadrillas": bq.cuadrilla_positions()}
+    kind, args = area
+    if kind == "near":
+        return {"cuadrillas": bq.cuadrillas_near(*args)}
+    return {"cuadrillas": bq.cuadrilla_positions(*args)}
+
+
+@app.get("/api/geo/flags")
+def geo_flags(
+    limit: int = Limit,
+    after: str | None = None,
+    cuadrilla: str | None = None,
+    task_id: str | None = None,
+    from_time: str | None = None,
+    to_time: str | None = None,
+):
+    """Check-ins lejos de la ubicación habitual de su tarea (GEO_FAR_M)."""
+    out = _page(
+        bq.geo_flags_page,
+        limit=limit,
+        after=after,
+        cuadrilla=cuadrilla,
+        task_id=task_id,
+        from_time=_time_param(from_time, "from_time"),
+        to_time=_time_param(to_time, "to_time"),
+    )
+    return {"flags": out["rows"], "next": out["next"]}
+
+
+@app.get("/api/dashboard/stream")
+async def dashboard_stream(request: Request, since: int | None = None):
+    """
+    Server-Sent Events: primero el estado (completo o delta desde `since`),
+    después cada cambio apenas se confirma en el store.
+    """
+    last_id = request.headers.get("last-event-id", "")
+    if last_id.isdigit():
+        since = int(last_id)
+
+    q = broker.subscribe()
+
+    async def gen():
+        try:
+            first = await run_in_threadpool(_dashboard_payload, since)
+            yield live.sse(first)
+            while True:
+                try:
+                    msg = await asyncio.wait_for(q.get(), timeout=live.HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if msg is None:
+                    break
+                yield live.sse(msg)
+        finally:
+            broker.unsubscribe(q)
+
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # ==========================================================
 # IMPORTANTE:
 # Montar el frontend AL FINAL para no "pisar" /api/*
 # ==========================================================
+# fotos del backend "local" (storage.LocalBlobs)
+os.makedirs(storage.MEDIA_DIR, exist_ok=True)
+app.mount(storage.MEDIA_URL, StaticFiles(directory=storage.MEDIA_DIR), name="media")
+
 FRONT_DIST = os.environ.get("FRONT_DIST", "/app/frontend/dist")
 try:
     app.mount("/", StaticFiles(directory=FRONT_DIST, html=True), name="frontend")
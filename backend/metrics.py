@@ -0,0 +1,425 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+# Métricas estilo Prometheus, sin dependencias.
+#
+# Cada proceso (workers de uvicorn, procesos del pool de import) acumula en
+# memoria y cada FLUSH_INTERVAL_S escribe un snapshot en METRICS_DIR. /metrics
+# suma los snapshots de todos: counters/histogramas de todos los procesos
+# (los de procesos muertos se suman a un archivo histórico, así los totales
+# nunca bajan) y gauges solo de los procesos vivos.
+METRICS_DIR = os.path.join("local_data", "metrics")
+FLUSH_INTERVAL_S = float(os.getenv("METRICS_FLUSH_S", "5"))
+PREFIX = "cuadrillas_"
+
+# segundos
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_ARCHIVE = "_archive.json"
+_LOCK_FILE = "_lock"
+
+_registry: Dict[str, "_Metric"] = {}
+_state_lock = threading.Lock()
+_dirty = False
+_flusher: threading.Thread | None = None
+_proc_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+# -----------------------------
+# Tipos de métrica
+# -----------------------------
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), shared: bool = True):
+        """`shared=False`: solo la ve el proceso que responde /metrics (no va al snapshot)."""
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self.shared = shared
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        _registry[self.name] = self
+
+    def _changed(self) -> None:
+        global _dirty
+        _dirty = True
+        if self.shared and _flusher is None:
+            _start_flusher()
+
+    def _snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {json.dumps(k): (list(v) if isinstance(v, list) else v) for k, v in self._values.items()}
+
+    def _reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: Any, n: float = 1) -> None:
+        key = tuple(str(v) for v in labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+        self._changed()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: Any) -> None:
+        key = tuple(str(v) for v in labels)
+        with self._lock:
+            self._values[key] = value
+        self._changed()
+
+    def inc(self, *labels: Any, n: float = 1) -> None:
+        key = tuple(str(v) for v in labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+        self._changed()
+
+    def dec(self, *labels: Any, n: float = 1) -> None:
+        self.inc(*labels, n=-n)
+
+
+class Histogram(_Metric):
+    """Valores: [cuenta por bucket..., cuenta en +Inf, suma, total]."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: Any) -> None:
+        key = tuple(str(v) for v in labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(key)
+            if v is None:
+                v = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            v[i] += 1
+            v[-2] += value
+            v[-1] += 1
+        self._changed()
+
+
+# -----------------------------
+# Catálogo
+# -----------------------------
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Latencia hasta el inicio de la respuesta", ("method", "route", "status"))
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "Pedidos en curso", ("method",))
+SPAN = Histogram("span_duration_seconds", "Duración de las fases internas", ("span",))
+
+IMPORT_ROWS = Counter("import_rows_total", "Filas de Excel importadas")
+# local: inserted / updated (unique_key ya existente); bq: merged / duplicate_in_batch
+TASK_ROWS = Counter("task_rows_total", "Filas de tasks en upserts, por resultado", ("result",))
+EVENTS = Counter("events_total", "Eventos recibidos (duplicate = event_id repetido)", ("result",))
+# bq: retry = envío fallido que se reintenta; rejected / exhausted = al dead letter; buffer_full = no se aceptó
+EVENT_FAILURES = Counter("bq_event_failures_total", "Eventos que no llegaron a BigQuery, por motivo", ("reason",))
+EVENT_BUFFER_ROWS = Gauge("bq_event_buffer_rows", "Eventos esperando envío a BigQuery")
+UPLOADS = Counter("uploads_total", "Archivos recibidos (duplicate = mismo contenido ya importado)", ("result",))
+
+CACHE_HITS = Counter("cache_hits_total", "Aciertos de cache", ("cache",))
+CACHE_MISSES = Counter("cache_misses_total", "Fallos de cache", ("cache",))
+CACHE_ENTRIES = Gauge("cache_entries", "Entradas en cache (suma de procesos)", ("cache",))
+
+STORE_ROWS = Gauge("store_rows", "Filas por tabla del store", ("table",), shared=False)
+STORE_BYTES = Gauge("store_bytes", "Tamaño en disco del store", ("file",), shared=False)
+
+
+# -----------------------------
+# Instrumentación
+# -----------------------------
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPAN.observe(time.perf_counter() - t0, name)
+
+
+def timed(name: str) -> Callable:
+    """Decorador: toda la llamada cuenta como un span."""
+
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
+
+
+def timed_iter(it: Iterable, name: str) -> Iterator:
+    """Mide lo que tarda cada next() (p.ej. leer el próximo lote del Excel)."""
+    it = iter(it)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        SPAN.observe(time.perf_counter() - t0, name)
+        yield item
+
+
+_caches: Dict[str, Any] = {}
+
+
+def watch_cache(name: str, c: Any) -> None:
+    """Publica hits/misses (y tamaño) de un cache con atributos hits/misses."""
+    _caches[name] = c
+    if _flusher is None:
+        _start_flusher()
+
+
+class MetricsMiddleware:
+    """
+    ASGI puro (sin BaseHTTPMiddleware): latencia por ruta hasta que sale el
+    encabezado de la respuesta (en SSE no cuenta la duración de la conexión).
+    La ruta es la plantilla (/api/task/{task_id}), no el path: cardinalidad acotada.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        t0 = time.perf_counter()
+        observed = False
+
+        def observe(status: int) -> None:
+            nonlocal observed
+            observed = True
+            route = getattr(scope.get("route"), "path", None)
+            if route is None:
+                route = "unmatched" if scope["path"].startswith("/api/") else "static"
+            HTTP_LATENCY.observe(time.perf_counter() - t0, method, route, status)
+
+        async def _send(msg):
+            if msg["type"] == "http.response.start":
+                observe(msg["status"])
+            await send(msg)
+
+        HTTP_IN_PROGRESS.inc(method)
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            HTTP_IN_PROGRESS.dec(method)
+            if not observed:
+                observe(500)
+
+
+# -----------------------------
+# Snapshots por proceso
+# -----------------------------
+def _path(name: str) -> str:
+    return os.path.join(METRICS_DIR, name)
+
+
+def _snapshot() -> Dict[str, Any]:
+    # los caches llevan sus propios contadores (por proceso): se copian tal cual
+    for name, c in _caches.items():
+        with CACHE_HITS._lock, CACHE_MISSES._lock:
+            CACHE_HITS._values[(name,)] = c.hits
+            CACHE_MISSES._values[(name,)] = c.misses
+        if hasattr(c, "__len__"):
+            with CACHE_ENTRIES._lock:
+                CACHE_ENTRIES._values[(name,)] = len(c)
+    return {"pid": os.getpid(), "metrics": {m.name: m._snapshot() for m in _registry.values() if m.shared}}
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def flush() -> None:
+    """Escribe el snapshot de este proceso (se llama solo, pero se puede forzar)."""
+    global _dirty
+    with _state_lock:
+        _dirty = False
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write_json(_path(f"{_proc_id}.json"), _snapshot())
+
+
+def _flusher_loop() -> None:
+    while True:
+        time.sleep(FLUSH_INTERVAL_S)
+        if _dirty or _caches:
+            try:
+                flush()
+            except OSError:
+                pass
+
+
+def _start_flusher() -> None:
+    global _flusher
+    with _state_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flusher_loop, name="metrics-flusher", daemon=True)
+            _flusher.start()
+
+
+def _after_fork() -> None:
+    # el hijo no hereda lo contado por el padre (se contaría dos veces)
+    global _proc_id, _flusher
+    _proc_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    _flusher = None
+    for m in _registry.values():
+        m._reset()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+@atexit.register
+def _flush_at_exit() -> None:
+    if _dirty:
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+# -----------------------------
+# Agregación y exposición
+# -----------------------------
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _load(path: str) -> Dict[str, Any] | None:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(into: Dict[str, Dict[str, Any]], metrics: Dict[str, Dict[str, Any]], kinds: Tuple[str, ...]) -> None:
+    for name, values in metrics.items():
+        m = _registry.get(name)
+        if m is None or m.kind not in kinds:
+            continue
+        dst = into.setdefault(name, {})
+        for key, v in values.items():
+            if isinstance(v, list):
+                cur = dst.get(key)
+                dst[key] = v[:] if cur is None else [a + b for a, b in zip(cur, v)]
+            else:
+                dst[key] = dst.get(key, 0) + v
+
+
+def collect() -> Dict[str, Dict[str, Any]]:
+    """Suma los snapshots de todos los procesos; pliega al archivo los de procesos muertos."""
+    flush()
+    out: Dict[str, Dict[str, Any]] = {}
+    live = []
+    with open(_path(_LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            archive = _load(_path(_ARCHIVE)) or {"metrics": {}}
+            folded = False
+            for name in os.listdir(METRICS_DIR):
+                if not name.endswith(".json") or name == _ARCHIVE:
+                    continue
+                snap = _load(_path(name))
+                if snap is None:
+                    continue
+                if _alive(snap["pid"]):
+                    live.append(snap)
+                    continue
+                _merge(archive["metrics"], snap["metrics"], ("counter", "histogram"))
+                os.remove(_path(name))
+                folded = True
+            if folded:
+                _write_json(_path(_ARCHIVE), archive)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    _merge(out, archive["metrics"], ("counter", "histogram"))
+    for snap in live:
+        _merge(out, snap["metrics"], ("counter", "histogram", "gauge"))
+    for m in _registry.values():
+        if not m.shared:
+            out[m.name] = m._snapshot()
+    return out
+
+
+def _fmt_labels(names: Tuple[str, ...], values: List[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+def render() -> str:
+    """Formato de texto de Prometheus (text/plain; version=0.0.4)."""
+    data = collect()
+    lines: List[str] = []
+    for name, m in _registry.items():
+        values = data.get(name)
+        if not values:
+            continue
+        lines.append(f"# HELP {name} {m.help}")
+        lines.append(f"# TYPE {name} {m.kind}")
+        for key, v in sorted(values.items()):
+            labels = json.loads(key)
+            if m.kind != "histogram":
+                lines.append(f"{name}{_fmt_labels(m.labels, labels)} {_num(v)}")
+                continue
+            acc = 0
+            for le, c in zip(m.buckets + (float("inf"),), v[:-2]):
+                acc += c
+                le_label = 'le="%s"' % ("+Inf" if le == float("inf") else _num(le))
+                lines.append(f"{name}_bucket{_fmt_labels(m.labels, labels, le_label)} {acc}")
+            lines.append(f"{name}_sum{_fmt_labels(m.labels, labels)} {_num(v[-2])}")
+            lines.append(f"{name}_count{_fmt_labels(m.labels, labels)} {v[-1]}")
+
+    # derivada: proporción de aciertos por cache (sobre todos los procesos)
+    hits, misses = data.get(CACHE_HITS.name, {}), data.get(CACHE_MISSES.name, {})
+    if hits or misses:
+        name = f"{PREFIX}cache_hit_ratio"
+        lines.append(f"# HELP {name} Aciertos / (aciertos + fallos)")
+        lines.append(f"# TYPE {name} gauge")
+        for key in sorted(set(hits) | set(misses)):
+            h, m = hits.get(key, 0), misses.get(key, 0)
+            if h + m:
+                lines.append(f"{name}{_fmt_labels(('cache',), json.loads(key))} {_num(h / (h + m))}")
+    return "\n".join(lines) + "\n"
@@ -1,8 +1,11 @@
-from pydantic import BaseModel
-from typing import Optional, Literal
+from pydantic import BaseModel, Field
+from typing import List, Optional, Literal
 
 EventType = Literal["LLEGADA", "INICIO", "PAUSA", "REANUDADO", "FIN"]
 
+# el event_id termina en nombres de archivo (spool, fotos): nada de "/", "." ni ".."
+EVENT_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
 class CreateEvent(BaseModel):
     task_id: str
     ot: str
@@ -15,4 +18,10 @@ class CreateEvent(BaseModel):
     accuracy_m: Optional[float] = None
     pause_reason: Optional[str] = None
     comment: Optional[str] = None
+    # id generado en el celular: hace idempotente el reenvío desde el outbox
+    client_event_id: Optional[str] = Field(default=None, pattern=EVENT_ID_PATTERN)
+
+
+class CreateEventsBatch(BaseModel):
+    events: List[CreateEvent] = Field(max_length=500)
 
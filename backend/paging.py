@@ -0,0 +1,40 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+# Tamaño de página por defecto / máximo que acepta la API
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Cursor opaco (keyset): los valores de orden de la última fila entregada."""
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(values, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str | None, size: int) -> List[Any] | None:
+    """Inversa de encode_cursor. ValueError si el cursor no es válido."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except Exception:
+        raise ValueError("cursor inválido")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("cursor inválido")
+    return values
+
+
+def page(rows: List[Dict[str, Any]], limit: int | None, key: Callable[[Dict[str, Any]], List[Any]]) -> Dict[str, Any]:
+    """
+    `rows` se pidió con limit + 1: si sobra una fila hay página siguiente y
+    `next` es el cursor de la última fila entregada.
+    """
+    if limit is None or len(rows) <= limit:
+        return {"rows": rows, "next": None}
+    rows = rows[:limit]
+    return {"rows": rows, "next": encode_cursor(key(rows[-1]))}
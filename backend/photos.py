@@ -0,0 +1,179 @@
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from PIL import Image, ImageOps
+
+import backend.local_db as bq
+from backend import storage
+from backend.models import EVENT_ID_PATTERN
+
+# Fotos recibidas que todavía no se procesaron (sobreviven a un reinicio)
+SPOOL_DIR = os.path.join("local_data", "photo_spool")
+
+# Lado mayor de la foto guardada / de la miniatura del tablero
+PHOTO_MAX_SIDE = int(os.getenv("PHOTO_MAX_SIDE", "1600"))
+THUMB_SIDE = int(os.getenv("PHOTO_THUMB_SIDE", "320"))
+JPEG_QUALITY = int(os.getenv("PHOTO_JPEG_QUALITY", "82"))
+
+# Pillow libera el GIL al decodificar/redimensionar: con threads alcanza
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", "2"))
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+# se llama cuando una foto quedó publicada (main.py avisa al tablero en vivo)
+on_published: Callable[[str], None] | None = None
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=PHOTO_WORKERS, thread_name_prefix="photos")
+    return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        # lo que quede en el spool se retoma al arrancar (resume)
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+_EVENT_ID = re.compile(EVENT_ID_PATTERN)
+
+
+def _check_id(event_id: str) -> str:
+    # el modelo ya lo valida; se repite acá porque con el id se arman rutas y nombres de blobs
+    if not _EVENT_ID.match(event_id):
+        raise ValueError(f"event_id inválido: {event_id!r}")
+    return event_id
+
+
+def spool_path(event_id: str) -> str:
+    _check_id(event_id)
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    return os.path.join(SPOOL_DIR, f"{event_id}.upload")
+
+
+def submit(event_id: str) -> Future:
+    """Encola el procesamiento de la foto ya guardada en spool_path(event_id)."""
+    return _get_pool().submit(process, event_id)
+
+
+def _work_path(event_id: str) -> str:
+    # foto tomada por este proceso (ver process); el pid evita choques entre workers
+    _check_id(event_id)
+    return os.path.join(SPOOL_DIR, f"{event_id}.{os.getpid()}.work")
+
+
+def _alive(pid: int) -> bool:
+    if pid == os.getpid():
+        # al arrancar no hay nada tomado por este proceso: es de una vida anterior
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def resume() -> int:
+    """
+    Reencola las fotos que quedaron en el spool (p.ej. el proceso se reinició).
+    Corre en cada worker: process() toma cada foto con un rename atómico, así
+    que una foto encolada por varios se procesa una sola vez. Lo que tenía
+    tomado un proceso que ya no existe vuelve al spool.
+    """
+    if not os.path.isdir(SPOOL_DIR):
+        return 0
+    n = 0
+    for name in os.listdir(SPOOL_DIR):
+        if ".work" in name:
+            base, _, rest = name.partition(".work")
+            event_id, _, pid = base.rpartition(".")
+            if not pid.isdigit() or not _EVENT_ID.match(event_id) or _alive(int(pid)):
+                continue
+            path = os.path.join(SPOOL_DIR, name)
+            if rest:
+                # jpg intermedio de un proceso muerto
+                _remove(path)
+                continue
+            try:
+                os.rename(path, spool_path(event_id))
+            except FileNotFoundError:
+                continue  # otro worker la devolvió primero
+            name = f"{event_id}.upload"
+        if name.endswith(".upload") and _EVENT_ID.match(name[: -len(".upload")]):
+            submit(name[: -len(".upload")])
+            n += 1
+    return n
+
+
+def _save_jpeg(img: Image.Image, side: int, path: str) -> None:
+    out = img.copy()
+    out.thumbnail((side, side), Image.Resampling.LANCZOS)
+    out.save(path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+
+def process(event_id: str) -> bool:
+    """
+    Normaliza la foto (orientación EXIF, RGB, lado máximo), genera la
+    miniatura, sube ambas al backend de blobs y completa el evento.
+    """
+    src = spool_path(event_id)
+    work = _work_path(event_id)
+    try:
+        # la toma este proceso: otro worker que la tenga encolada no la encuentra
+        os.rename(src, work)
+    except FileNotFoundError:
+        return False
+
+    big = f"{work}.jpg"
+    thumb = f"{work}.thumb.jpg"
+    done = False
+    try:
+        try:
+            with Image.open(work) as im:
+                img = ImageOps.exif_transpose(im).convert("RGB")
+        except Exception:
+            # no es una imagen válida: se descarta (el evento queda sin foto)
+            _remove(work)
+            done = True
+            return False
+
+        _save_jpeg(img, PHOTO_MAX_SIDE, big)
+        _save_jpeg(img, THUMB_SIDE, thumb)
+
+        blobs = storage.get_blobs()
+        photo_url = blobs.put_file(big, f"events/{event_id}.jpg", "image/jpeg")
+        thumb_url = blobs.put_file(thumb, f"events/thumbs/{event_id}.jpg", "image/jpeg")
+
+        bq.set_event_photo(event_id, photo_url, thumb_url)
+        # recién con la foto publicada se borra el original
+        _remove(work)
+        done = True
+    finally:
+        if not done:
+            # falló la subida: vuelve al spool y se reintenta en el próximo arranque
+            os.replace(work, src)
+        _remove(big)
+        _remove(thumb)
+
+    if on_published:
+        on_published(event_id)
+    return True
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except Exception:
+        pass
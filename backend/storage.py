@@ -1,26 +1,72 @@
-import os, uuid
-from google.cloud import storage
+import os
+import shutil
 
 PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT")
 BUCKET = os.getenv("GCS_BUCKET")
 
-storage_client = storage.Client(project=PROJECT)
+# Dónde quedan las fotos: "local" (local_data/media, servido en /media) o "gcs".
+# Por defecto GCS solo si hay bucket configurado.
+PHOTO_BACKEND = os.getenv("PHOTO_BACKEND", "gcs" if BUCKET else "local")
 
-def upload_photo(file_bytes: bytes, content_type: str, filename_hint: str = "photo"):
-    if not BUCKET:
-        raise RuntimeError("Falta GCS_BUCKET en variables de entorno.")
-    bucket = storage_client.bucket(BUCKET)
+MEDIA_DIR = os.path.join("local_data", "media")
+MEDIA_URL = "/media"
 
-    ext = ""
-    if filename_hint and "." in filename_hint:
-        ext0 = filename_hint.split(".")[-1].lower().strip()
-        if ext0:
-            ext = f".{ext0}"
 
-    blob_name = f"events/{uuid.uuid4().hex}{ext}"
-    blob = bucket.blob(blob_name)
-    blob.upload_from_string(file_bytes, content_type=content_type or "image/jpeg")
+class LocalBlobs:
+    """Archivos en disco; main.py los sirve como estáticos en MEDIA_URL."""
+
+    def __init__(self, root: str = MEDIA_DIR, base_url: str = MEDIA_URL):
+        self.root = root
+        self.base_url = base_url
+
+    def put_file(self, path: str, name: str, content_type: str) -> str:
+        root = os.path.realpath(self.root)
+        dest = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, dest]) != root or dest == root:
+            raise ValueError(f"nombre de blob fuera de {self.root}: {name!r}")
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(path, dest)
+        return f"{self.base_url}/{name}"
+
+
+class GcsBlobs:
+    """Bucket de GCS (el cliente se crea recién al primer uso)."""
+
+    def __init__(self, bucket: str | None = BUCKET):
+        self.bucket_name = bucket
+        self._bucket = None
+
+    def _get_bucket(self):
+        if self._bucket is None:
+            if not self.bucket_name:
+                raise RuntimeError("Falta GCS_BUCKET en variables de entorno.")
+            from google.cloud import storage
+
+            self._bucket = storage.Client(project=PROJECT).bucket(self.bucket_name)
+        return self._bucket
+
+    def put_file(self, path: str, name: str, content_type: str) -> str:
+        blob = self._get_bucket().blob(name)
+        # desde archivo: no se arma el objeto entero en memoria
+        blob.upload_from_filename(path, content_type=content_type)
+
+        # MVP: público. Luego lo pasamos a Signed URL si querés.
+        blob.make_public()
+        return blob.public_url
+
+
+_blobs = None
+
+
+def get_blobs():
+    global _blobs
+    if _blobs is None:
+        _blobs = GcsBlobs() if PHOTO_BACKEND == "gcs" else LocalBlobs()
+    return _blobs
+
+
+def set_blobs(b) -> None:
+    """Reemplaza el backend (p.ej. por uno en memoria en pruebas/benchmarks)."""
+    global _blobs
+    _blobs = b
 
-    # MVP: público. Luego lo pasamos a Signed URL si querés.
-    blob.make_public()
-    return blob.public_url
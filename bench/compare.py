@@ -0,0 +1,50 @@
+"""
+Compara dos salidas de bench.run (base vs nuevo), fila por fila.
+
+    PYTHONPATH=. python -m bench.compare base.json nuevo.json [--metric p95_ms] [--threshold 1.2]
+
+Sale con código 1 si alguna fila empeoró más que `threshold` en la métrica.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Tuple
+
+KEY = ("scale_events", "backend", "mode", "endpoint")
+
+
+def _load(path: str) -> Dict[Tuple, Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {tuple(r[k] for k in KEY): r for r in data["results"]}
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("base")
+    p.add_argument("new")
+    p.add_argument("--metric", default="p95_ms")
+    p.add_argument("--threshold", type=float, default=1.2)
+    args = p.parse_args(argv)
+
+    base, new = _load(args.base), _load(args.new)
+    worse = 0
+    print(f"{'escala':>8} {'backend':9} {'modo':9} {'endpoint':38} {'base':>10} {'nuevo':>10} {'ratio':>7}")
+    for key in sorted(set(base) | set(new), key=str):
+        b = base.get(key, {}).get(args.metric)
+        n = new.get(key, {}).get(args.metric)
+        ratio = n / b if b and n is not None else None
+        # en latencias más es peor; en throughput, menos
+        bad = ratio is not None and (
+            ratio < 1 / args.threshold if args.metric.startswith("throughput") else ratio > args.threshold
+        )
+        worse += bad
+        print(
+            f"{key[0]:>8} {key[1]:9} {key[2]:9} {key[3]:38} {b if b is not None else '-':>10} "
+            f"{n if n is not None else '-':>10} {(f'{ratio:.2f}' if ratio is not None else '-'):>7}{'  <-' if bad else ''}"
+        )
+    return 1 if worse else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
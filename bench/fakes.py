@@ -0,0 +1,154 @@
+"""
+Backends falsos para medir sin servicios externos:
+  - FakeBigQuery: cliente en memoria para backend.bq (bq.set_client)
+  - MemoryBlobs: fotos en memoria (storage.set_blobs)
+
+FakeBigQuery NO es un motor SQL: reconoce las consultas que arma backend/bq.py
+(MERGE de tasks, listado de tasks, historial de eventos, tablero) y las
+resuelve con índices en memoria mantenidos al escribir, así que su costo es
+del orden del resultado. Lo que se mide con él es el lado cliente (armado de
+SQL y parámetros, buffer de eventos, conversión de filas) más `latency_s` por
+job, que simula la ida y vuelta a BigQuery. No entiende los cursores (after).
+"""
+import re
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from backend import bq
+
+
+class _Job:
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self._rows = rows
+
+    def result(self):
+        return list(self._rows)
+
+
+class FakeBigQuery:
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+        self.jobs = 0
+        self.tasks: Dict[str, Dict[str, Any]] = {}  # unique_key -> fila
+        self.tasks_by_id: Dict[str, Dict[str, Any]] = {}
+        self.tasks_by_cuadrilla: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self.events_by_task: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.latest: Dict[str, Dict[str, Any]] = {}  # unique_key -> último evento
+        self._event_ids: set = set()
+        self._lock = threading.Lock()
+
+    # --- administración de tablas (ensure_tables_exist / migrate_tables) ---
+    def get_dataset(self, ds_id):
+        return SimpleNamespace(dataset_id=ds_id)
+
+    def create_dataset(self, ds, exists_ok=False):
+        return ds
+
+    def get_table(self, table_id):
+        name = table_id.rsplit(".", 1)[-1]
+        if name == bq.EVENTS_TABLE:
+            return SimpleNamespace(
+                clustering_fields=bq.EVENTS_CLUSTERING,
+                time_partitioning=SimpleNamespace(field=bq.EVENTS_PARTITION_FIELD),
+            )
+        return SimpleNamespace(clustering_fields=bq.TASKS_CLUSTERING, time_partitioning=None)
+
+    def create_table(self, table):
+        return table
+
+    def update_table(self, table, fields):
+        return table
+
+    # --- datos ---
+    def _wait(self) -> None:
+        self.jobs += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    def insert_rows_json(self, table, rows, row_ids=None, skip_invalid_rows=False):
+        self._wait()
+        with self._lock:
+            for r, rid in zip(rows, row_ids or [None] * len(rows)):
+                # como insertId: el reenvío del mismo evento no se duplica
+                if rid is not None:
+                    if rid in self._event_ids:
+                        continue
+                    self._event_ids.add(rid)
+                self.events_by_task[r.get("task_id")].append(r)
+                key = r.get("unique_key")
+                prev = self.latest.get(key)
+                if key and (prev is None or (r.get("event_time") or "") >= (prev.get("event_time") or "")):
+                    self.latest[key] = r
+        return []
+
+    def query(self, sql: str, job_config=None):
+        self._wait()
+        params = {p.name: p for p in (job_config.query_parameters if job_config else [])}
+        scalars = {k: getattr(p, "value", None) for k, p in params.items()}
+        m = re.search(r"LIMIT (\d+)", sql)
+        limit = int(m.group(1)) if m else None
+        text = sql.lstrip()
+
+        with self._lock:
+            if text.startswith("MERGE"):
+                rows = [dict(s.struct_values) for s in params["rows"].values]
+                self._merge_tasks(rows)
+                return _Job([])
+            if "ROW_NUMBER()" in sql:
+                return _Job(self._dashboard(scalars)[:limit])
+            if f".{bq.TASKS_TABLE}`" in sql:
+                return _Job(self._tasks(scalars)[:limit])
+            if f".{bq.EVENTS_TABLE}`" in sql:
+                return _Job(self._events(scalars)[:limit])
+        return _Job([])
+
+    def _merge_tasks(self, rows: List[Dict[str, Any]]) -> None:
+        for r in rows:
+            prev = self.tasks.get(r["unique_key"])
+            if prev is not None:
+                prev.update(source_file=r["source_file"], status=r["status"], updated_at=r["updated_at"])
+                continue
+            self.tasks[r["unique_key"]] = r
+            self.tasks_by_id[r["task_id"]] = r
+            self.tasks_by_cuadrilla[(r.get("cuadrilla") or "").strip()][r["task_id"]] = r
+
+    def _tasks(self, p: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if "task_id" in p:
+            t = self.tasks_by_id.get(p["task_id"])
+            return [t] if t else []
+        rows = list(self.tasks_by_cuadrilla.get(p.get("cuadrilla"), {}).values())
+        for col in ("contratista", "status"):
+            if p.get(col):
+                rows = [r for r in rows if r.get(col) == p[col]]
+        rows.sort(key=lambda r: (r.get("created_at") or "", r["task_id"]), reverse=True)
+        return rows
+
+    def _events(self, p: Dict[str, Any]) -> List[Dict[str, Any]]:
+        rows = self.events_by_task.get(p.get("task_id"), [])
+        if p.get("event_type"):
+            rows = [r for r in rows if r.get("event_type") == p["event_type"]]
+        return sorted(rows, key=lambda r: (r.get("event_time") or "", r.get("event_id") or ""))
+
+    def _dashboard(self, p: Dict[str, Any]) -> List[Dict[str, Any]]:
+        since = p["since"].isoformat() if p.get("since") is not None else ""
+        rows = [r for r in self.latest.values() if (r.get("event_time") or "") >= since]
+        for col in ("cuadrilla", "event_type"):
+            if p.get(col):
+                rows = [r for r in rows if r.get(col) == p[col]]
+        rows.sort(key=lambda r: (r.get("event_time") or "", r.get("unique_key") or ""), reverse=True)
+        return rows
+
+
+class MemoryBlobs:
+    """Mismo contrato que storage.LocalBlobs, sin tocar disco."""
+
+    def __init__(self):
+        self.blobs: Dict[str, bytes] = {}
+
+    def put_file(self, path: str, name: str, content_type: str) -> str:
+        with open(path, "rb") as f:
+            self.blobs[name] = f.read()
+        return f"mem://{name}"
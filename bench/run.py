@@ -0,0 +1,442 @@
+"""
+Benchmark reproducible del backend.
+
+    PYTHONPATH=. python -m bench.run --events 10000,100000 --out bench-results.json
+    PYTHONPATH=. python -m bench.compare base.json nuevo.json
+
+Cada escala (cantidad de eventos sembrados) corre en un proceso y un
+directorio temporal propios (local_data es relativo al cwd). Por escala:
+  - seed:      import del Excel sintético + carga de eventos (throughput)
+  - store:     funciones del store, local_db vs bq (con fakes.FakeBigQuery)
+  - inprocess: endpoints vía TestClient, de a un pedido
+  - http:      endpoints contra uvicorn, con --concurrency clientes a la vez
+La salida es JSON (una fila por escala/backend/modo/endpoint, con
+throughput y p50/p95/p99) pensada para compararse entre versiones.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCHEMA_VERSION = 1
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+SEED_BATCH = 500
+
+
+# -----------------------------
+# Estadísticas
+# -----------------------------
+def _pct(sorted_vals: List[float], q: float) -> float:
+    # nearest-rank: siempre un valor observado
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, int(round(q / 100 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+
+def summarize(latencies: List[float], wall_s: float, errors: int, items: int = 1) -> Dict[str, Any]:
+    """`items`: unidades por operación (p.ej. filas de un lote) para el throughput de items."""
+    lat = sorted(latencies)
+    n = len(lat)
+    ms = lambda v: round(v * 1000, 3)  # noqa: E731
+    return {
+        "n": n,
+        "errors": errors,
+        "wall_s": round(wall_s, 4),
+        "throughput_ops": round(n / wall_s, 2) if wall_s > 0 else None,
+        "throughput_items": round(n * items / wall_s, 2) if wall_s > 0 else None,
+        "mean_ms": ms(sum(lat) / n) if n else None,
+        "p50_ms": ms(_pct(lat, 50)),
+        "p95_ms": ms(_pct(lat, 95)),
+        "p99_ms": ms(_pct(lat, 99)),
+        "max_ms": ms(lat[-1]) if n else None,
+    }
+
+
+def measure(fn: Callable[[int], Any], n: int, concurrency: int = 1) -> tuple[List[float], float, int]:
+    """Corre fn(0..n-1); con concurrency > 1 desde un pool de threads."""
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        nonlocal errors
+        t0 = time.perf_counter()
+        try:
+            fn(i)
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        dt = time.perf_counter() - t0
+        with lock:
+            latencies.append(dt)
+
+    t0 = time.perf_counter()
+    if concurrency <= 1:
+        for i in range(n):
+            one(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(n)))
+    return latencies, time.perf_counter() - t0, errors
+
+
+class Results:
+    def __init__(self, scale: int):
+        self.scale = scale
+        self.rows: List[Dict[str, Any]] = []
+
+    def add(self, backend: str, mode: str, endpoint: str, stats: Dict[str, Any], **extra) -> None:
+        row = {"scale_events": self.scale, "backend": backend, "mode": mode, "endpoint": endpoint, **stats, **extra}
+        self.rows.append(row)
+        print(
+            f"  {backend:9} {mode:9} {endpoint:38} n={stats['n']:<6} err={stats['errors']:<3} "
+            f"ops/s={stats['throughput_ops']}  p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms",
+            flush=True,
+        )
+
+    def run(self, backend: str, mode: str, endpoint: str, fn, n: int, concurrency: int = 1, items: int = 1, **extra):
+        lat, wall, err = measure(fn, n, concurrency)
+        self.add(backend, mode, endpoint, summarize(lat, wall, err, items), concurrency=concurrency, **extra)
+
+
+# -----------------------------
+# Datos
+# -----------------------------
+def _task_rows(path: str) -> List[Dict[str, Any]]:
+    """Filas de tasks tal como las arma el import (para los upserts del store)."""
+    from backend import importer
+
+    now = START.isoformat()
+    rows: List[Dict[str, Any]] = []
+    _, batches = importer.read_task_batches(path)
+    for df in batches:
+        batch = importer.build_task_batch(df.fillna("").astype(str), "bench", os.path.basename(path), now)
+        cols = list(batch)
+        rows += [dict(zip(cols, vals)) for vals in zip(*batch.values())]
+    return rows
+
+
+def _events(tasks, n: int, seed: int) -> List[Dict[str, Any]]:
+    from bench import synth
+
+    return list(synth.make_events(tasks, n, seed=seed, start=START))
+
+
+def _jpeg(side: int = 2000) -> bytes:
+    from PIL import Image
+
+    img = Image.linear_gradient("L").resize((side, side * 3 // 4)).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+# -----------------------------
+# Store: local_db vs bq (fake)
+# -----------------------------
+def seed_and_bench_store(res: Results, args, tasks, wb_path: str) -> None:
+    from bench import fakes, synth
+    from backend import bq as bq_store
+    from backend import jobs
+    import backend.local_db as local
+
+    keys = {t["task_id"]: t["unique_key"] for t in tasks}
+    created = START.isoformat()
+    events = _events(tasks, args.scale, seed=args.seed)
+    rows = [synth.event_row(p, keys[p["task_id"]], created) for p in events]
+    task_rows = _task_rows(wb_path)
+
+    fake = fakes.FakeBigQuery(latency_s=args.bq_latency_ms / 1000)
+    bq_store.set_client(fake)
+
+    backends = {
+        "local_db": {
+            "seed_tasks": lambda: jobs.import_file(wb_path, os.path.basename(wb_path), "seed"),
+            "insert_events": local.insert_events,
+            "insert_event": local.insert_event,
+            "upsert_tasks": local.upsert_tasks,
+            "list_tasks_by_cuadrilla": local.list_tasks_by_cuadrilla,
+            "events_page": lambda task_id: local.events_page(task_id, limit=200),
+            "dashboard_latest": local.dashboard_latest,
+        },
+        "bq": {
+            "seed_tasks": lambda: bq_store.upsert_tasks(task_rows),
+            "insert_events": lambda batch: bq_store.insert_events(batch, wait=True),
+            # wait=True: el insert_rows_json sale en el momento (escritura, como en local_db)
+            "insert_event": lambda row: bq_store.insert_event(row, wait=True),
+            # lo que ve el handler: solo el append al EventBuffer (el envío va aparte)
+            "enqueue_event": bq_store.insert_event,
+            "upsert_tasks": bq_store.upsert_tasks,
+            "list_tasks_by_cuadrilla": bq_store.list_tasks_by_cuadrilla,
+            "events_page": lambda task_id: bq_store.events_page(task_id, limit=200),
+            "dashboard_latest": lambda: bq_store.dashboard_latest(window_days=0),
+        },
+    }
+
+    for name, b in backends.items():
+        print(f"[{args.scale}] {name}: sembrando", flush=True)
+        res.run(name, "seed", "import tasks", lambda _i: b["seed_tasks"](), 1, items=len(tasks))
+        batches = [rows[i : i + SEED_BATCH] for i in range(0, len(rows), SEED_BATCH)]
+        res.run(name, "seed", f"insert_events[{SEED_BATCH}]", lambda i: b["insert_events"](batches[i]), len(batches), items=SEED_BATCH)
+
+        rng = random.Random(args.seed)
+        fresh = [synth.event_row(p, keys[p["task_id"]], created) for p in _events(tasks, args.requests, seed=args.seed + 1)]
+        chunks = [task_rows[i : i + SEED_BATCH] for i in range(0, len(task_rows), SEED_BATCH)]
+        cuadrillas = sorted({t["Cuadrilla"] for t in tasks})
+
+        res.run(name, "store", "insert_event", lambda i: b["insert_event"](fresh[i]), len(fresh))
+        if "enqueue_event" in b:
+            queued = [synth.event_row(p, keys[p["task_id"]], created) for p in _events(tasks, args.requests, seed=args.seed + 2)]
+            res.run(name, "store", "insert_event (solo encolado)", lambda i: b["enqueue_event"](queued[i]), len(queued))
+            res.run(name, "store", f"flush_events[{len(queued)}]", lambda _i: bq_store.flush_events(), 1, items=len(queued))
+        res.run(name, "store", f"upsert_tasks[{SEED_BATCH}]", lambda i: b["upsert_tasks"](chunks[i % len(chunks)]), args.batches, items=SEED_BATCH)
+        res.run(name, "store", "list_tasks_by_cuadrilla", lambda _i: b["list_tasks_by_cuadrilla"](rng.choice(cuadrillas)), args.requests)
+        res.run(name, "store", "events_page", lambda _i: b["events_page"](rng.choice(tasks)["task_id"]), args.requests)
+        res.run(name, "store", "dashboard_latest", lambda _i: b["dashboard_latest"](), args.requests)
+
+    bq_store.flush_events()
+
+
+# -----------------------------
+# Endpoints (TestClient / HTTP)
+# -----------------------------
+def _check(r):
+    if r.status_code >= 400:
+        raise RuntimeError(f"{r.status_code}: {r.text[:200]}")
+    return r
+
+
+def endpoint_specs(args, tasks, seed: int, uploads: List[bytes], photo: bytes) -> List[tuple]:
+    """(endpoint, cantidad, fn(client, i)). Cada modo usa su `seed`: eventos nuevos, no reenvíos."""
+    rng = random.Random(seed)
+    n = args.requests
+    events = _events(tasks, n + 100 * args.batches, seed=seed)
+    single, batch = events[:n], events[n:]
+    with_photo = _events(tasks, args.photos, seed=seed + 7)
+    cuadrillas = sorted({t["Cuadrilla"] for t in tasks})
+    frm, to = START.isoformat(), (START + timedelta(days=120)).isoformat()
+    lock = threading.Lock()
+
+    def pick(seq):
+        with lock:
+            return rng.choice(seq)
+
+    def photo_post(c, i):
+        data = {k: str(v) for k, v in with_photo[i].items() if v is not None}
+        return _check(c.post("/api/event_with_photo", data=data, files={"photo": ("foto.jpg", photo, "image/jpeg")}))
+
+    def near(c, _i):
+        t = pick(tasks)
+        return _check(c.get("/api/geo/events", params={"lat": t["lat"], "lon": t["lon"], "radius_m": 5000, "limit": 100}))
+
+    return [
+        ("POST /api/event", n, lambda c, i: _check(c.post("/api/event", json=single[i]))),
+        ("POST /api/events/batch[100]", args.batches, lambda c, i: _check(
+            c.post("/api/events/batch", json={"events": batch[i * 100 : (i + 1) * 100]}))),
+        ("GET /api/tasks", n, lambda c, _i: _check(c.get("/api/tasks", params={"cuadrilla": pick(cuadrillas)}))),
+        ("GET /api/task/{id}/events", n, lambda c, _i: _check(c.get(f"/api/task/{pick(tasks)['task_id']}/events"))),
+        ("GET /api/dashboard", n, lambda c, _i: _check(c.get("/api/dashboard"))),
+        ("GET /api/analytics", n, lambda c, _i: _check(c.get("/api/analytics", params={"from_time": frm, "to_time": to}))),
+        ("GET /api/geo/events", n, near),
+        ("GET /api/geo/cuadrillas", n, lambda c, _i: _check(c.get("/api/geo/cuadrillas"))),
+        ("POST /api/upload_tasks", len(uploads), lambda c, i: _check(
+            c.post("/api/upload_tasks", files=[("files", (f"bench-{seed}-{i}.xlsx", uploads[i]))]))),
+        # al final: el procesamiento de fotos en background compite por CPU
+        ("POST /api/event_with_photo", len(with_photo), photo_post),
+    ]
+
+
+def _wait_job(c, job_id: str, timeout: float = 600) -> Dict[str, Any]:
+    t_end = time.monotonic() + timeout
+    while time.monotonic() < t_end:
+        job = _check(c.get(f"/api/upload_jobs/{job_id}")).json()
+        if job["status"] not in ("PENDIENTE", "PROCESANDO"):
+            return job
+        time.sleep(0.02)
+    raise TimeoutError(job_id)
+
+
+def _uploads(tasks_n: int, count: int, seed: int) -> List[bytes]:
+    from bench import synth
+
+    out = []
+    for k in range(count):
+        path = f"upload-{seed}-{k}.xlsx"
+        synth.write_workbook(path, synth.make_tasks(tasks_n, seed=seed * 1000 + k), seed=seed * 1000 + k)
+        with open(path, "rb") as f:
+            out.append(f.read())
+        os.remove(path)
+    return out
+
+
+def bench_inprocess(res: Results, args, tasks, photo: bytes) -> None:
+    from fastapi.testclient import TestClient
+
+    from bench import fakes
+    from backend import storage
+    from backend.main import app
+
+    storage.set_blobs(fakes.MemoryBlobs())
+    uploads = _uploads(args.upload_rows, args.uploads, seed=args.seed + 100)
+    print(f"[{args.scale}] inprocess", flush=True)
+    with TestClient(app) as c:
+        for endpoint, count, fn in endpoint_specs(args, tasks, args.seed + 10, uploads, photo):
+            res.run("local_db", "inprocess", endpoint, lambda i: fn(c, i), count)
+
+        # import completo (POST + parseo en el pool + upsert), de a un archivo
+        more = _uploads(args.upload_rows, args.uploads, seed=args.seed + 200)
+        post = lambda i: _wait_job(c, _check(c.post("/api/upload_tasks", files=[("files", (f"job-{i}.xlsx", more[i]))])).json()["job_id"])  # noqa: E731
+        res.run("local_db", "inprocess", "upload_tasks (job done)", post, len(more), items=args.upload_rows)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_http(res: Results, args, tasks, photo: bytes) -> None:
+    import httpx
+
+    port = _free_port()
+    env = {**os.environ, "PYTHONPATH": ROOT, "PHOTO_BACKEND": "local"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.http_workers), "--log-level", "warning"],
+        env=env,
+        # grupo propio: al terminar se cierran también los procesos del pool de import
+        start_new_session=True,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(300):
+            try:
+                if httpx.get(f"{base}/api/health").status_code == 200:
+                    break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError("uvicorn no arrancó")
+
+        uploads = _uploads(args.upload_rows, args.uploads, seed=args.seed + 300)
+        print(f"[{args.scale}] http (concurrency={args.concurrency}, workers={args.http_workers})", flush=True)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        with httpx.Client(base_url=base, timeout=120, limits=limits) as c:
+            for endpoint, count, fn in endpoint_specs(args, tasks, args.seed + 20, uploads, photo):
+                res.run("local_db", "http", endpoint, lambda i: fn(c, i), count, concurrency=args.concurrency,
+                        http_workers=args.http_workers)
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def run_scale(args) -> List[Dict[str, Any]]:
+    """Corre una escala en el cwd actual (directorio temporal)."""
+    from bench import synth
+
+    res = Results(args.scale)
+    tasks = synth.make_tasks(args.tasks, args.cuadrillas, seed=args.seed)
+    wb = synth.write_workbook("seed.xlsx", tasks, seed=args.seed)
+    photo = _jpeg()
+
+    seed_and_bench_store(res, args, tasks, wb["path"])
+    if "inprocess" in args.modes:
+        bench_inprocess(res, args, tasks, photo)
+    if "http" in args.modes:
+        bench_http(res, args, tasks, photo)
+    return res.rows
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def _git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark del backend (local_db vs bq fake)")
+    p.add_argument("--events", default="10000,100000", help="escalas: eventos sembrados, separados por coma")
+    p.add_argument("--tasks", type=int, default=2000, help="tareas de la planilla sembrada")
+    p.add_argument("--cuadrillas", type=int, default=50)
+    p.add_argument("--requests", type=int, default=300, help="pedidos por endpoint")
+    p.add_argument("--batches", type=int, default=10, help="lotes para upsert/batch")
+    p.add_argument("--uploads", type=int, default=3, help="Excels subidos por modo")
+    p.add_argument("--upload-rows", type=int, default=500)
+    p.add_argument("--photos", type=int, default=20)
+    p.add_argument("--modes", default="inprocess,http")
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--http-workers", type=int, default=1)
+    p.add_argument("--bq-latency-ms", type=float, default=0.0, help="ida y vuelta simulada por job de BigQuery")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", default="bench-results.json")
+    p.add_argument("--keep", action="store_true", help="no borrar los directorios temporales")
+    # interno: una escala, en el cwd actual
+    p.add_argument("--scale", type=int, help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+    args.modes = [m for m in args.modes.split(",") if m]
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+
+    if args.scale is not None:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(run_scale(args), f)
+        return
+
+    rows: List[Dict[str, Any]] = []
+    argv = list(argv if argv is not None else sys.argv[1:])
+    for scale in [int(s) for s in args.events.split(",") if s]:
+        work = tempfile.mkdtemp(prefix=f"bench-{scale}-")
+        print(f"== {scale} eventos en {work}", flush=True)
+        part = os.path.join(work, "part.json")
+        env = {**os.environ, "PYTHONPATH": ROOT, "LOCAL_DB_COMPACT_INTERVAL": os.getenv("LOCAL_DB_COMPACT_INTERVAL", "30")}
+        subprocess.run(
+            [sys.executable, "-m", "bench.run", *argv, "--scale", str(scale), "--out", part], cwd=work, env=env, check=True
+        )
+        with open(part, encoding="utf-8") as f:
+            rows += json.load(f)
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    out = {
+        "schema": SCHEMA_VERSION,
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("scale", "out", "keep")},
+        },
+        "results": sorted(rows, key=lambda r: (r["scale_events"], r["backend"], r["mode"], r["endpoint"])),
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(out, f, indent=2, ensure_ascii=False)
+    print(f"-> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
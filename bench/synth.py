@@ -0,0 +1,152 @@
+"""
+Datos sintéticos reproducibles (misma semilla = mismos datos):
+  - planillas Excel con varias hojas, el encabezado en filas variables y los
+    alias de importer.REQUIRED_ALIASES mezclados
+  - eventos de las cuadrillas sobre esas tareas
+"""
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List
+
+import openpyxl
+
+from backend import importer
+
+CONTRATISTAS = ["Contratista Norte", "Servicios Sur SRL", "Obras del Valle", "Redes Patagonia", "TecnoPozos"]
+OPERACIONES = ["Pulling", "Workover", "Limpieza de pozo", "Cambio de bomba", "Inspección", "Montaje"]
+PAUSE_REASONS = ["Clima", "Falta de materiales", "Espera de equipo", "Almuerzo", "Permiso de trabajo"]
+EXTRA_HEADERS = ["Fecha", "Observaciones", "Prioridad", "Yacimiento"]
+
+# Ciclo de eventos de una tarea (se repite si la tarea tiene más eventos)
+CYCLE = ["LLEGADA", "INICIO", "PAUSA", "REANUDADO", "FIN"]
+
+# Zona de trabajo (Neuquén) y dispersión de los check-ins alrededor de la tarea
+CENTER = (-38.95, -68.06)
+SPREAD_DEG = 1.5
+JITTER_DEG = 0.0005
+# fracción de check-ins lejos de su tarea (para que haya marcas geo)
+OUTLIER_RATE = 0.01
+
+
+def make_tasks(n: int, cuadrillas: int = 50, seed: int = 0) -> List[Dict[str, Any]]:
+    """Filas de la planilla (columnas canónicas) + task_id/unique_key que va a calcular el import."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        c = rng.randrange(cuadrillas)
+        row = {
+            "Contratista": rng.choice(CONTRATISTAS),
+            "OT": str(100000 + i),
+            "UT": f"UT-{rng.randrange(1, 40):02d}",
+            "Descripción OT": f"OT {100000 + i} - {rng.choice(OPERACIONES)}",
+            "Descripción OP": rng.choice(OPERACIONES),
+            "Cuadrilla": f"CUADRILLA {c:03d}",
+            "ID Cuadrilla": f"C{c:03d}",
+        }
+        task_id, unique_key = importer.make_task_ids(
+            row["Contratista"], row["OT"], row["UT"], row["Descripción OP"], row["ID Cuadrilla"]
+        )
+        row["task_id"] = task_id
+        row["unique_key"] = unique_key
+        row["lat"] = CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+        row["lon"] = CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+        out.append(row)
+    return out
+
+
+def _alias(rng: random.Random, canon: str) -> str:
+    alias = rng.choice(importer.REQUIRED_ALIASES[canon])
+    # el import normaliza mayúsculas y espacios: que la planilla los varíe
+    if rng.random() < 0.3:
+        alias = alias.upper()
+    if rng.random() < 0.2:
+        alias = f" {alias}  "
+    return alias
+
+
+def write_workbook(path: str, tasks: List[Dict[str, Any]], seed: int = 0, sheets: int = 3) -> Dict[str, Any]:
+    """
+    Escribe el .xlsx (openpyxl en modo write_only). Las primeras hojas son
+    "ruido" (una de ellas con parte de los encabezados) y la última tiene
+    las tareas con el encabezado en una fila al azar entre 0 y 20.
+    """
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook(write_only=True)
+
+    for k in range(sheets - 1):
+        ws = wb.create_sheet(f"Resumen {k + 1}")
+        ws.append(["Resumen de obra", datetime(2026, 1, 1)])
+        if k == 0:
+            # encabezado incompleto: no tiene que confundir al buscador
+            ws.append(list(importer.REQUIRED_ALIASES)[:4])
+        for j in range(rng.randrange(5, 30)):
+            ws.append([f"nota {j}", rng.random()])
+
+    ws = wb.create_sheet("Tareas")
+    offset = rng.randrange(0, 21)
+    for j in range(offset):
+        ws.append([f"Planilla de tareas - línea {j}"] if j % 3 == 0 else [])
+
+    columns = list(importer.REQUIRED_ALIASES) + rng.sample(EXTRA_HEADERS, 2)
+    rng.shuffle(columns)
+    ws.append([_alias(rng, c) if c in importer.REQUIRED_ALIASES else c for c in columns])
+    for t in tasks:
+        ws.append([t[c] if c in t else rng.choice(["", "-", "ver nota"]) for c in columns])
+
+    wb.save(path)
+    return {"path": path, "rows": len(tasks), "sheets": sheets, "header_row": offset}
+
+
+def make_events(
+    tasks: List[Dict[str, Any]],
+    n: int,
+    seed: int = 0,
+    start: datetime | None = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Payloads de POST /api/event (CreateEvent). Cada tarea sigue el ciclo
+    LLEGADA -> INICIO -> PAUSA -> REANUDADO -> FIN con horas crecientes.
+    """
+    rng = random.Random(seed)
+    t0 = start or datetime(2026, 1, 1, tzinfo=timezone.utc)
+    step = [0] * len(tasks)
+    clock = [t0 + timedelta(minutes=rng.randrange(0, 60 * 24 * 30)) for _ in tasks]
+
+    for _ in range(n):
+        i = rng.randrange(len(tasks))
+        t = tasks[i]
+        event_type = CYCLE[step[i] % len(CYCLE)]
+        step[i] += 1
+        clock[i] += timedelta(minutes=rng.randrange(5, 180))
+
+        lat = t["lat"] + rng.gauss(0, JITTER_DEG)
+        lon = t["lon"] + rng.gauss(0, JITTER_DEG)
+        if rng.random() < OUTLIER_RATE:
+            lat += rng.choice([-1, 1]) * rng.uniform(0.05, 0.3)
+
+        yield {
+            "task_id": t["task_id"],
+            "ot": t["OT"],
+            "cuadrilla": t["Cuadrilla"],
+            "id_cuadrilla": t["ID Cuadrilla"],
+            "event_type": event_type,
+            "event_time": clock[i].isoformat(),
+            "lat": lat,
+            "lon": lon,
+            "accuracy_m": round(rng.uniform(3, 40), 1),
+            "pause_reason": rng.choice(PAUSE_REASONS) if event_type == "PAUSA" else None,
+            "comment": None,
+            "client_event_id": uuid.UUID(int=rng.getrandbits(128)).hex,
+        }
+
+
+def event_row(payload: Dict[str, Any], unique_key: str | None, created_at: str) -> Dict[str, Any]:
+    """Payload -> fila del store (lo que arma main._event_row), para sembrar sin HTTP."""
+    row = {k: v for k, v in payload.items() if k != "client_event_id"}
+    row["event_id"] = payload["client_event_id"]
+    row["unique_key"] = unique_key
+    row["photo_url"] = None
+    row["thumb_url"] = None
+    row["created_at"] = created_at
+    return row
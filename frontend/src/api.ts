@@ -1,15 +1,42 @@
 const API = "/api";
 
-export async function uploadExcels(files: File[]) {
+// error HTTP con su status (el outbox distingue rechazos 4xx de fallas del servidor)
+export class HttpError extends Error {
+  status: number;
+  constructor(status: number, message: string) {
+    super(message);
+    this.status = status;
+  }
+}
+
+// querystring sin los parámetros vacíos
+function qs(params: Record<string, any>) {
+  const q = new URLSearchParams();
+  Object.entries(params).forEach(([k, v]) => {
+    if (v != null && v !== "") q.set(k, String(v));
+  });
+  const s = q.toString();
+  return s ? `?${s}` : "";
+}
+
+// `reactivate`: si un Excel ya estaba importado (mismo contenido) y dado de baja, se reactiva
+export async function uploadExcels(files: File[], reactivate = false) {
   const fd = new FormData();
   files.forEach((f) => fd.append("files", f));
-  const res = await fetch(`${API}/upload_tasks`, { method: "POST", body: fd });
+  const res = await fetch(`${API}/upload_tasks${qs({ reactivate: reactivate || null })}`, { method: "POST", body: fd });
   if (!res.ok) throw new Error(await res.text());
   return res.json();
 }
 
-export async function listTasks(cuadrilla: string) {
-  const res = await fetch(`${API}/tasks?cuadrilla=${encodeURIComponent(cuadrilla)}`);
+export async function getUploadJob(jobId: string) {
+  const res = await fetch(`${API}/upload_jobs/${encodeURIComponent(jobId)}`);
+  if (!res.ok) throw new Error(await res.text());
+  return res.json();
+}
+
+// Listados paginados: `after` es el `next` de la respuesta anterior (null = primera página)
+export async function listTasks(cuadrilla: string, after?: string | null, filters: Record<string, string> = {}) {
+  const res = await fetch(`${API}/tasks${qs({ cuadrilla, after, ...filters })}`);
   if (!res.ok) throw new Error(await res.text());
   return res.json();
 }
@@ -20,25 +47,61 @@ export async function getTask(taskId: string) {
   return res.json();
 }
 
-export async function getTaskEvents(taskId: string) {
-  const res = await fetch(`${API}/task/${encodeURIComponent(taskId)}/events`);
+export async function getTaskEvents(taskId: string, after?: string | null, filters: Record<string, string> = {}) {
+  const res = await fetch(`${API}/task/${encodeURIComponent(taskId)}/events${qs({ after, ...filters })}`);
   if (!res.ok) throw new Error(await res.text());
   return res.json();
 }
 
-export async function getDashboard() {
-  const res = await fetch(`${API}/dashboard`);
+// Tablero: `since` pide solo los cambios desde ese cursor; `etag` evita el cuerpo si no hubo cambios.
+// Devuelve null cuando el servidor responde 304 (nada nuevo).
+export async function getDashboard(since?: number | null, etag?: string | null) {
+  const headers: Record<string, string> = {};
+  if (etag) headers["If-None-Match"] = etag;
+  const res = await fetch(`${API}/dashboard${qs({ since })}`, { headers, cache: "no-store" });
+  if (res.status === 304) return null;
+  if (!res.ok) throw new Error(await res.text());
+  const out = await res.json();
+  return { ...out, etag: res.headers.get("ETag") };
+}
+
+// Página siguiente del estado del tablero (`after` = `next` de la página anterior)
+export async function getDashboardPage(after: string) {
+  const res = await fetch(`${API}/dashboard${qs({ after })}`, { cache: "no-store" });
   if (!res.ok) throw new Error(await res.text());
   return res.json();
 }
 
+// Tablero en vivo (SSE). Al reconectar, el navegador manda Last-Event-ID (= cursor).
+export function openDashboardStream(
+  since: number | null,
+  onMessage: (out: any) => void,
+  onError?: () => void
+) {
+  const es = new EventSource(`${API}/dashboard/stream${qs({ since })}`);
+  es.onmessage = (ev) => onMessage(JSON.parse(ev.data));
+  if (onError) es.onerror = () => onError();
+  return es;
+}
+
 export async function sendEvent(payload: any) {
   const res = await fetch(`${API}/event`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify(payload),
   });
-  if (!res.ok) throw new Error(await res.text());
+  if (!res.ok) throw new HttpError(res.status, await res.text());
+  return res.json();
+}
+
+// Lote de eventos del outbox (sincronización al recuperar señal)
+export async function sendEventsBatch(events: any[]) {
+  const res = await fetch(`${API}/events/batch`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ events }),
+  });
+  if (!res.ok) throw new HttpError(res.status, await res.text());
   return res.json();
 }
 
@@ -1,4 +1,6 @@
+import { useEffect, useState } from "react";
 import { Link, useLocation, useNavigate } from "react-router-dom";
+import { OUTBOX_CHANGED, discardRejected, pendingEvents, rejectedEvents } from "../outbox";
 
 function NavBtn({ to, label }: { to: string; label: string }) {
   const loc = useLocation();
@@ -19,6 +21,63 @@ function NavBtn({ to, label }: { to: string; label: string }) {
   );
 }
 
+// Estado del outbox: pendientes de envío y eventos que el servidor rechazó
+function OutboxStatus() {
+  const [pending, setPending] = useState(pendingEvents().length);
+  const [rejected, setRejected] = useState<any[]>(rejectedEvents());
+  const [open, setOpen] = useState(false);
+
+  useEffect(() => {
+    const sync = () => {
+      setPending(pendingEvents().length);
+      setRejected(rejectedEvents());
+    };
+    window.addEventListener(OUTBOX_CHANGED, sync);
+    window.addEventListener("storage", sync);
+    return () => {
+      window.removeEventListener(OUTBOX_CHANGED, sync);
+      window.removeEventListener("storage", sync);
+    };
+  }, []);
+
+  if (!pending && !rejected.length) return null;
+
+  return (
+    <div className="relative">
+      <button
+        className="px-3 py-2 rounded-xl bg-zinc-900/40 border border-zinc-800 text-xs text-zinc-200 hover:border-brandRed"
+        onClick={() => setOpen(!open)}
+      >
+        {pending ? `📥 ${pending} sin enviar` : ""}
+        {pending && rejected.length ? " • " : ""}
+        {rejected.length ? `⚠️ ${rejected.length} rechazados` : ""}
+      </button>
+
+      {open && rejected.length > 0 && (
+        <div className="absolute right-0 mt-2 w-96 max-h-96 overflow-auto bg-zinc-900 border border-zinc-800 rounded-xl p-3 space-y-2 text-xs">
+          <div className="text-zinc-300">
+            El servidor no aceptó estos eventos (no se reintentan). Cargalos de nuevo si corresponde.
+          </div>
+          {rejected.map((e) => (
+            <div key={e.client_event_id} className="border border-zinc-800 rounded-lg p-2">
+              <div className="font-semibold">
+                {e.event_type} • OT {e.ot} • {new Date(e.event_time).toLocaleString("es-AR")}
+              </div>
+              <div className="text-red-300 break-words">{e.error}</div>
+              <button className="mt-1 text-zinc-400 hover:text-zinc-100" onClick={() => discardRejected(e.client_event_id)}>
+                Descartar
+              </button>
+            </div>
+          ))}
+          <button className="text-zinc-400 hover:text-zinc-100" onClick={() => discardRejected()}>
+            Descartar todos
+          </button>
+        </div>
+      )}
+    </div>
+  );
+}
+
 export default function TopNav() {
   const navigate = useNavigate();
   const cuadrilla = localStorage.getItem("cuadrilla") || "";
@@ -40,8 +99,11 @@ export default function TopNav() {
           <NavBtn to="/dashboard" label="Tablero" />
         </div>
 
-        <div className="text-xs text-zinc-400">
-          {cuadrilla ? `Cuadrilla: ${cuadrilla}` : "Sin cuadrilla"}
+        <div className="flex items-center gap-3">
+          <OutboxStatus />
+          <div className="text-xs text-zinc-400">
+            {cuadrilla ? `Cuadrilla: ${cuadrilla}` : "Sin cuadrilla"}
+          </div>
         </div>
       </div>
     </div>
@@ -0,0 +1,140 @@
+import { HttpError, sendEvent, sendEventsBatch } from "./api";
+
+// Outbox persistente de eventos: si no hay señal, el evento queda guardado
+// en el celular y se manda en lote (un solo POST) cuando vuelve la conexión.
+const KEY = "events_outbox";
+const BATCH_MAX = 500;
+
+// Eventos que el servidor rechazó (4xx): reenviarlos no sirve y trabarían la
+// cola. Quedan aparte para que la cuadrilla los vea (TopNav) y los descarte.
+const REJECTED_KEY = "events_outbox_rejected";
+export const OUTBOX_CHANGED = "outbox-changed";
+
+let flushing: Promise<number> | null = null;
+
+function newId() {
+  if (typeof crypto !== "undefined" && "randomUUID" in crypto) return crypto.randomUUID().replace(/-/g, "");
+  return `${Date.now().toString(16)}${Math.random().toString(16).slice(2)}`;
+}
+
+function load(key: string): any[] {
+  try {
+    return JSON.parse(localStorage.getItem(key) || "[]");
+  } catch {
+    return [];
+  }
+}
+
+function store(key: string, items: any[]) {
+  localStorage.setItem(key, JSON.stringify(items));
+  window.dispatchEvent(new Event(OUTBOX_CHANGED));
+}
+
+export function pendingEvents(): any[] {
+  return load(KEY);
+}
+
+function save(items: any[]) {
+  store(KEY, items);
+}
+
+export function rejectedEvents(): any[] {
+  return load(REJECTED_KEY);
+}
+
+// sin id: descarta todos
+export function discardRejected(clientEventId?: string) {
+  store(REJECTED_KEY, clientEventId ? rejectedEvents().filter((e) => e.client_event_id !== clientEventId) : []);
+}
+
+function remove(ids: Set<string>) {
+  save(pendingEvents().filter((e) => !ids.has(e.client_event_id)));
+}
+
+function reject(ev: any, error: string) {
+  store(REJECTED_KEY, [...rejectedEvents(), { ...ev, error, rejected_at: new Date().toISOString() }]);
+  remove(new Set([ev.client_event_id]));
+}
+
+// sin red (fetch tira TypeError), 5xx, 408 y 429: se reintenta más tarde.
+// Cualquier otro 4xx es un rechazo: el mismo evento va a fallar siempre
+function retryable(e: any) {
+  if (!(e instanceof HttpError)) return true;
+  return e.status >= 500 || e.status === 408 || e.status === 429;
+}
+
+function enqueue(ev: any) {
+  save([...pendingEvents(), ev]);
+}
+
+// ✅ manda un evento; sin señal lo deja en el outbox (la hora es la del celular)
+export async function sendEventOrQueue(payload: any): Promise<{ ok: boolean; queued: boolean }> {
+  const ev = { client_event_id: newId(), event_time: new Date().toISOString(), ...payload };
+
+  // si ya hay pendientes, va a la cola para respetar el orden y sale todo junto
+  if (!navigator.onLine || pendingEvents().length > 0) {
+    enqueue(ev);
+    await flushOutbox().catch(() => 0);
+    const rejected = rejectedEvents().find((p) => p.client_event_id === ev.client_event_id);
+    if (rejected) throw new Error(rejected.error);
+    return { ok: true, queued: pendingEvents().some((p) => p.client_event_id === ev.client_event_id) };
+  }
+
+  try {
+    await sendEvent(ev);
+    return { ok: true, queued: false };
+  } catch (e: any) {
+    // sin red o servidor caído: al outbox. Los rechazos (4xx) se informan en el momento
+    if (e instanceof TypeError || (e instanceof HttpError && retryable(e))) {
+      enqueue(ev);
+      return { ok: true, queued: true };
+    }
+    throw e;
+  }
+}
+
+export function flushOutbox(): Promise<number> {
+  if (flushing) return flushing;
+  flushing = (async () => {
+    let sent = 0;
+    try {
+      while (true) {
+        const batch = pendingEvents().slice(0, BATCH_MAX);
+        if (batch.length === 0) break;
+        try {
+          await sendEventsBatch(batch);
+          // los reenvíos son idempotentes (client_event_id): se puede borrar lo enviado
+          remove(new Set(batch.map((e) => e.client_event_id)));
+          sent += batch.length;
+        } catch (e: any) {
+          if (retryable(e)) throw e;
+          // el lote se valida entero: uno malo lo rechaza todo. Uno por uno se
+          // separa el que falla y el resto sigue (un error de red corta acá)
+          for (const ev of batch) {
+            try {
+              await sendEvent(ev);
+              remove(new Set([ev.client_event_id]));
+              sent += 1;
+            } catch (e1: any) {
+              if (retryable(e1)) throw e1;
+              reject(ev, e1.message);
+            }
+          }
+        }
+      }
+    } finally {
+      flushing = null;
+    }
+    return sent;
+  })();
+  return flushing;
+}
+
+export function startOutboxSync() {
+  const flush = () => {
+    flushOutbox().catch(() => 0);
+  };
+  window.addEventListener("online", flush);
+  setInterval(flush, 60000);
+  flush();
+}
@@ -1,5 +1,5 @@
-import { useEffect, useState } from "react";
-import { getDashboard, getTaskEvents } from "../api";
+import { useEffect, useRef, useState } from "react";
+import { getDashboard, getDashboardPage, getTaskEvents, openDashboardStream } from "../api";
 
 function badge(type: string) {
   const base = "px-3 py-1 rounded-full text-xs font-semibold";
@@ -49,6 +49,21 @@ function diffLabel(prevIso?: string, currIso?: string) {
   return `+${h}h ${String(m).padStart(2, "0")}m`;
 }
 
+// aplica un delta del tablero: primero las bajas, después altas/actualizaciones por unique_key
+function mergeRows(prev: any[], changed: any[], removed: string[]) {
+  if (changed.length === 0 && removed.length === 0) return prev;
+  const byKey = new Map<string, any>();
+  for (const r of prev) byKey.set(r.unique_key, r);
+  for (const k of removed) byKey.delete(k);
+  for (const r of changed) byKey.set(r.unique_key, r);
+  // el Map deja las filas actualizadas en su lugar viejo: vuelvo al orden del tablero (más reciente primero)
+  return Array.from(byKey.values()).sort(
+    (a, b) =>
+      String(b?.event_time || "").localeCompare(String(a?.event_time || "")) ||
+      String(b?.event_id || "").localeCompare(String(a?.event_id || ""))
+  );
+}
+
 export default function Dashboard() {
   const [rows, setRows] = useState<any[]>([]);
   const [err, setErr] = useState("");
@@ -58,12 +73,56 @@ export default function Dashboard() {
   const [eventsByTask, setEventsByTask] = useState<Record<string, any[]>>({});
   const [loadingTaskId, setLoadingTaskId] = useState<string | null>(null);
 
+  // ✅ cursor del tablero (stream en vivo; polling + ETag si no hay EventSource)
+  const cursorRef = useRef<number | null>(null);
+  const etagRef = useRef<string | null>(null);
+  const [live, setLive] = useState(false);
+
+  // ✅ el estado llega paginado (lo más reciente primero): "Cargar más" pide la página siguiente
+  const [next, setNext] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
   useEffect(() => {
+    const apply = (out: any) => {
+      cursorRef.current = out.cursor ?? null;
+      if (out.full) {
+        setRows(out.rows || []);
+        setNext(out.next ?? null);
+        setEventsByTask({});
+      } else {
+        setRows((prev) => mergeRows(prev, out.rows || [], out.removed || []));
+        // el historial cacheado de esas tareas quedó viejo
+        const stale = (out.rows || []).map((r: any) => String(r.task_id || ""));
+        if (stale.length) {
+          setEventsByTask((prev) => {
+            const next = { ...prev };
+            stale.forEach((t: string) => delete next[t]);
+            return next;
+          });
+        }
+      }
+      setErr("");
+    };
+
+    if (typeof EventSource !== "undefined") {
+      const es = openDashboardStream(
+        cursorRef.current,
+        (out) => {
+          setLive(true);
+          apply(out);
+        },
+        () => setLive(false)
+      );
+      return () => es.close();
+    }
+
     const tick = async () => {
       try {
-        const out = await getDashboard();
-        setRows(out.rows || []);
-        setErr("");
+        const out = await getDashboard(cursorRef.current, etagRef.current);
+        if (out) {
+          etagRef.current = out.etag ?? null;
+          apply(out);
+        }
       } catch (e: any) {
         setErr(e.message);
       }
@@ -73,6 +132,20 @@ export default function Dashboard() {
     return () => clearInterval(id);
   }, []);
 
+  async function loadMore() {
+    if (!next) return;
+    setLoadingMore(true);
+    try {
+      const out = await getDashboardPage(next);
+      setRows((prev) => mergeRows(prev, out.rows || [], []));
+      setNext(out.next ?? null);
+    } catch (e: any) {
+      setErr(e.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  }
+
   async function toggleRow(taskId: string) {
     if (!taskId) return;
 
@@ -111,7 +184,7 @@ export default function Dashboard() {
             <h2 className="text-2xl font-semibold">Tablero Operativo</h2>
             <p className="text-zinc-300">Último estado por tarea (fila importada).</p>
           </div>
-          <div className="text-xs text-zinc-400">Actualiza cada 15s</div>
+          <div className="text-xs text-zinc-400">{live ? "● En vivo" : "Reconectando…"}</div>
         </div>
 
         {err && (
@@ -172,7 +245,16 @@ export default function Dashboard() {
                       </td>
 
                       <td className="p-3" onClick={(e) => e.stopPropagation()}>
-                        {r.photo_url ? (
+                        {r.thumb_url ? (
+                          <a href={r.photo_url || r.thumb_url} target="_blank" rel="noreferrer">
+                            <img
+                              src={r.thumb_url}
+                              alt="foto"
+                              loading="lazy"
+                              className="h-10 w-10 object-cover rounded-lg border border-zinc-800"
+                            />
+                          </a>
+                        ) : r.photo_url ? (
                           <a className="text-brandRed underline" href={r.photo_url} target="_blank" rel="noreferrer">
                             ver
                           </a>
@@ -236,7 +318,16 @@ export default function Dashboard() {
                                         <span>- sin ubicación -</span>
                                       )}
 
-                                      {e.photo_url ? (
+                                      {e.thumb_url ? (
+                                        <a href={e.photo_url || e.thumb_url} target="_blank" rel="noreferrer">
+                                          <img
+                                            src={e.thumb_url}
+                                            alt="foto"
+                                            loading="lazy"
+                                            className="h-16 w-16 object-cover rounded-lg border border-zinc-800"
+                                          />
+                                        </a>
+                                      ) : e.photo_url ? (
                                         <a className="text-brandRed underline" href={e.photo_url} target="_blank" rel="noreferrer">
                                           ver foto
                                         </a>
@@ -271,6 +362,18 @@ export default function Dashboard() {
           </table>
         </div>
 
+        {next && (
+          <div className="mt-3 flex justify-center">
+            <button
+              className="px-4 py-2 rounded-xl border border-zinc-800 text-sm text-zinc-300 hover:border-brandRed transition disabled:opacity-50"
+              onClick={loadMore}
+              disabled={loadingMore}
+            >
+              {loadingMore ? "Cargando…" : "Cargar más"}
+            </button>
+          </div>
+        )}
+
         <div className="mt-3 text-xs text-zinc-500">
           Tip: click en una fila para desplegar el historial y ver la duración entre estados.
         </div>
@@ -1,6 +1,7 @@
 import { useEffect, useState } from "react";
 import { useParams } from "react-router-dom";
-import { getTask, getTaskEvents, sendEvent, sendEventWithPhoto } from "../api";
+import { getTask, getTaskEvents, sendEventWithPhoto } from "../api";
+import { sendEventOrQueue } from "../outbox";
 import { getGeo } from "../util";
 
 type LastGeo = { lat: number; lon: number; acc?: number | null; time: string; type: string };
@@ -26,6 +27,7 @@ export default function TaskDetail() {
   const cuadrilla = localStorage.getItem("cuadrilla") || "";
   const [task, setTask] = useState<any>(null);
   const [events, setEvents] = useState<any[]>([]);
+  const [eventsNext, setEventsNext] = useState<string | null>(null);
   const [msg, setMsg] = useState<string>("");
   const [pauseReason, setPauseReason] = useState<string>("Espera repuesto");
   const [comment, setComment] = useState<string>("");
@@ -37,8 +39,21 @@ export default function TaskDetail() {
     try {
       const ev = await getTaskEvents(id);
       setEvents(ev.events || []);
+      setEventsNext(ev.next || null);
     } catch {
       setEvents([]);
+      setEventsNext(null);
+    }
+  }
+
+  async function loadMoreEvents() {
+    if (!eventsNext) return;
+    try {
+      const ev = await getTaskEvents(String(taskId), eventsNext);
+      setEvents((prev) => [...prev, ...(ev.events || [])]);
+      setEventsNext(ev.next || null);
+    } catch (e: any) {
+      setMsg(`❌ ${e.message}`);
     }
   }
 
@@ -79,9 +94,9 @@ export default function TaskDetail() {
         fd.append("photo", photo);
 
         await sendEventWithPhoto(fd);
-        setMsg(`✅ ${type} registrado (con foto)`);
+        setMsg(`✅ ${type} registrado (la foto se sube en segundo plano)`);
       } else {
-        await sendEvent({
+        const out = await sendEventOrQueue({
           task_id: task.task_id,
           ot: task.ot,
           cuadrilla,
@@ -93,7 +108,7 @@ export default function TaskDetail() {
           pause_reason: type === "PAUSA" ? pauseReason : null,
           comment: comment.trim() || null,
         });
-        setMsg(`✅ ${type} registrado`);
+        setMsg(out.queued ? `📥 Sin señal: ${type} guardado, se envía al volver la conexión` : `✅ ${type} registrado`);
       }
 
       // ✅ refrescar historial
@@ -245,6 +260,12 @@ export default function TaskDetail() {
           ) : (
             <div className="mt-2 text-sm text-zinc-400">Todavía no hay eventos registrados.</div>
           )}
+
+          {eventsNext && (
+            <button className="mt-3 text-sm text-brandRed underline" onClick={loadMoreEvents}>
+              Cargar más
+            </button>
+          )}
         </div>
 
         {msg && <div className="mt-5 p-3 rounded-2xl bg-zinc-950 border border-zinc-800">{msg}</div>}
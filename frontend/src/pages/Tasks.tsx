@@ -6,6 +6,8 @@ export default function Tasks() {
   const nav = useNavigate();
   const [rows, setRows] = useState<any[]>([]);
   const [err, setErr] = useState<string>("");
+  const [next, setNext] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const cuadrilla = (localStorage.getItem("cuadrilla") || "").trim();
 
@@ -21,13 +23,29 @@ export default function Tasks() {
         setErr("");
         const out = await listTasks(cuadrilla);
         setRows(out.tasks || []);
+        setNext(out.next || null);
       } catch (e: any) {
         setErr(e.message);
         setRows([]);
+        setNext(null);
       }
     })();
   }, [cuadrilla, nav]);
 
+  async function loadMore() {
+    if (!next) return;
+    setLoadingMore(true);
+    try {
+      const out = await listTasks(cuadrilla, next);
+      setRows((prev) => [...prev, ...(out.tasks || [])]);
+      setNext(out.next || null);
+    } catch (e: any) {
+      setErr(e.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  }
+
   return (
     <div className="min-h-screen bg-zinc-950 text-zinc-100 p-4">
       <div className="max-w-3xl mx-auto">
@@ -64,6 +82,16 @@ export default function Tasks() {
                 No hay tareas para esta cuadrilla (o no se importó Excel).
               </div>
             )}
+
+            {next && (
+              <button
+                className="p-3 rounded-2xl border border-zinc-800 text-zinc-300 hover:border-brandRed transition disabled:opacity-50"
+                onClick={loadMore}
+                disabled={loadingMore}
+              >
+                {loadingMore ? "Cargando…" : "Cargar más"}
+              </button>
+            )}
           </div>
         </div>
       </div>
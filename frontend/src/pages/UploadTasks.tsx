@@ -1,5 +1,10 @@
 import { useEffect, useState } from "react";
-import { uploadExcels, listUploads, disableUpload, enableUpload, deleteUpload } from "../api";
+import { uploadExcels, getUploadJob, listUploads, disableUpload, enableUpload, deleteUpload } from "../api";
+
+const sleep = (ms: number) => new Promise((r) => setTimeout(r, ms));
+
+// si el job no avanza en este tiempo dejamos de consultar (el server pudo reiniciarse)
+const POLL_STALL_MS = 5 * 60 * 1000;
 
 export default function UploadTasks() {
   const [files, setFiles] = useState<File[]>([]);
@@ -8,6 +13,8 @@ export default function UploadTasks() {
 
   const [uploads, setUploads] = useState<any[]>([]);
   const [loading, setLoading] = useState(false);
+  const [importing, setImporting] = useState(false);
+  const [reactivate, setReactivate] = useState(true);
 
   async function refresh() {
     setLoading(true);
@@ -29,13 +36,47 @@ export default function UploadTasks() {
   async function onUpload() {
     setMsg("");
     setErr("");
+    setImporting(true);
     try {
-      const out = await uploadExcels(files);
-      setMsg(`✅ Importación OK. Filas procesadas: ${out.imported}`);
+      const { job_id, duplicates } = await uploadExcels(files, reactivate);
       setFiles([]);
+
+      // ✅ mismo contenido que un Excel ya importado: no se vuelve a procesar
+      const dupMsg = (duplicates || []).length
+        ? ` • ya importados: ${duplicates
+            .map((d: any) => `${d.filename}${d.reactivated ? " (reactivado)" : ""}`)
+            .join(", ")}`
+        : "";
+
+      // ✅ la importación corre en background: consultamos el progreso
+      let job: any = null;
+      let progress = "";
+      let deadline = Date.now() + POLL_STALL_MS;
+      while (true) {
+        job = await getUploadJob(job_id);
+        setMsg(`⏳ Importando… archivos ${job.files_done}/${job.files_total} • filas ${job.rows_imported}`);
+        if (job.status !== "PENDIENTE" && job.status !== "PROCESANDO") break;
+
+        const now = `${job.files_done}/${job.rows_imported}`;
+        if (now !== progress) {
+          progress = now;
+          deadline = Date.now() + POLL_STALL_MS;
+        } else if (Date.now() > deadline) {
+          setMsg(`⚠️ La importación no avanza hace ${POLL_STALL_MS / 60000} minutos. Revisá el listado más tarde.${dupMsg}`);
+          await refresh();
+          return;
+        }
+        await sleep(1000);
+      }
+
+      if (job.status === "OK") setMsg(`✅ Importación OK. Filas procesadas: ${job.rows_imported}${dupMsg}`);
+      else setMsg(`⚠️ Importación terminada con errores. Filas procesadas: ${job.rows_imported}${dupMsg}`);
+      if (job.errors?.length) setErr(job.errors.join("\n"));
       await refresh();
     } catch (e: any) {
       setErr(e.message);
+    } finally {
+      setImporting(false);
     }
   }
 
@@ -89,12 +130,17 @@ export default function UploadTasks() {
             onChange={(e) => setFiles(Array.from(e.target.files || []))}
           />
 
+          <label className="mt-4 flex items-center gap-2 text-sm text-zinc-300">
+            <input type="checkbox" checked={reactivate} onChange={(e) => setReactivate(e.target.checked)} />
+            Si un Excel ya estaba importado y dado de baja, reactivarlo
+          </label>
+
           <button
             className="mt-5 w-full py-4 rounded-xl bg-brandRed hover:opacity-90 font-semibold text-lg disabled:opacity-40"
-            disabled={files.length === 0}
+            disabled={files.length === 0 || importing}
             onClick={onUpload}
           >
-            Importar
+            {importing ? "Importando..." : "Importar"}
           </button>
 
           {msg && <div className="mt-4 p-3 rounded-xl bg-zinc-950 border border-zinc-800">{msg}</div>}